@@ -10,27 +10,35 @@ import argparse
 import wave
 import os
 import logging
-import webrtcvad
+import threading
 
-import collections
-import pyaudio
-
-import numpy as np
-
-from deepspeech import Model
 from timeit import default_timer as timer
 
 
 sys.path.append(os.path.abspath("."))
 import speech2text
+import backends
 
 from audio_defaults import *
-
-# max number of chunks(frames) written to data queue
+from pipeline import BoundedQueue, TranscriptionPipeline, POLICIES, DROP_OLDEST, SEGMENT_QUEUE_MAX_SIZE
+from pipeline import OFFSET_TO_TRANSCRIPT, CAPTURE_TO_TRANSCRIPT
+from frame_sources import vad_buffer_frames
+from stt_server import SttClient
+from vad_trace import VadTrace
+import metrics
+from metrics import VAD_CALLS
+
+# max number of chunks(frames) written to data queue, about 5 seconds.
 # 0 for unlimited
-DATA_QUEUE_MAX_SIZE = 0
+DATA_QUEUE_MAX_SIZE = int(5 * RATE / CHUNK)
+
+# what the callback does when the data queue is full.
+# block would stall the PortAudio thread, so frames are dropped instead.
+DATA_QUEUE_POLICY = DROP_OLDEST
 
-DEBUG = True
+# capture, VAD and end to end metrics, see metrics.REGISTRY
+CAPTURE_LATENCY = metrics.REGISTRY.histogram(
+    'audio_callback_to_dequeue_seconds', 'Time frames wait in AudioStream.data_q')
 
 logging.basicConfig(level=logging.INFO)
 
@@ -41,19 +49,33 @@ class AudioStream(object):
         Do not use bocking operations in callback. including stream read/write
         
     """
-    def __init__(self, rate=RATE, chunk=CHUNK, callback=None):
+    def __init__(self, rate=RATE, chunk=CHUNK, callback=None,
+                 queue_size=DATA_QUEUE_MAX_SIZE, queue_policy=DATA_QUEUE_POLICY):
         self._rate = rate
         self._chunk = chunk
-        
-        # data_queue that will be used in callback to collect audio chunks
-        self.data_q = queue.Queue(DATA_QUEUE_MAX_SIZE)
+        self._init_queue(queue_size, queue_policy)
 
-        # instantiating a input/output stream to audio device
+        # instantiating a input/output stream to audio device.
+        # pyaudio is imported here so the VAD classes work without it
+        import pyaudio
         self._paudio = pyaudio.PyAudio()
+        self._continue = pyaudio.paContinue
         self.closed = True
+        self.last_capture_time = None
         if(callback is None):
             self._callback = self.queuing_callback
 
+    def _init_queue(self, queue_size, queue_policy):
+        # data_queue that will be used in callback to collect audio chunks
+        # data_q.num_queued and data_q.num_dropped count the frames
+        self.data_q = BoundedQueue(queue_size, queue_policy)
+        metrics.REGISTRY.gauge('audio_queue_depth', 'Frames waiting in AudioStream.data_q',
+                               fn=self.data_q.qsize)
+        metrics.REGISTRY.gauge('audio_frames_queued', 'Frames put into AudioStream.data_q',
+                               fn=lambda: self.data_q.num_queued)
+        metrics.REGISTRY.gauge('audio_frames_dropped', 'Frames dropped by a full AudioStream.data_q',
+                               fn=lambda: self.data_q.num_dropped)
+
     def get_rate(self):
         return self._rate
     
@@ -100,13 +122,17 @@ class AudioStream(object):
         """ 
 #         logging.debug("frame_count:{} time_info:{}, status_flags:{}".
 #                     format(frame_count, time_info, status_flags))
-        self.data_q.put(in_data)
-        return None, pyaudio.paContinue
+        self.data_q.put((timer(), in_data))
+        return None, self._continue
     
     def get_frame(self):
         if not self.closed:
             try:
-                frames = self.data_q.get(timeout=0.3)
+                queued_time, frames = self.data_q.get(timeout=0.3)
+                waited = timer() - queued_time
+                CAPTURE_LATENCY.observe(waited)
+                # wall-clock time the frame was captured, see SpeechSegment
+                self.last_capture_time = time.time() - waited
                 return frames
             except queue.Empty:
                 pass
@@ -114,34 +140,65 @@ class AudioStream(object):
 
 class VadBuffer (object):
     """ 
-    This is special deque implementation with counter for audio frame properties 
-    to calculate voice frames with high performance. 
-    This is NOT a thread safe deque implementation
+    Fixed capacity ring buffer of audio frames with a parallel speech mask 
+    and a counter of voice frames, to calculate voice frame ratios with 
+    high performance. 
+    Frames are copied into slots of one preallocated bytearray so appending 
+    does not allocate. The slot size is frame_bytes, or the size of the first 
+    frame appended; a longer frame grows all slots.
+    This is NOT a thread safe implementation
     """
+    __slots__ = ('maxlen', '_frame_bytes', '_data', '_lengths', '_mask', '_first',
+                 '__num_voice', '__size')
     
-    def __init__(self, maxlen):
-        self.buff = collections.deque(maxlen = maxlen)
+    def __init__(self, maxlen, frame_bytes=0):
+        self.maxlen = maxlen
+        self._frame_bytes = frame_bytes
+        self._data = memoryview(bytearray(maxlen * frame_bytes))
+        self._lengths = [0] * maxlen
+        self._mask = bytearray(maxlen)
+        # slot of the oldest frame
+        self._first = 0
         self.__num_voice = 0
         self.__size = 0
 
+    def _resize(self, frame_bytes):
+        data = memoryview(bytearray(self.maxlen * frame_bytes))
+        for slot, length in enumerate(self._lengths):
+            old = slot * self._frame_bytes
+            new = slot * frame_bytes
+            data[new:new + length] = self._data[old:old + length]
+        self._data = data
+        self._frame_bytes = frame_bytes
+
     def append(self, frame, is_speech):
-        if self.__size == self.buff.maxlen:
-            # most left frame in queue is speech.
-            f, s = self.buff.popleft()
-            self.__size -= 1
-            
-            if(s == True):
-                self.__num_voice -= 1
-        
-        self.buff.append((frame, is_speech))
-        
-        self.__num_voice += 1 if is_speech else 0
-        self.__size += 1
+        length = len(frame)
+        if length > self._frame_bytes:
+            self._resize(length)
+
+        size = self.__size
+        if size == self.maxlen:
+            # the oldest frame is overwritten
+            slot = self._first
+            self._first = slot + 1 if slot + 1 < size else 0
+            self.__num_voice -= self._mask[slot]
+        else:
+            slot = self._first + size
+            if slot >= self.maxlen:
+                slot -= self.maxlen
+            self.__size = size + 1
+
+        offset = slot * self._frame_bytes
+        self._data[offset:offset + length] = frame
+        self._lengths[slot] = length
+        is_speech = 1 if is_speech else 0
+        self._mask[slot] = is_speech
+        self.__num_voice += is_speech
 
     def clear(self):
         self.__num_voice = 0
         self.__size  = 0
-        self.buff.clear()
+        self._first = 0
         
     @property
     def num_voice(self):
@@ -157,21 +214,271 @@ class VadBuffer (object):
     
     @property
     def voice_frame_ratio(self):
-        return self.num_voice/self.buff.maxlen
+        return self.num_voice/self.maxlen
     
     @property
     def non_voice_frame_ratio(self):
-        return self.num_non_voice/self.buff.maxlen
+        return self.num_non_voice/self.maxlen
+
+    def _slots(self):
+        return [(self._first + i) % self.maxlen for i in range(self.__size)]
     
     def get_data_list(self):
-        return [f[0] for f in self.buff]
+        """
+        returns copies of the buffered frames, oldest first.
+        """
+        return [self._data[slot * self._frame_bytes:
+                           slot * self._frame_bytes + self._lengths[slot]].tobytes()
+                for slot in self._slots()]
+
+    def window(self):
+        """
+        returns the buffered frames, oldest first, as memoryviews into the 
+        ring without copying: one or two contiguous runs when every frame 
+        fills its slot (always the case for audio), one view per frame 
+        otherwise. The views are only valid until the next append or clear.
+        """
+        if self.__size == 0:
+            return []
+
+        if any(self._lengths[slot] != self._frame_bytes for slot in self._slots()):
+            return [self._data[slot * self._frame_bytes:
+                               slot * self._frame_bytes + self._lengths[slot]]
+                    for slot in self._slots()]
+
+        end = self._first + self.__size
+        if end <= self.maxlen:
+            return [self._data[self._first * self._frame_bytes:end * self._frame_bytes]]
+        return [self._data[self._first * self._frame_bytes:],
+                self._data[:(end - self.maxlen) * self._frame_bytes]]
+
+    def get_speech_mask(self):
+        """
+        returns the speech flags of the buffered frames, oldest first.
+        """
+        return bytes(self._mask[slot] for slot in self._slots())
  
     
+class UtteranceBuffer(object):
+    """
+    Growable byte buffer that the frames of one utterance are written into.
+    The capacity doubles when it is full, so appending is amortized O(1)
+    without a list of frames to join at the end. view() and as_array()
+    return the audio as a memoryview or an int16 NumPy array without copying.
+    """
+    __slots__ = ('_data', '_size')
+
+    def __init__(self, capacity=RATE * SAMPLE_WIDTH * CHANNELS):
+        self._data = bytearray(max(capacity, 1))
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, frame):
+        length = len(frame)
+        if self._size + length > len(self._data):
+            data = bytearray(max(2 * len(self._data), self._size + length))
+            data[:self._size] = memoryview(self._data)[:self._size]
+            self._data = data
+
+        self._data[self._size:self._size + length] = frame
+        self._size += length
+
+    def view(self):
+        return memoryview(self._data)[:self._size]
+
+    def as_array(self):
+        import numpy as np
+        return np.frombuffer(self._data, np.int16, count=self._size // SAMPLE_WIDTH)
+
+
+class SpeechSegment(object):
+    """
+    One speech segment of a stream and where it was found:
+        pcm          - 16 bit PCM of the segment, a memoryview of its own
+                       buffer (no copy)
+        offset       - stream position of the first sample, in samples
+        num_frames   - vad frames in the segment
+        voice_ratio  - fraction of the frames the vad found speech
+        capture_time - wall-clock time (time.time()) the last frame was
+                       captured, or read for offline sources
+        rate         - sample rate
+    bytes(segment) copies the audio, as_array() is an int16 NumPy view.
+    """
+    __slots__ = ('pcm', 'offset', 'num_frames', 'voice_ratio', 'capture_time', 'rate')
+
+    def __init__(self, pcm, offset, num_frames, voice_ratio, capture_time, rate=RATE):
+        self.pcm = pcm
+        self.offset = offset
+        self.num_frames = num_frames
+        self.voice_ratio = voice_ratio
+        self.capture_time = capture_time
+        self.rate = rate
+
+    def __len__(self):
+        return len(self.pcm)
+
+    def __bytes__(self):
+        return bytes(self.pcm)
+
+    def __repr__(self):
+        return ("SpeechSegment(start_s={:.3f}, duration={:.3f}, num_frames={}, voice_ratio={:.2f})".
+                format(self.start_s, self.duration, self.num_frames, self.voice_ratio))
+
+    @property
+    def num_samples(self):
+        return len(self.pcm) // SAMPLE_WIDTH
+
+    @property
+    def duration(self):
+        return self.num_samples / self.rate
+
+    @property
+    def start_s(self):
+        return self.offset / self.rate
+
+    @property
+    def end_s(self):
+        return (self.offset + self.num_samples) / self.rate
+
+    def as_array(self):
+        import numpy as np
+        return np.frombuffer(self.pcm, np.int16)
+
+
+# events returned by VadSegmenter.process
+NO_SPEECH = 0
+SPEECH_ONSET = 1
+SPEECH = 2
+SPEECH_OFFSET = 3
+SEGMENT_FULL = 4
+
+
+class VadSegmenter(object):
+    """
+    Push based speech onset/offset detection.
+    process() takes one frame with its vad decision and returns an event:
+        NO_SPEECH     - the frame is buffered while waiting for speech onset
+        SPEECH_ONSET  - vad_buffer_ratio of the buffer is speech, the buffered
+                        frames start the segment. onset_frames holds a copy
+                        of them as one or two runs of joined frames
+        SPEECH        - the frame belongs to the ongoing segment
+        SPEECH_OFFSET - vad_buffer_ratio of the buffer is non speech, the frame
+                        was the last one of the segment
+        SEGMENT_FULL  - the segment reached max_segment_frames with this frame
+                        and is cut, speech goes on in a new segment
+    With collect_frames the segment frames are written into an
+    UtteranceBuffer until pop_segment() hands it out. The UtteranceBuffer is
+    only allocated during speech.
+    trace is a vad_trace.VadTrace recording the decisions behind every cut,
+    None disables tracing. It can be set or unset between two frames.
+    num_voice_frames counts the speech frames of the segment, read it
+    before pop_segment() or flush().
+    """
+    __slots__ = ('vad_buffer', 'vad_buffer_ratio', 'collect_frames', 'max_segment_frames',
+                 'speech_onset', 'onset_frames', 'utterance', 'num_segment_frames',
+                 'num_voice_frames', 'trace')
+
+    def __init__(self, vad_num_frames, vad_buffer_ratio=VAD_BUFFER_RATIO,
+                 collect_frames=True, max_segment_frames=None, frame_bytes=0, trace=None):
+        self.vad_buffer = VadBuffer(maxlen=vad_num_frames, frame_bytes=frame_bytes)
+        self.vad_buffer_ratio = vad_buffer_ratio
+        self.collect_frames = collect_frames
+        self.max_segment_frames = max_segment_frames
+
+        self.speech_onset = False
+        self.onset_frames = []
+        self.utterance = None
+        self.num_segment_frames = 0
+        self.num_voice_frames = 0
+        self.trace = trace
+
+    def process(self, frame, is_speech):
+        trace = self.trace
+        if trace is not None:
+            trace.record(is_speech)
+
+        if not self.speech_onset:
+            self.vad_buffer.append(frame, is_speech)
+
+            if(self.vad_buffer.voice_frame_ratio > self.vad_buffer_ratio):
+                self.speech_onset = True
+                self.num_segment_frames = self.vad_buffer.size
+                self.num_voice_frames = self.vad_buffer.num_voice
+                # the ring is reused after the clear below, keep a copy
+                if self.collect_frames:
+                    if self.utterance is None:
+                        self.utterance = UtteranceBuffer()
+                    begin = len(self.utterance)
+                    for run in self.vad_buffer.window():
+                        self.utterance.append(run)
+                    self.onset_frames = [self.utterance.view()[begin:]]
+                else:
+                    self.onset_frames = [run.tobytes() for run in self.vad_buffer.window()]
+                self.vad_buffer.clear()
+                if trace is not None:
+                    trace.mark_onset()
+                return SPEECH_ONSET
+            return NO_SPEECH
+
+        if self.collect_frames:
+            if self.utterance is None:
+                self.utterance = UtteranceBuffer()
+            self.utterance.append(frame)
+        self.num_segment_frames += 1
+        if is_speech:
+            self.num_voice_frames += 1
+
+        self.vad_buffer.append(frame, is_speech)
+        if self.vad_buffer.non_voice_frame_ratio > self.vad_buffer_ratio:
+            self.speech_onset = False
+            self.onset_frames = []
+            self.vad_buffer.clear()
+            if trace is not None:
+                trace.cut('offset')
+            return SPEECH_OFFSET
+
+        if self.max_segment_frames and self.num_segment_frames >= self.max_segment_frames:
+            # force flush, the vad buffer is kept to find the real offset
+            self.num_segment_frames = 0
+            if trace is not None:
+                trace.cut('full')
+            return SEGMENT_FULL
+        return SPEECH
+
+    def pop_segment(self):
+        """
+        returns the collected segment as a memoryview of its own buffer.
+        """
+        segment = self.utterance.view()
+        self.utterance = None
+        self.num_voice_frames = 0
+        return segment
+
+    def flush(self):
+        """
+        end of stream: resets the state and returns the unfinished segment,
+        None when there is none.
+        """
+        if self.trace is not None:
+            self.trace.cut('flush')
+        self.speech_onset = False
+        self.onset_frames = []
+        self.vad_buffer.clear()
+
+        if self.utterance is not None and len(self.utterance):
+            return self.pop_segment()
+        self.num_voice_frames = 0
+
+
 class VadFilter(object):
 
-    def __init__(self, audio_stream, mode, vad = None):
+    def __init__(self, audio_stream, mode, vad = None, trace = None):
         """
-        Live Audio Stream with buffering and vad filter
+        Audio stream with buffering and vad filter.
+        audio_stream is an AudioStream or any frame source from frame_sources
+        trace is a vad_trace.VadTrace given to the segmenters, see set_trace
         """
         if(mode not in [0,1,2,3]):
             raise(ValueError("invalid mode:{}, should be [0,1,2,3]".format(mode)))
@@ -179,19 +486,88 @@ class VadFilter(object):
         if(vad != None):
             self.vad  = vad 
         else: 
+            import webrtcvad
             self.vad = webrtcvad.Vad(mode)
         
         self.audio_stream = audio_stream
+        self.trace = trace
+        self.segmenter = None
+        # frames read from audio_stream, the position in the stream
+        self.num_frames = 0
 
+    def set_trace(self, trace):
+        """
+        switches tracing of the running collector on, or off with None.
+        """
+        self.trace = trace
+        if self.segmenter is not None:
+            self.segmenter.trace = trace
 
     def audio_frame_generator(self):
         while self.audio_stream.is_active():
             frame = self.audio_stream.get_frame()
             if(frame == None):
                 continue
+            self.num_frames += 1
             yield frame
+
+    def create_segmenter(self, vad_buffer_ms, collect_frames=True, max_segment_ms=None):
+        """
+        returns a VadSegmenter whose buffer spans vad_buffer_ms of audio and
+        that cuts segments longer than max_segment_ms, when given.
+        """
+        rate = self.audio_stream.get_rate()
+        chunk = self.audio_stream.get_chunk()
+        
+        # number of frames in the VadBuffer
+        vad_num_frames = vad_buffer_frames(vad_buffer_ms, rate, chunk)
+
+        logging.info("frame_ms :{} ms".format((1/rate ) * chunk * 1000))
+        logging.info("vad buffer len:{}".format(vad_num_frames))
+
+        max_segment_frames = None
+        if max_segment_ms:
+            max_segment_frames = vad_buffer_frames(max_segment_ms, rate, chunk)
+
+        self.segmenter = VadSegmenter(vad_num_frames, VAD_BUFFER_RATIO, collect_frames,
+                                      max_segment_frames, trace=self.trace)
+        return self.segmenter
             
-    def voice_segment_collector(self, vad_buffer_ms):
+    def speech_segment_collector(self, vad_buffer_ms, max_segment_ms=None):
+        """
+        The segmentation of voice_segment_collector, yielding a SpeechSegment
+        record per segment: its PCM as a memoryview plus its sample offset
+        in the stream, frame count, voice ratio and capture time.
+        """
+        rate = self.audio_stream.get_rate()
+        segmenter = self.create_segmenter(vad_buffer_ms, max_segment_ms=max_segment_ms)
+
+        for frame in self.audio_frame_generator():
+            is_speech = self.vad.is_speech(frame, rate)
+            VAD_CALLS.inc()
+
+            event = segmenter.process(frame, is_speech)
+            if event == SPEECH_OFFSET or event == SEGMENT_FULL:
+                num_voice_frames = segmenter.num_voice_frames
+                yield self._speech_segment(segmenter.pop_segment(), num_voice_frames)
+
+        num_voice_frames = segmenter.num_voice_frames
+        segment = segmenter.flush()
+        if segment:
+            print ("voiced_frames not empty")
+            yield self._speech_segment(segment, num_voice_frames)
+
+    def _speech_segment(self, segment, num_voice_frames):
+        # the SpeechSegment of a segment ending with the last frame read
+        chunk = self.audio_stream.get_chunk()
+        num_frames = len(segment) // (chunk * SAMPLE_WIDTH)
+        offset = self.num_frames * chunk - len(segment) // SAMPLE_WIDTH
+        capture_time = getattr(self.audio_stream, 'last_capture_time', None) or time.time()
+        return SpeechSegment(segment, offset, num_frames,
+                             num_voice_frames / num_frames if num_frames else 0.0,
+                             capture_time, self.audio_stream.get_rate())
+
+    def voice_segment_collector(self, vad_buffer_ms, max_segment_ms=None):
         
         """
         Examines audio stream and collects voice frames.
@@ -202,95 +578,215 @@ class VadFilter(object):
         in the vad_buffer are speech.
         
         The same logic is used for non-voice segments.
-        When speech_onset is True the frames will be added to the voiced_frames.
+        When speech_onset is True the frames will be written to the utterance
+        buffer, segments are yielded as bytes copied from it.
+        Segments longer than max_segment_ms are cut and yielded right away.
+        This is the bytes of speech_segment_collector, use that one for the
+        zero copy PCM and the position and timing of the segments.
+        """
+        for segment in self.speech_segment_collector(vad_buffer_ms, max_segment_ms):
+            yield bytes(segment.pcm)
+
+    def voice_frame_collector(self, vad_buffer_ms, max_segment_ms=None):
+        """
+        Same detection as voice_segment_collector, but speech is handed out
+        as it passes the vad instead of once per segment.
+        Yields (frames, end_of_segment) tuples: first the buffered audio of
+        the speech onset (VadSegmenter.onset_frames), then every following
+        frame of the segment. The last frame comes with end_of_segment True,
+        or ([], True) is yielded when the stream ends during speech.
         """
-        # ratio of frames in the buffer to be considered voice ot not. 
-        VAD_BUFFER_RATIO = 0.9
-        
         rate = self.audio_stream.get_rate()
-        chunk = self.audio_stream.get_chunk()
-        frame_ms = (1/rate ) * chunk * 1000
-        
-        # number of frames in the VadBuffer
-        vad_num_frames = int(vad_buffer_ms / frame_ms)
+        segmenter = self.create_segmenter(vad_buffer_ms, collect_frames=False,
+                                          max_segment_ms=max_segment_ms)
 
-        logging.info("frame_ms :{} ms".format(frame_ms))
-        logging.info("vad buffer len:{}".format(vad_num_frames))
-        
-        vad_buffer = VadBuffer(maxlen=vad_num_frames)
-        
-        speech_onset = False
-        voiced_frames = []
-        dbg_speech_frames = ''
-        
         frames = self.audio_frame_generator()
         for frame in frames:
-            
-            is_speech = self.vad.is_speech(frame, rate)
-
-            # this is just for visual debugging 
-            if DEBUG:
-                dbg_speech_frames  += '1' if is_speech else '0'
-
-            if not speech_onset:
-                vad_buffer.append(frame, is_speech)
-                
-                if(vad_buffer.voice_frame_ratio > VAD_BUFFER_RATIO):
-                    speech_onset = True
-                    voiced_frames.extend(vad_buffer.get_data_list())
-                    vad_buffer.clear()
-            else:
-                voiced_frames.append(frame)
-                
-                vad_buffer.append(frame, is_speech)                
-                if vad_buffer.non_voice_frame_ratio > VAD_BUFFER_RATIO:
-                    speech_onset = False
-
-                    if DEBUG:
-                        logging.info(dbg_speech_frames) 
-                        dbg_speech_frames  = ''
-                        
-                    yield b''.join([f for f in voiced_frames])                    
-#                     yield np.array(voiced_frames)
-                    vad_buffer.clear()
-                    voiced_frames = []
-        if DEBUG:
-            logging.info(dbg_speech_frames)
-            dbg_speech_frames = ''
-        
-        if voiced_frames:
-            print ("voiced_frames not empty")
-            yield b''.join([f for f in voiced_frames])
-#             yield np.array(voiced_frames)
-    
-def main (model, alphabet, lm, trie):
+            event = segmenter.process(frame, self.vad.is_speech(frame, rate))
+            VAD_CALLS.inc()
+            if event == SPEECH_ONSET:
+                yield segmenter.onset_frames, False
+            elif event == SPEECH:
+                yield [frame], False
+            elif event == SPEECH_OFFSET or event == SEGMENT_FULL:
+                yield [frame], True
+
+        if segmenter.speech_onset:
+            segmenter.flush()
+            yield [], True
+
+    def endpoint_collector(self, config=None):
+        """
+        voice_segment_collector with the windows, thresholds and segment
+        lengths of an endpointing.EndpointConfig. Yields (segment, info)
+        tuples, info is the Endpointer.segment_info of the segment with
+        its endpointing latency. Segments shorter than min_segment_ms are
+        dropped.
+        """
+        # endpointing builds on the classes of this module
+        from endpointing import Endpointer
 
-    # loading the model as it takes time to do so.
-    stt = speech2text.speech2text()
-    stt.load_model(model, alphabet, lm, trie)
+        rate = self.audio_stream.get_rate()
+        endpointer = Endpointer(config, rate, self.audio_stream.get_chunk())
+
+        for frame in self.audio_frame_generator():
+            event = endpointer.process(frame, self.vad.is_speech(frame, rate))
+            VAD_CALLS.inc()
+            if event == SPEECH_OFFSET or event == SEGMENT_FULL:
+                yield endpointer.pop_segment(), endpointer.segment_info
+
+        segment = endpointer.flush()
+        if segment:
+            yield segment, endpointer.segment_info
+
+def load_recognizers(num, model, alphabet, lm, trie, background=False, backend=None):
+    # every inference worker needs its own model instance.
+    # In the background the models load while capture and VAD already run,
+    # detect_buffer waits for them.
+    # backend creates the backend of an instance, DeepSpeech by default
+    recognizers = []
+    for _ in range(num):
+        stt = speech2text.speech2text(backend=backend() if backend is not None else None)
+        if background:
+            stt.load_model_async(model, alphabet, lm, trie)
+        else:
+            stt.load_model(model, alphabet, lm, trie)
+        recognizers.append(stt)
+    return recognizers
+
+def bound_when_ready(bounded_queue, recognizers, maxsize):
+    # the queue is unbounded while the models load, so audio waiting for
+    # them is not dropped, and gets maxsize once all of them are ready
+    bounded_queue.set_maxsize(0)
+
+    def wait():
+        for stt in recognizers:
+            try:
+                stt.wait_ready()
+            except RuntimeError:
+                # load_model_async logged it, detect_buffer raises it
+                pass
+        bounded_queue.set_maxsize(maxsize)
+
+    thread = threading.Thread(target=wait, name='queue-limit', daemon=True)
+    thread.start()
+    return thread
+
+def transcribe_inline(stt, segments):
+    # segments are SpeechSegment records or bytes-like PCM
+    for segment in segments:
+        offset_time = timer()
+        if isinstance(segment, SpeechSegment):
+            speech_text = stt.detect_buffer(segment.pcm)
+            CAPTURE_TO_TRANSCRIPT.observe(time.time() - segment.capture_time)
+        else:
+            speech_text = stt.detect_buffer(segment)
+        OFFSET_TO_TRANSCRIPT.observe(timer() - offset_time)
+        yield speech_text
+
+def log_endpoints(segments):
+    # (segment, info) of endpoint_collector to segments, logging the latency
+    for segment, info in segments:
+        logging.info("segment {reason}: {duration_ms:.0f} ms, offset latency {offset_latency_ms:.0f} ms "
+                     "(hangover {hangover_ms:.0f} ms)".format(**info))
+        yield segment
+
+def print_partials(transcripts):
+    # prints partial transcripts, yields the final ones
+    for speech_text, is_final in transcripts:
+        if is_final:
+            yield speech_text
+        else:
+            print("... {}".format(speech_text))
+
+def main (model, alphabet, lm, trie, audio=None, workers=0,
+          queue_size=SEGMENT_QUEUE_MAX_SIZE, policy=DROP_OLDEST, streaming=False,
+          server=None, trace=None, endpoint=None, energy_gate=False, shm_capture=False,
+          backend=None, data_queue_size=DATA_QUEUE_MAX_SIZE):
+
+    if server is not None:
+        # a running stt_server already has the model loaded
+        recognizers = [SttClient(server) for _ in range(max(workers, 1))]
+    else:
+        # loading the model takes time, capture starts meanwhile and the
+        # frames (inline) or segments (workers) are queued until it is ready,
+        # see bound_when_ready
+        recognizers = load_recognizers(max(workers, 1), model, alphabet, lm, trie,
+                                       background=True, backend=backend)
+    stt = recognizers[0]
     
-    with AudioStream(RATE, CHUNK) as audio_stream:
+    # a WAV file is segmented as fast as it can be read, not in real time.
+    # Files of other rates or channel counts are converted while read
+    if audio is not None:
+        from resample import open_wave_source
+        source = open_wave_source(audio, CHUNK)
+    elif shm_capture:
+        # capture runs in a child process writing into a shared memory ring
+        from shm_ring import ShmCapture
+        source = ShmCapture(RATE, CHUNK)
+    else:
+        # frames older than data_queue_size chunks are dropped while
+        # inference keeps the collector busy
+        source = AudioStream(RATE, CHUNK, queue_size=data_queue_size)
+
+    with source as audio_stream:
         print("recording started...")
-        vad_filter = VadFilter(audio_stream, DETECTION_MODE)
-        segments = vad_filter.voice_segment_collector(200)
+        vad = None
+        if energy_gate:
+            # frames well below speech level skip webrtcvad
+            import webrtcvad
+            from energy_gate import EnergyGate
+            vad = EnergyGate(webrtcvad.Vad(DETECTION_MODE))
+        vad_filter = VadFilter(audio_stream, DETECTION_MODE, vad=vad, trace=trace)
     
-        for segment in segments:
-            print('Recognizing Speech...')
-            speech_text = stt.detect_buffer(segment)
+        if streaming:
+            # frames are decoded while speaking, partial results are printed
+            voice_frames = vad_filter.voice_frame_collector(200, MAX_SEGMENT_MS)
+            results = print_partials(stt.detect_stream(voice_frames))
+        else:
+            if endpoint is not None:
+                segments = log_endpoints(vad_filter.endpoint_collector(endpoint))
+            else:
+                segments = vad_filter.speech_segment_collector(200, MAX_SEGMENT_MS)
+
+            if workers > 0:
+                # segmentation keeps draining the audio queue while models decode
+                pipeline = TranscriptionPipeline(recognizers, queue_size, policy)
+                if server is None:
+                    bound_when_ready(pipeline.segment_q, recognizers, queue_size)
+                results = (speech_text for _, speech_text in pipeline.run(segments)
+                           if speech_text is not None)
+            else:
+                # the collector stops at the first segment until the model is ready
+                if server is None and isinstance(audio_stream, AudioStream):
+                    bound_when_ready(audio_stream.data_q, recognizers, data_queue_size)
+                results = transcribe_inline(stt, segments)
+
+        for speech_text in results:
             print(speech_text)
             
             # just for fun. say this to exit
             if(speech_text.strip() == "finished"):
                 audio_stream.stop_stream()
                 time.sleep(0.3)
-                sys.exit()
+                break
+
+        if workers > 0 and not streaming:
+            logging.info("segment queue:{}".format(pipeline.stats))
+        if energy_gate:
+            logging.info("energy gate: {} of {} frames gated".format(vad.num_gated, vad.num_frames))
+        if isinstance(audio_stream, AudioStream):
+            logging.info("frames queued:{} dropped:{}".format(audio_stream.data_q.num_queued,
+                                                               audio_stream.data_q.num_dropped))
+        if shm_capture and audio is None:
+            logging.info("capture ring:{}".format(audio_stream.ring.stats))
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Running DeepSpeech inference.')
-    parser.add_argument('--model', required=True,
+    parser.add_argument('--model', required=False,
                         help='Path to the model (protocol buffer binary file)')
-    parser.add_argument('--alphabet', required=True,
+    parser.add_argument('--alphabet', required=False,
                         help='Path to the configuration file specifying the alphabet used by the network')
     parser.add_argument('--lm', nargs='?',
                         help='Path to the language model binary file')
@@ -300,6 +796,89 @@ if __name__ == '__main__':
     parser.add_argument('--audio', required=False,
                         help='Path to the audio file to run (WAV format)')
 
-    args = parser.parse_args()
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of inference worker threads, each with its own model. '
+                             '0 runs inference inline with segmentation')
+    parser.add_argument('--queue-size', type=int, default=SEGMENT_QUEUE_MAX_SIZE,
+                        help='Max number of segments waiting for an inference worker')
+    parser.add_argument('--data-queue-size', type=int, default=DATA_QUEUE_MAX_SIZE,
+                        help='Max number of captured chunks waiting for the VAD, the oldest are '
+                             'dropped beyond it. 0 for unlimited')
+    parser.add_argument('--policy', choices=POLICIES, default=DROP_OLDEST,
+                        help='What to do with segments when the segment queue is full')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Decode speech while it is spoken and print partial transcripts')
+    parser.add_argument('--server', required=False,
+                        help='Send segments to a running stt_server (socket path or host:port) '
+                             'instead of loading the model')
+    parser.add_argument('--metrics-port', type=int, required=False,
+                        help='Serve latency metrics in the Prometheus text format on this localhost port')
+    parser.add_argument('--metrics-jsonl', required=False,
+                        help='Append a JSON line of the latency metrics to this file every 10 seconds')
+    parser.add_argument('--onset-ms', type=int, required=False,
+                        help='Endpointing: window of speech needed for the speech onset')
+    parser.add_argument('--offset-ms', type=int, required=False,
+                        help='Endpointing: window of non speech needed for the speech offset (hangover)')
+    parser.add_argument('--pre-roll-ms', type=int, default=PRE_ROLL_MS,
+                        help='Endpointing: audio kept before the onset window')
+    parser.add_argument('--min-segment-ms', type=int, default=MIN_SEGMENT_MS,
+                        help='Endpointing: drop segments shorter than this')
+    parser.add_argument('--adaptive-hangover', action='store_true',
+                        help='Endpointing: shorten the offset window while the stream is quiet')
+    parser.add_argument('--vad-trace', required=False,
+                        help='Write the VAD decisions behind every segment cut to this file as JSON lines')
+    parser.add_argument('--energy-gate', action='store_true',
+                        help='Skip the VAD for frames close to the noise floor')
+    parser.add_argument('--shm-capture', action='store_true',
+                        help='Capture in a separate process writing into a shared memory ring')
+    parser.add_argument('--backend', default='deepspeech',
+                        help='Inference backend: deepspeech, or fake:rtf=0.3,fixed_s=0.05,text=... '
+                             'to load test without a model')
 
-    main(args.model, args.alphabet, args.lm, args.trie)
+    args = parser.parse_args()
+    try:
+        backend = backends.parse_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    if (args.server is None and args.backend == 'deepspeech' and
+            (args.model is None or args.alphabet is None)):
+        parser.error('--model and --alphabet are required without --server')
+    if args.server is not None and args.streaming:
+        parser.error('--streaming needs a local model')
+
+    exporter = None
+    if args.metrics_port is not None:
+        exporter = metrics.PrometheusExporter(args.metrics_port).start()
+    sink = None
+    if args.metrics_jsonl is not None:
+        sink = metrics.JsonLinesSink(open(args.metrics_jsonl, 'a')).start()
+
+    endpoint = None
+    if (args.onset_ms or args.offset_ms or args.pre_roll_ms or args.min_segment_ms or
+            args.adaptive_hangover):
+        from endpointing import EndpointConfig
+        endpoint = EndpointConfig(onset_window_ms=args.onset_ms or ONSET_WINDOW_MS,
+                                  offset_window_ms=args.offset_ms or OFFSET_WINDOW_MS,
+                                  pre_roll_ms=args.pre_roll_ms,
+                                  min_segment_ms=args.min_segment_ms,
+                                  adaptive=args.adaptive_hangover)
+        if args.streaming:
+            parser.error('endpointing options are not supported with --streaming')
+
+    trace = None
+    if args.vad_trace is not None:
+        trace = VadTrace(frame_ms=1000 * CHUNK / RATE)
+
+    try:
+        main(args.model, args.alphabet, args.lm, args.trie, args.audio,
+             args.workers, args.queue_size, args.policy, args.streaming, args.server, trace,
+             endpoint, args.energy_gate, args.shm_capture, backend, args.data_queue_size)
+    finally:
+        if trace is not None:
+            with open(args.vad_trace, 'w') as trace_file:
+                trace.dump(trace_file)
+        if sink is not None:
+            sink.stop()
+            sink.stream.close()
+        if exporter is not None:
+            exporter.stop()
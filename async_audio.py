@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    asyncio capture and segmentation.
+
+    AsyncAudioStream hands frames from the PortAudio thread straight to an
+    asyncio.Queue with loop.call_soon_threadsafe, and AsyncVadFilter yields
+    speech segments as an async iterator. No thread polls a queue with a
+    timeout, so many streams can be served from one event loop.
+"""
+import asyncio
+import time
+
+from audio_defaults import *
+from AudioStream import AudioStream, VadFilter, SPEECH_OFFSET, SEGMENT_FULL
+from metrics import VAD_CALLS
+
+# max number of frames waiting in the asyncio queue, 0 for unlimited.
+# When it is full the oldest frame is dropped.
+ASYNC_QUEUE_MAX_SIZE = 0
+
+
+class AsyncAudioStream(AudioStream):
+    """
+    AudioStream whose frames are read with `async for frame in stream.frames()`.
+    Use it with `async with`, it binds to the running event loop.
+    frames() ends when the stream is stopped or closed. last_capture_time is
+    the time.time() the callback received the frame frames() yielded last.
+    """
+    def __init__(self, rate=RATE, chunk=CHUNK, queue_size=ASYNC_QUEUE_MAX_SIZE):
+        super(AsyncAudioStream, self).__init__(rate, chunk)
+        self._callback = self.async_callback
+        self._loop = None
+        self._queue_size = queue_size
+        self.frame_q = None
+        self.num_dropped = 0
+
+    def _init_queue(self, queue_size, queue_policy):
+        # frames go to the asyncio queue created by bind(), there is no data_q
+        self.data_q = None
+
+    def bind(self, loop):
+        self._loop = loop
+        # the size limit is applied in _put_frame, the end marker always fits
+        self.frame_q = asyncio.Queue()
+
+    async def __aenter__(self):
+        self.bind(asyncio.get_running_loop())
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        self.__exit__(exc_type, exc_value, tb)
+        self._put_frame(None)
+
+    def async_callback(self, in_data, frame_count, time_info, status_flags):
+        """
+        runs on the PortAudio thread, only schedules the hand over.
+        """
+        self._loop.call_soon_threadsafe(self._put_frame, in_data, time.time())
+        return None, self._continue
+
+    def _put_frame(self, frame, capture_time=None):
+        # runs on the event loop thread, None marks the end of the frames
+        if frame is not None and 0 < self._queue_size <= self.frame_q.qsize():
+            self.frame_q.get_nowait()
+            self.num_dropped += 1
+        self.frame_q.put_nowait((capture_time, frame))
+
+    def stop_stream(self):
+        super(AsyncAudioStream, self).stop_stream()
+        self._loop.call_soon_threadsafe(self._put_frame, None)
+
+    async def frames(self):
+        while True:
+            capture_time, frame = await self.frame_q.get()
+            if frame is None:
+                break
+            self.last_capture_time = capture_time
+            yield frame
+
+
+class AsyncFrameSource(object):
+    """
+    async frames() over a frame source from frame_sources, e.g. to segment
+    files with AsyncVadFilter. The loop gets control back every
+    yield_every frames and whenever the source has no frame.
+    get_frame runs on the event loop thread, so this is for non-blocking
+    sources such as WaveFileSource and BytesSource only. AudioStream,
+    RingFrameSource and PcmStreamSource on a pipe wait for frames and would
+    block the loop, use AsyncAudioStream for live audio.
+    """
+    def __init__(self, source, yield_every=64):
+        self.source = source
+        self.yield_every = yield_every
+
+    def get_rate(self):
+        return self.source.get_rate()
+
+    def get_chunk(self):
+        return self.source.get_chunk()
+
+    @property
+    def last_capture_time(self):
+        return getattr(self.source, 'last_capture_time', None)
+
+    async def frames(self):
+        count = 0
+        while self.source.is_active():
+            frame = self.source.get_frame()
+            if frame is None:
+                await asyncio.sleep(0)
+                continue
+            yield frame
+
+            count += 1
+            if count % self.yield_every == 0:
+                await asyncio.sleep(0)
+
+
+class AsyncVadFilter(VadFilter):
+    """
+    VadFilter over a stream with an async frames() iterator, such as
+    AsyncAudioStream or AsyncFrameSource.
+    """
+    async def voice_segment_collector(self, vad_buffer_ms, max_segment_ms=None):
+        """
+        async iterator of the segments VadFilter.voice_segment_collector
+        would yield for the same frames, the bytes of speech_segment_collector.
+        """
+        async for segment in self.speech_segment_collector(vad_buffer_ms, max_segment_ms):
+            yield bytes(segment.pcm)
+
+    async def speech_segment_collector(self, vad_buffer_ms, max_segment_ms=None):
+        """
+        async iterator of the SpeechSegment records
+        VadFilter.speech_segment_collector would yield for the same frames.
+        """
+        rate = self.audio_stream.get_rate()
+        segmenter = self.create_segmenter(vad_buffer_ms, max_segment_ms=max_segment_ms)
+
+        async for frame in self.audio_stream.frames():
+            self.num_frames += 1
+            event = segmenter.process(frame, self.vad.is_speech(frame, rate))
+            VAD_CALLS.inc()
+            if event == SPEECH_OFFSET or event == SEGMENT_FULL:
+                num_voice_frames = segmenter.num_voice_frames
+                yield self._speech_segment(segmenter.pop_segment(), num_voice_frames)
+
+        num_voice_frames = segmenter.num_voice_frames
+        segment = segmenter.flush()
+        if segment:
+            yield self._speech_segment(segment, num_voice_frames)
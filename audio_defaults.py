@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import pyaudio
 
 ###################
 # pyAudio settings 
@@ -9,8 +8,12 @@ import pyaudio
 CHUNK = 480
 
 # audio sample number of bytes
-# this also refer as width or format
-FORMAT = pyaudio.paInt16
+# this also refer as width or format.
+# pyaudio.paInt16, spelled out so the settings don't import pyaudio
+FORMAT = 8
+
+# number of bytes per sample for FORMAT
+SAMPLE_WIDTH = 2
 
 # this has to be mono for voice detection
 # mono/stereo or lef/right
@@ -25,6 +28,34 @@ RATE = 16000
 # webrtc.Vad aggressiveness level 
 DETECTION_MODE = 3
 
+# ratio of frames in the vad buffer to be considered voice or not
+VAD_BUFFER_RATIO = 0.9
+
+# segments longer than this are cut, so a long monologue can't grow without limit
+MAX_SEGMENT_MS = 30000
+
+# endpointing.EndpointConfig defaults, the first two match the 200 ms vad buffer
+ONSET_WINDOW_MS = 200
+OFFSET_WINDOW_MS = 200
+PRE_ROLL_MS = 0
+MIN_SEGMENT_MS = 0
+
+# shortest hangover of the adaptive endpointing, used when the stream is quiet
+MIN_OFFSET_WINDOW_MS = 90
+
+# energy_gate.EnergyGate: frames less than this above the noise floor skip webrtcvad
+ENERGY_GATE_MARGIN_DB = 6.0
+
+# how fast the noise floor may rise, it follows quieter frames at once
+ENERGY_GATE_FLOOR_RISE_DB_PER_S = 1.0
+
+# every frame goes to webrtcvad while the noise floor is first estimated
+ENERGY_GATE_WARMUP_MS = 500
+
+# frames after a speech decision that always go to webrtcvad, so the gate
+# never decides the speech offset
+ENERGY_GATE_HANGOVER_MS = 300
+
 ####################
 # DeepSpeech settings
 ####################
@@ -40,6 +71,9 @@ LM_WEIGHT = 1.50
 # when the inserted word is part of the vocabulary
 VALID_WORD_COUNT_WEIGHT = 2.10
 
+# audio length between partial transcripts of streaming recognition
+STREAM_PARTIAL_INTERVAL_MS = 500
+
 # These constants are tied to the shape of the graph used (changing them changes
 # the geometry of the first layer), so make sure you use the same constants that
 # were used during training
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Inference backends of speech2text.
+
+    A backend loads a model and turns 16 kHz PCM into text. It has the
+    interface of deepspeech.Model, which speech2text and StreamingRecognizer
+    already call, plus load():
+        load(model, alphabet, lm, trie)
+        stt(audio, rate)
+    and, when streaming is True,
+        setupStream(sample_rate=), feedAudioContent(ctx, audio),
+        intermediateDecode(ctx), finishStream(ctx)
+
+    DeepSpeechBackend runs deepspeech.Model. FakeBackend returns scripted
+    text and spends a configurable time per call (fixed cost plus a real
+    time factor of the audio length), so capture, VAD, queueing and worker
+    pools can be load tested without the model files.
+"""
+import sys
+import random
+import time
+
+from timeit import default_timer as timer
+
+import audio_defaults
+
+
+class Backend(object):
+    """
+    base class of the inference backends.
+    load_times has the seconds load() spent per step.
+    """
+    streaming = False
+
+    def __init__(self):
+        self.load_times = {}
+
+    @property
+    def cache_id(self):
+        """
+        the backend and the settings its transcripts depend on, part of
+        the transcript cache key.
+        """
+        return (type(self).__name__,)
+
+    def load(self, model, alphabet, lm=None, trie=None):
+        raise(NotImplementedError())
+
+    def stt(self, audio, rate):
+        raise(NotImplementedError())
+
+    def setupStream(self, pre_alloc_frames=150, sample_rate=audio_defaults.RATE):
+        raise(NotImplementedError("{} does not stream".format(type(self).__name__)))
+
+    def feedAudioContent(self, ctx, buffer):
+        raise(NotImplementedError("{} does not stream".format(type(self).__name__)))
+
+    def intermediateDecode(self, ctx):
+        raise(NotImplementedError("{} does not stream".format(type(self).__name__)))
+
+    def finishStream(self, ctx):
+        raise(NotImplementedError("{} does not stream".format(type(self).__name__)))
+
+
+class DeepSpeechBackend(Backend):
+    """
+    deepspeech.Model with the decoder settings of speech2text.
+    """
+    streaming = True
+
+    def __init__(self, beam_width=audio_defaults.BEAM_WIDTH, lm_weight=audio_defaults.LM_WEIGHT,
+                 valid_word_count_weight=audio_defaults.VALID_WORD_COUNT_WEIGHT):
+        super(DeepSpeechBackend, self).__init__()
+        self.beam_width = beam_width
+        self.lm_weight = lm_weight
+        self.valid_word_count_weight = valid_word_count_weight
+        self.model = None
+
+    @property
+    def cache_id(self):
+        return (type(self).__name__, self.beam_width, self.lm_weight,
+                self.valid_word_count_weight)
+
+    def load(self, model, alphabet, lm=None, trie=None):
+        # deepspeech is only needed once a model is loaded
+        from deepspeech import Model
+
+        print('Loading model from file {}'.format(model), file=sys.stderr)
+        model_load_start = timer()
+        self.model = Model(model, audio_defaults.N_FEATURES, audio_defaults.N_CONTEXT, alphabet,
+                           self.beam_width)
+        self.load_times['model_s'] = timer() - model_load_start
+        print('Loaded model in {:.3}s.'.format(self.load_times['model_s']), file=sys.stderr)
+
+        if lm and trie:
+            print('Loading language model from files {} {}'.format(lm, trie), file=sys.stderr)
+            lm_load_start = timer()
+            self.model.enableDecoderWithLM(alphabet, lm, trie, self.lm_weight,
+                                           self.valid_word_count_weight)
+            self.load_times['lm_s'] = timer() - lm_load_start
+            print('Loaded language model in {:.3}s.'.format(self.load_times['lm_s']),
+                  file=sys.stderr)
+        else:
+            print('Empty Language Model or trie {} {}'.format(lm, trie), file=sys.stderr)
+
+    def stt(self, audio, rate):
+        return self.model.stt(audio, rate)
+
+    def setupStream(self, pre_alloc_frames=150, sample_rate=audio_defaults.RATE):
+        return self.model.setupStream(pre_alloc_frames, sample_rate)
+
+    def feedAudioContent(self, ctx, buffer):
+        self.model.feedAudioContent(ctx, buffer)
+
+    def intermediateDecode(self, ctx):
+        return self.model.intermediateDecode(ctx)
+
+    def finishStream(self, ctx):
+        return self.model.finishStream(ctx)
+
+
+class FakeBackend(Backend):
+    """
+    Stand-in for deepspeech.Model with scripted transcripts.
+    Every utterance (stt call or stream) returns the next text of texts in
+    turn. While streaming, intermediateDecode reveals words_per_second words
+    for every second of audio fed so far.
+
+    Inference of audio_s seconds of audio takes
+        (fixed_s + real_time_factor * audio_s) * (1 + jitter * u)
+    with u uniform in [-1, 1] from a generator seeded with seed, so runs are
+    repeatable. The time is slept, which lets other threads run like native
+    inference that releases the GIL, or with cpu=True spent in a busy loop
+    that keeps a core and the GIL. While streaming, the real time factor
+    part is spent in feedAudioContent and fixed_s in finishStream.
+    load() takes load_s and allocates (and writes) model_mb MB standing in
+    for the model weights. The defaults cost nothing.
+    """
+    streaming = True
+
+    def __init__(self, texts, words_per_second=3, real_time_factor=0.0, fixed_s=0.0,
+                 jitter=0.0, load_s=0.0, cpu=False, seed=0, model_mb=0):
+        super(FakeBackend, self).__init__()
+        if not texts:
+            raise(ValueError("FakeBackend needs at least one text"))
+        self.texts = list(texts)
+        self.words_per_second = words_per_second
+        self.real_time_factor = real_time_factor
+        self.fixed_s = fixed_s
+        self.jitter = jitter
+        self.load_s = load_s
+        self.cpu = cpu
+        self.model_mb = model_mb
+        self.weights = None
+        self._random = random.Random(seed)
+        self._next = 0
+        self.num_calls = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def cache_id(self):
+        return (type(self).__name__, tuple(self.texts), self.words_per_second)
+
+    def _next_text(self):
+        text = self.texts[self._next % len(self.texts)]
+        self._next += 1
+        return text
+
+    def _spend(self, seconds):
+        if self.jitter:
+            seconds *= 1 + self.jitter * self._random.uniform(-1, 1)
+        if seconds <= 0:
+            return
+        self.busy_seconds += seconds
+        if self.cpu:
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+        else:
+            time.sleep(seconds)
+
+    def load(self, model=None, alphabet=None, lm=None, trie=None):
+        start = timer()
+        # written, so the pages are resident and not shared zero pages
+        self.weights = b'\x01' * int(self.model_mb * 2 ** 20)
+        self._spend(self.load_s)
+        self.load_times['model_s'] = timer() - start
+
+    def stt(self, audio, rate):
+        self.num_calls += 1
+        self._spend(self.fixed_s + self.real_time_factor * len(audio) / rate)
+        return self._next_text()
+
+    def setupStream(self, pre_alloc_frames=150, sample_rate=audio_defaults.RATE):
+        return {'rate': sample_rate, 'samples': 0}
+
+    def feedAudioContent(self, ctx, buffer):
+        ctx['samples'] += len(buffer)
+        self._spend(self.real_time_factor * len(buffer) / ctx['rate'])
+
+    def intermediateDecode(self, ctx):
+        words = self.texts[self._next % len(self.texts)].split()
+        num_words = int(ctx['samples'] / ctx['rate'] * self.words_per_second)
+        return ' '.join(words[:num_words])
+
+    def finishStream(self, ctx):
+        self.num_calls += 1
+        self._spend(self.fixed_s)
+        return self._next_text()
+
+
+def parse_backend(spec, beam_width=audio_defaults.BEAM_WIDTH, lm_weight=audio_defaults.LM_WEIGHT,
+                  valid_word_count_weight=audio_defaults.VALID_WORD_COUNT_WEIGHT):
+    """
+    returns a function creating a new backend for a command line spec:
+        deepspeech
+        fake:rtf=0.3,fixed_s=0.05,jitter=0.2,load_s=2,model_mb=200,cpu=1,text=open the door
+    every model instance needs a backend of its own.
+    """
+    name, _, options = spec.partition(':')
+    if name == 'deepspeech':
+        if options:
+            raise(ValueError("the deepspeech backend has no options: {!r}".format(spec)))
+        return lambda: DeepSpeechBackend(beam_width, lm_weight, valid_word_count_weight)
+    if name != 'fake':
+        raise(ValueError("unknown backend {!r}, use deepspeech or fake".format(name)))
+
+    names = {'rtf': ('real_time_factor', float), 'fixed_s': ('fixed_s', float),
+             'jitter': ('jitter', float), 'load_s': ('load_s', float),
+             'cpu': ('cpu', lambda value: value not in ('', '0', 'false')),
+             'seed': ('seed', int), 'words_per_second': ('words_per_second', float),
+             'model_mb': ('model_mb', float)}
+    kwargs = {}
+    texts = []
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key == 'text':
+            texts.append(value)
+        elif key in names:
+            kwargs[names[key][0]] = names[key][1](value)
+        else:
+            raise(ValueError("unknown fake backend option {!r}".format(key)))
+    texts = texts or ["open the door"]
+    return lambda: FakeBackend(texts, **kwargs)
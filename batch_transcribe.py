@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Batch transcription of WAV files over a pool of worker processes.
+
+    Every worker loads the model once, or is forked from a parent that
+    loaded it (--prefork), and then transcribes whole files, or VAD
+    segments cut by the parent process, as they are handed out.
+    Results are written as JSON lines with per-file timings.
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import os
+import argparse
+import json
+import wave
+
+from timeit import default_timer as timer
+
+import backends
+import prefork
+import speech2text
+import transcript_cache
+from audio_defaults import *
+
+# the speech2text instance of a worker process, see _init_worker
+_stt = None
+
+
+def find_wav_files(path):
+    """
+    returns the WAV files to transcribe.
+    path is either a directory, searched recursively for *.wav files, or a
+    manifest text file with one WAV path per line. Relative manifest paths
+    are relative to the manifest, empty lines and lines starting with # are
+    ignored.
+    """
+    if os.path.isdir(path):
+        wav_files = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith('.wav'):
+                    wav_files.append(os.path.join(root, name))
+        return wav_files
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    wav_files = []
+    with open(path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            wav_files.append(os.path.join(base_dir, line))
+    return wav_files
+
+
+def _init_worker(model, alphabet, lm, trie, cache_path=None, backend=None):
+    global _stt
+    cache = None
+    if cache_path:
+        cache = transcript_cache.open_cache(cache_path)
+    # backend is a backends.parse_backend spec, DeepSpeech by default
+    _stt = speech2text.speech2text(cache=cache,
+                                   backend=backends.parse_backend(backend)() if backend else None)
+    _stt.load_model(model, alphabet, lm, trie)
+
+
+def _init_forked_worker(cache_path=None):
+    # the model was loaded by _init_worker in the parent, the SQLite
+    # connection of the cache must not be shared, every worker opens its own
+    if cache_path:
+        _stt.cache = transcript_cache.open_cache(cache_path)
+
+
+def worker_pool(workers, model, alphabet, lm=None, trie=None, cache_path=None, preload=False,
+                backend=None):
+    """
+    returns a started prefork.PreforkPool of worker processes ready to
+    run transcribe_file and transcribe_segment. With preload the model is
+    loaded once in this process and the workers are forked from it,
+    otherwise every worker loads it.
+    """
+    if preload:
+        pool = prefork.PreforkPool(workers, _init_forked_worker, (cache_path,),
+                                   preload=_init_worker,
+                                   preload_args=(model, alphabet, lm, trie, None, backend))
+    else:
+        pool = prefork.PreforkPool(workers, _init_worker,
+                                   (model, alphabet, lm, trie, cache_path, backend))
+    pool.start()
+    print('{} workers ready in {:.3f}s'.format(workers, pool.startup_s), file=sys.stderr)
+    return pool
+
+
+def transcribe_file(file_name):
+    """
+    worker task: transcribes a whole file with the worker model.
+    """
+    result = {'file': file_name}
+    start = timer()
+    try:
+        with wave.open(file_name) as fin:
+            result['audio_s'] = fin.getnframes() / fin.getframerate()
+        result['text'] = _stt.detect_file(file_name)
+    except Exception as e:
+        result['error'] = repr(e)
+    result['inference_s'] = timer() - start
+    result['worker'] = os.getpid()
+    return result
+
+
+def transcribe_segment(task):
+    """
+    worker task: transcribes one VAD segment of a file.
+    task is a (file_name, segment_index, pcm_bytes) tuple.
+    """
+    file_name, index, audio_buffer = task
+    result = {'file': file_name, 'segment': index,
+              'audio_s': len(audio_buffer) / (RATE * CHANNELS * SAMPLE_WIDTH)}
+    start = timer()
+    try:
+        result['text'] = _stt.detect_buffer(audio_buffer)
+    except Exception as e:
+        result['error'] = repr(e)
+    result['inference_s'] = timer() - start
+    result['worker'] = os.getpid()
+    return result
+
+
+def segment_tasks(wav_files, vad_buffer_ms, mode=DETECTION_MODE):
+    """
+    cuts every file into VAD segments, yields transcribe_segment tasks.
+    """
+    # AudioStream pulls in the capture stack, only needed for this mode
+    from AudioStream import VadFilter
+    from resample import open_wave_source
+
+    for file_name in wav_files:
+        with open_wave_source(file_name) as source:
+            vad_filter = VadFilter(source, mode)
+            segments = vad_filter.voice_segment_collector(vad_buffer_ms, MAX_SEGMENT_MS)
+            for index, segment in enumerate(segments):
+                yield file_name, index, segment
+
+
+def run_batch(wav_files, output, workers, model, alphabet, lm=None, trie=None,
+              vad_buffer_ms=None, cache_path=None, preload=False, backend=None):
+    """
+    transcribes wav_files on a pool of worker processes and writes one JSON
+    line per file, or per segment when vad_buffer_ms is given, to output.
+    Lines are written in completion order. Returns the number of results.
+    With cache_path the workers share a transcript cache in that SQLite file.
+    With preload the workers are forked from a process with the model loaded.
+    backend is a backends.parse_backend spec, DeepSpeech by default.
+    """
+    num_results = 0
+    with worker_pool(workers, model, alphabet, lm, trie, cache_path, preload,
+                     backend) as pool:
+        if vad_buffer_ms:
+            results = pool.imap_unordered(transcribe_segment,
+                                          segment_tasks(wav_files, vad_buffer_ms))
+        else:
+            results = pool.imap_unordered(transcribe_file, wav_files)
+
+        for result in results:
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            num_results += 1
+    return num_results
+
+
+def main(args):
+    wav_files = find_wav_files(args.input)
+    print('transcribing {} files on {} workers'.format(len(wav_files), args.workers),
+          file=sys.stderr)
+
+    batch_start = timer()
+    with open(args.output, 'w') as output:
+        num_results = run_batch(wav_files, output, args.workers, args.model,
+                                args.alphabet, args.lm, args.trie,
+                                args.vad_buffer_ms, args.cache, args.prefork, args.backend)
+    print('wrote {} results to {} in {:.3f}s'.format(num_results, args.output,
+                                                     timer() - batch_start),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batch DeepSpeech transcription of WAV files.')
+    parser.add_argument('input',
+                        help='Directory of WAV files or manifest file with one WAV path per line')
+    parser.add_argument('--output', required=True,
+                        help='Path to the JSON lines result file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes, each loads the model once')
+    parser.add_argument('--vad-buffer-ms', type=int, default=None,
+                        help='Cut files into VAD segments with this buffer length and '
+                             'transcribe the segments in parallel')
+    parser.add_argument('--cache', required=False,
+                        help='SQLite file caching transcripts by audio content, '
+                             'repeated audio is not decoded again')
+    parser.add_argument('--prefork', action='store_true',
+                        help='Load the model once and fork the workers from the loaded process, '
+                             'they share its memory copy-on-write')
+    parser.add_argument('--backend', default='deepspeech',
+                        help='Inference backend: deepspeech, or fake:rtf=0.3,fixed_s=0.05,text=... '
+                             'to load test without a model')
+    parser.add_argument('--model', required=False,
+                        help='Path to the model (protocol buffer binary file)')
+    parser.add_argument('--alphabet', required=False,
+                        help='Path to the configuration file specifying the alphabet used by the network')
+    parser.add_argument('--lm', nargs='?',
+                        help='Path to the language model binary file')
+    parser.add_argument('--trie', nargs='?',
+                        help='Path to the language model trie file created with native_client/generate_trie')
+
+    args = parser.parse_args()
+    # the workers parse the spec again, it is checked here once
+    try:
+        backends.parse_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.backend == 'deepspeech' and (args.model is None or args.alphabet is None):
+        parser.error('--model and --alphabet are required by the deepspeech backend')
+    main(args)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Synthetic load benchmark of multistream.MultiStreamSegmenter.
+
+    Every channel replays the WAVs of tests/data, shifted so the channels are
+    not in lockstep, and the frames of all channels are interleaved round
+    robin. Segmentation runs on one thread, so the seconds of audio
+    segmented per second of CPU time is the number of real time channels a
+    core sustains.
+
+    python ./benchmarks/bench_multistream.py --channels 200 --seconds 30
+"""
+import sys
+import os
+import argparse
+import json
+import logging
+import time
+import wave
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import multistream
+from audio_defaults import *
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'data')
+
+
+def load_frames(chunk=CHUNK):
+    pcm = b''
+    for name in sorted(os.listdir(DATA_DIR)):
+        if name.endswith('.wav'):
+            with wave.open(os.path.join(DATA_DIR, name)) as fin:
+                pcm += fin.readframes(fin.getnframes())
+
+    frame_bytes = chunk * SAMPLE_WIDTH
+    return [pcm[pos:pos + frame_bytes] for pos in range(0, len(pcm) - frame_bytes + 1, frame_bytes)]
+
+
+def tagged_frames(frames, num_channels, num_frames):
+    shift = max(len(frames) // max(num_channels, 1), 1)
+    for t in range(num_frames):
+        for channel_id in range(num_channels):
+            yield channel_id, frames[(t + channel_id * shift) % len(frames)]
+
+
+def run(num_channels, seconds, vad_buffer_ms):
+    frames = load_frames()
+    frame_s = CHUNK / RATE
+    num_frames = int(seconds / frame_s)
+
+    segmenter = multistream.MultiStreamSegmenter(vad_buffer_ms)
+    num_segments = 0
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in segmenter.segment_collector(tagged_frames(frames, num_channels, num_frames)):
+        num_segments += 1
+    cpu_s = time.process_time() - cpu_start
+    wall_s = time.perf_counter() - wall_start
+
+    audio_s = num_frames * frame_s
+    return {'benchmark': 'multistream',
+            'channels': num_channels,
+            'audio_s_per_channel': audio_s,
+            'segments': num_segments,
+            'cpu_s': cpu_s,
+            'wall_s': wall_s,
+            'frames_per_s': num_channels * num_frames / cpu_s,
+            'channels_per_core': num_channels * audio_s / cpu_s}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic load benchmark of MultiStreamSegmenter.')
+    parser.add_argument('--channels', type=int, default=100,
+                        help='Number of concurrent channels')
+    parser.add_argument('--seconds', type=float, default=30,
+                        help='Seconds of audio per channel')
+    parser.add_argument('--vad-buffer-ms', type=int, default=200,
+                        help='VAD buffer length in ms')
+    args = parser.parse_args()
+
+    # the per frame debug trace is not part of the hot path being measured
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(json.dumps(run(args.channels, args.seconds, args.vad_buffer_ms)))
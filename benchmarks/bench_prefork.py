@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Startup time and memory of batch_transcribe worker pools, each worker
+    loading the model itself versus workers forked from a parent that
+    loaded it once (prefork).
+
+    Every mode starts a pool, waits for the readiness handshake of all
+    workers and reports the time to ready and the memory of the workers at
+    that point: RSS counts shared pages in every process, PSS splits them
+    among the processes sharing them, private memory is what a worker holds
+    alone. The fake backend stands in for the model unless --model is given:
+
+    python ./benchmarks/bench_prefork.py --workers 8 --backend "fake:load_s=2,model_mb=300"
+    python ./benchmarks/bench_prefork.py --workers 8 --model ./models/output_graph.pbmm --alphabet ./models/alphabet.txt --lm ./models/lm.binary --trie ./models/trie
+"""
+import sys
+import os
+import argparse
+import json
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import batch_transcribe
+import prefork
+
+
+def run(workers, model, alphabet, lm, trie, backend):
+    results = {}
+    for mode, preload in [('independent', False), ('prefork', True)]:
+        if preload:
+            pool = prefork.PreforkPool(workers, batch_transcribe._init_forked_worker,
+                                       preload=batch_transcribe._init_worker,
+                                       preload_args=(model, alphabet, lm, trie, None, backend))
+        else:
+            pool = prefork.PreforkPool(workers, batch_transcribe._init_worker,
+                                       (model, alphabet, lm, trie, None, backend))
+        with pool:
+            results[mode] = pool.stats
+            if preload:
+                results[mode]['parent'] = prefork.memory_mb()
+        # the model of the prefork parent is not needed any more
+        batch_transcribe._stt = None
+    return {'benchmark': 'prefork', 'backend': backend or 'deepspeech', 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worker startup time and memory with and without prefork.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of worker processes')
+    parser.add_argument('--backend', default='fake:load_s=1,model_mb=200',
+                        help='Backend spec, see backends.parse_backend; deepspeech needs --model')
+    parser.add_argument('--model', required=False,
+                        help='Path to the model (protocol buffer binary file), selects the deepspeech backend')
+    parser.add_argument('--alphabet', required=False,
+                        help='Path to the configuration file specifying the alphabet used by the network')
+    parser.add_argument('--lm', nargs='?',
+                        help='Path to the language model binary file')
+    parser.add_argument('--trie', nargs='?',
+                        help='Path to the language model trie file created with native_client/generate_trie')
+    args = parser.parse_args()
+
+    backend = None if args.model else args.backend
+    print(json.dumps(run(args.workers, args.model, args.alphabet, args.lm, args.trie, backend),
+                     indent=1))
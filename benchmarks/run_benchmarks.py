@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Reproducible benchmarks of the VAD and transcription hot paths.
+
+    The WAVs of tests/data, and a synthetic long recording built from them
+    with silence in between, are replayed through VadBuffer, VadFilter,
+    vad_batch and speech2text with FakeModel standing in for DeepSpeech.
+    Every benchmark runs --repeat times and the fastest run is reported
+    with frames/sec, real time factor (processing time / audio time),
+    segment latency percentiles and the peak RSS of the process so far.
+
+    Results are written as JSON and can be compared between commits:
+        python ./benchmarks/run_benchmarks.py --output before.json
+        python ./benchmarks/run_benchmarks.py --output after.json --compare before.json
+"""
+import sys
+import os
+import argparse
+import contextlib
+import json
+import logging
+import platform
+import resource
+import subprocess
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AudioStream
+import backends
+import energy_gate
+import frame_sources
+import resample
+import shm_ring
+import speech2text
+import vad_batch
+from audio_defaults import *
+from pipeline import TranscriptionPipeline, BLOCK
+
+from bench_multistream import load_frames
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# worker_pool benchmark: inference threads and fake real time factor
+POOL_WORKERS = 4
+POOL_RTF = 0.01
+
+
+def synthetic_recording(minutes):
+    """
+    test WAVs separated by a second of silence, repeated to minutes of audio.
+    """
+    silence = bytes(RATE * SAMPLE_WIDTH)
+    block = b''.join(load_frames()) + silence
+    repeat = max(int(minutes * 60 * RATE * SAMPLE_WIDTH / len(block)), 1)
+    return block * repeat
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss /= 1024
+    return maxrss / 1024
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'p50_ms': p50 * 1000, 'p90_ms': p90 * 1000, 'p99_ms': p99 * 1000,
+            'max_ms': max(values) * 1000}
+
+
+class TimedSource(frame_sources.BytesSource):
+    """
+    BytesSource remembering when the last frame was read.
+    """
+    last_frame_time = 0
+
+    def get_frame(self):
+        frame = super(TimedSource, self).get_frame()
+        self.last_frame_time = time.perf_counter()
+        return frame
+
+
+def bench_vad_buffer(pcm):
+    frames = load_frames()
+    num_frames = len(pcm) // (CHUNK * SAMPLE_WIDTH)
+    vad_buffer = AudioStream.VadBuffer(vad_batch.vad_buffer_frames(200))
+
+    start = time.perf_counter()
+    for i in range(num_frames):
+        vad_buffer.append(frames[i % len(frames)], i % 3 != 0)
+        vad_buffer.voice_frame_ratio
+    return time.perf_counter() - start, num_frames, {}
+
+
+def bench_vad_filter(pcm):
+    with TimedSource(pcm) as source:
+        vad_filter = AudioStream.VadFilter(source, DETECTION_MODE)
+        start = time.perf_counter()
+        num_segments = sum(1 for _ in vad_filter.voice_segment_collector(200, MAX_SEGMENT_MS))
+        elapsed = time.perf_counter() - start
+    return elapsed, len(pcm) // (CHUNK * SAMPLE_WIDTH), {'segments': num_segments}
+
+
+def bench_vad_batch(pcm):
+    samples = np.frombuffer(pcm, np.int16)
+    start = time.perf_counter()
+    segments = vad_batch.voice_segments(samples, 200, max_segment_ms=MAX_SEGMENT_MS)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(samples) // CHUNK, {'segments': len(segments)}
+
+
+def bench_transcription(pcm):
+    """
+    capture -> VAD -> inference with FakeModel, latency is measured from
+    reading the last frame of a segment to its transcript.
+    """
+    stt = speech2text.speech2text(speech2text.FakeModel(["open the door"]))
+    latencies = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with TimedSource(pcm) as source:
+            vad_filter = AudioStream.VadFilter(source, DETECTION_MODE)
+            start = time.perf_counter()
+            for segment in vad_filter.voice_segment_collector(200, MAX_SEGMENT_MS):
+                stt.detect_buffer(segment)
+                latencies.append(time.perf_counter() - source.last_frame_time)
+            elapsed = time.perf_counter() - start
+    return elapsed, len(pcm) // (CHUNK * SAMPLE_WIDTH), dict(segments=len(latencies),
+                                                             **percentiles(latencies))
+
+
+def bench_worker_pool(pcm):
+    """
+    capture -> VAD -> TranscriptionPipeline on POOL_WORKERS threads, each
+    with a FakeBackend costing POOL_RTF of the segment length. efficiency
+    is the simulated inference time / (workers * elapsed), 1.0 when the
+    workers never wait for segments or each other.
+    """
+    fakes = [backends.FakeBackend(["open the door"], real_time_factor=POOL_RTF, fixed_s=0.002,
+                                  jitter=0.2) for _ in range(POOL_WORKERS)]
+    recognizers = [speech2text.speech2text(fake) for fake in fakes]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with TimedSource(pcm) as source:
+            vad_filter = AudioStream.VadFilter(source, DETECTION_MODE)
+            segments = vad_filter.voice_segment_collector(200, MAX_SEGMENT_MS)
+            pipeline = TranscriptionPipeline(recognizers, 2 * POOL_WORKERS, BLOCK)
+            start = time.perf_counter()
+            num_results = sum(1 for _ in pipeline.run(segments))
+            elapsed = time.perf_counter() - start
+    busy = sum(fake.busy_seconds for fake in fakes)
+    return elapsed, len(pcm) // (CHUNK * SAMPLE_WIDTH), {
+        'segments': num_results, 'workers': POOL_WORKERS, 'inference_s': busy,
+        'efficiency': busy / (POOL_WORKERS * elapsed)}
+
+
+def time_conversion(pcm, in_rate, channels):
+    """
+    seconds to convert interleaved pcm of in_rate and channels to RATE mono
+    in RESAMPLE_BLOCK_FRAMES blocks.
+    """
+    resampler = resample.Resampler(in_rate, RATE, channels)
+    block_bytes = resample.RESAMPLE_BLOCK_FRAMES * SAMPLE_WIDTH * channels
+    start = time.perf_counter()
+    for pos in range(0, len(pcm), block_bytes):
+        resampler.process(pcm[pos:pos + block_bytes])
+    resampler.flush()
+    return time.perf_counter() - start
+
+
+def bench_resample(pcm):
+    """
+    44.1 kHz stereo to 16 kHz mono over the whole recording, plus the real
+    time factors of 8 kHz mono and 48 kHz stereo input on its first minute.
+    """
+    def recording(in_rate, channels, data):
+        mono = np.frombuffer(resample.convert(data, RATE, CHANNELS, in_rate), np.int16)
+        return np.repeat(mono[:, None], channels, axis=1).tobytes()
+
+    elapsed = time_conversion(recording(44100, 2, pcm), 44100, 2)
+
+    minute = pcm[:60 * RATE * SAMPLE_WIDTH]
+    minute_s = len(minute) / (RATE * SAMPLE_WIDTH)
+    extra = {}
+    for in_rate, channels in [(8000, 1), (48000, 2)]:
+        seconds = time_conversion(recording(in_rate, channels, minute), in_rate, channels)
+        extra['rtf_{}_{}ch'.format(in_rate, channels)] = seconds / minute_s
+    return elapsed, len(pcm) // (CHUNK * SAMPLE_WIDTH), extra
+
+
+def bench_energy_gate(pcm):
+    """
+    vad_batch.speech_mask with and without the energy gate over the
+    recording with low level noise added, so that the silence is not
+    digital. Reports the gated fraction and how far the segments move.
+    """
+    import webrtcvad
+    rng = np.random.default_rng(0)
+    samples = np.frombuffer(pcm, np.int16) + rng.normal(0, 30, len(pcm) // SAMPLE_WIDTH)
+    samples = np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+    vad_num_frames = vad_batch.vad_buffer_frames(200)
+
+    start = time.perf_counter()
+    plain = vad_batch.speech_mask(samples, webrtcvad.Vad(DETECTION_MODE))
+    plain_s = time.perf_counter() - start
+
+    gate = energy_gate.EnergyGate(webrtcvad.Vad(DETECTION_MODE))
+    start = time.perf_counter()
+    gated = vad_batch.speech_mask(samples, gate)
+    elapsed = time.perf_counter() - start
+
+    plain_segments = vad_batch.find_segments(plain, vad_num_frames)
+    gated_segments = vad_batch.find_segments(gated, vad_num_frames)
+    extra = {'gated_fraction': gate.gated_fraction,
+             'mask_agreement': float(np.mean(plain == gated)),
+             'segments': len(gated_segments),
+             'plain_segments': len(plain_segments),
+             'speedup': plain_s / elapsed}
+    if len(plain_segments) == len(gated_segments) and len(plain_segments):
+        extra['max_boundary_shift_ms'] = (int(np.abs(plain_segments - gated_segments).max()) *
+                                          1000 * CHUNK / RATE)
+    return elapsed, len(samples) // CHUNK, extra
+
+
+def bench_shm_ring(pcm):
+    """
+    VadFilter reading the recording from a ShmCapture ring, written by a
+    capture process as fast as it can. The ring holds the whole recording,
+    so the reader sets the pace; overruns should stay 0.
+    """
+    import functools
+    writer = functools.partial(shm_ring.synthetic_writer, pcm=pcm, realtime=False)
+    capture = shm_ring.ShmCapture(num_slots=len(pcm) // (CHUNK * SAMPLE_WIDTH), writer=writer)
+    with capture as source:
+        vad_filter = AudioStream.VadFilter(source, DETECTION_MODE)
+        start = time.perf_counter()
+        num_segments = sum(1 for _ in vad_filter.voice_segment_collector(200, MAX_SEGMENT_MS))
+        elapsed = time.perf_counter() - start
+    stats = capture.stats
+    return elapsed, stats['read'], {'segments': num_segments, 'overruns': stats['overruns']}
+
+
+BENCHMARKS = [
+    ('vad_buffer', bench_vad_buffer),
+    ('vad_filter', bench_vad_filter),
+    ('vad_batch', bench_vad_batch),
+    ('transcription', bench_transcription),
+    ('worker_pool', bench_worker_pool),
+    ('resample', bench_resample),
+    ('energy_gate', bench_energy_gate),
+    ('shm_ring', bench_shm_ring),
+]
+
+
+def run(minutes, repeat, names=None):
+    pcm = synthetic_recording(minutes)
+    audio_s = len(pcm) / (RATE * SAMPLE_WIDTH)
+
+    results = {}
+    for name, bench in BENCHMARKS:
+        if names and name not in names:
+            continue
+
+        best = None
+        for _ in range(repeat):
+            elapsed, num_frames, extra = bench(pcm)
+            if best is None or elapsed < best[0]:
+                best = (elapsed, num_frames, extra)
+
+        elapsed, num_frames, extra = best
+        result = {'seconds': elapsed,
+                  'audio_s': audio_s,
+                  'frames_per_s': num_frames / elapsed,
+                  'real_time_factor': elapsed / audio_s,
+                  'peak_rss_mb': peak_rss_mb()}
+        result.update(extra)
+        results[name] = result
+        print('{:<14} {:>10.0f} frames/s  rtf {:.5f}'.format(name, result['frames_per_s'],
+                                                             result['real_time_factor']),
+              file=sys.stderr)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    prints the frames/sec of results relative to a baseline run.
+    """
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['frames_per_s'] / baseline[name]['frames_per_s']
+        print('{:<14} {:>10.0f} -> {:>10.0f} frames/s  x{:.2f}'.format(
+            name, baseline[name]['frames_per_s'], result['frames_per_s'], ratio))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the VAD and transcription hot paths.')
+    parser.add_argument('--minutes', type=float, default=10,
+                        help='Length of the synthetic recording in minutes')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per benchmark, the fastest one is reported')
+    parser.add_argument('--only', nargs='*', choices=[name for name, _ in BENCHMARKS],
+                        help='Run only these benchmarks')
+    parser.add_argument('--output',
+                        help='Write the results to this JSON file')
+    parser.add_argument('--compare',
+                        help='JSON file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    # INFO logging (segment and queue reports) is silenced while benchmarking
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = {'revision': git_revision(),
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'minutes': args.minutes,
+              'results': run(args.minutes, args.repeat, args.only)}
+
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(report, fout, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fin:
+            compare(report['results'], json.load(fin)['results'])
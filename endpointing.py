@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Configurable endpointing: when does speech start and end.
+
+    Endpointer has the push interface of AudioStream.VadSegmenter but takes
+    its windows and thresholds from an EndpointConfig: separate onset and
+    offset windows and ratios, pre-roll audio kept before the onset window,
+    a minimum and maximum segment length and an adaptive hangover that
+    shortens the offset window when the stream is quiet.
+    Every segment is reported with how long after the end of speech the
+    offset was declared, the latency traded against truncation.
+"""
+import collections
+import itertools
+
+import metrics
+from audio_defaults import *
+from frame_sources import vad_buffer_frames
+from AudioStream import (UtteranceBuffer, NO_SPEECH, SPEECH_ONSET, SPEECH, SPEECH_OFFSET,
+                         SEGMENT_FULL)
+
+# event of Endpointer.process: the segment ended shorter than
+# min_segment_ms and was dropped
+SEGMENT_DROPPED = 5
+
+OFFSET_LATENCY = metrics.REGISTRY.histogram(
+    'endpoint_offset_latency_seconds', 'Time from the last speech frame to the offset decision')
+ONSET_LATENCY = metrics.REGISTRY.histogram(
+    'endpoint_onset_latency_seconds', 'Time from the first speech frame to the onset decision')
+
+
+class EndpointConfig(object):
+    """
+    endpointing settings, all lengths in ms.
+        onset_window_ms, onset_ratio    - speech starts once more than
+                                          onset_ratio of the window is speech
+        offset_window_ms, offset_ratio  - speech ends once more than
+                                          offset_ratio of the window is not
+        pre_roll_ms                     - audio before the onset window added
+                                          to the segment
+        min_segment_ms                  - shorter segments are dropped
+        max_segment_ms                  - longer segments are cut, None for
+                                          no limit
+        adaptive                        - shrink the offset window down to
+                                          min_offset_window_ms when the speech
+                                          activity of the last adapt_ms falls
+                                          below busy_activity
+    The defaults segment exactly like
+    VadFilter.voice_segment_collector(200, MAX_SEGMENT_MS).
+    """
+    def __init__(self, onset_window_ms=ONSET_WINDOW_MS, onset_ratio=VAD_BUFFER_RATIO,
+                 offset_window_ms=OFFSET_WINDOW_MS, offset_ratio=VAD_BUFFER_RATIO,
+                 pre_roll_ms=PRE_ROLL_MS, min_segment_ms=MIN_SEGMENT_MS,
+                 max_segment_ms=MAX_SEGMENT_MS, adaptive=False,
+                 min_offset_window_ms=MIN_OFFSET_WINDOW_MS, adapt_ms=5000, busy_activity=0.3):
+        for name, ratio in [('onset_ratio', onset_ratio), ('offset_ratio', offset_ratio)]:
+            if not 0 <= ratio < 1:
+                raise(ValueError("invalid {}:{}, should be in [0, 1)".format(name, ratio)))
+
+        self.onset_window_ms = onset_window_ms
+        self.onset_ratio = onset_ratio
+        self.offset_window_ms = offset_window_ms
+        self.offset_ratio = offset_ratio
+        self.pre_roll_ms = pre_roll_ms
+        self.min_segment_ms = min_segment_ms
+        self.max_segment_ms = max_segment_ms
+        self.adaptive = adaptive
+        self.min_offset_window_ms = min_offset_window_ms
+        self.adapt_ms = adapt_ms
+        self.busy_activity = busy_activity
+
+
+class Endpointer(object):
+    """
+    Push based endpointing with an EndpointConfig.
+    process() takes one frame with its vad decision and returns the events
+    of VadSegmenter.process, plus SEGMENT_DROPPED for segments shorter than
+    min_segment_ms. The rest of an utterance cut by max_segment_ms is never
+    dropped, however short. After SPEECH_OFFSET, SEGMENT_FULL, SEGMENT_DROPPED and
+    flush(), segment_info describes the segment:
+        reason            - 'offset', 'full', 'dropped' or 'flush'
+        frames            - frames in the segment
+        duration_ms
+        onset_latency_ms  - first speech frame of the onset window to onset
+        offset_latency_ms - last speech frame to the offset decision
+        hangover_ms       - offset window in use at the offset
+    """
+    __slots__ = ('config', 'frame_ms', 'onset_frames', 'pre_roll_frames', 'max_offset_frames',
+                 'min_offset_frames', 'min_segment_frames', 'max_segment_frames',
+                 'speech_onset', 'utterance', 'num_segment_frames', 'offset_window',
+                 'activity', 'segment_info', '_frames', '_onset_decisions', '_num_onset_speech',
+                 '_offset_decisions', '_frames_since_speech', '_segment_frames',
+                 '_onset_latency', '_activity_alpha', '_continued')
+
+    def __init__(self, config=None, rate=RATE, chunk=CHUNK):
+        config = config if config is not None else EndpointConfig()
+        self.config = config
+        self.frame_ms = 1000 * chunk / rate
+
+        self.onset_frames = max(vad_buffer_frames(config.onset_window_ms, rate, chunk), 1)
+        self.pre_roll_frames = vad_buffer_frames(config.pre_roll_ms, rate, chunk)
+        self.max_offset_frames = max(vad_buffer_frames(config.offset_window_ms, rate, chunk), 1)
+        self.min_offset_frames = self.max_offset_frames
+        if config.adaptive:
+            self.min_offset_frames = min(max(vad_buffer_frames(config.min_offset_window_ms,
+                                                               rate, chunk), 1),
+                                         self.max_offset_frames)
+        self.min_segment_frames = vad_buffer_frames(config.min_segment_ms, rate, chunk)
+        self.max_segment_frames = None
+        if config.max_segment_ms:
+            self.max_segment_frames = vad_buffer_frames(config.max_segment_ms, rate, chunk)
+
+        self._frames = collections.deque(maxlen=self.onset_frames + self.pre_roll_frames)
+        self._onset_decisions = collections.deque(maxlen=self.onset_frames)
+        self._num_onset_speech = 0
+        self._offset_decisions = collections.deque(maxlen=self.max_offset_frames)
+
+        self.speech_onset = False
+        self.utterance = None
+        self.num_segment_frames = 0
+        self.offset_window = self.max_offset_frames
+        self.activity = 0.0
+        self._activity_alpha = min(self.frame_ms / config.adapt_ms, 1.0) if config.adapt_ms else 1.0
+        self.segment_info = None
+        self._frames_since_speech = 0
+        self._segment_frames = 0
+        self._onset_latency = 0
+        # the segment continues an utterance cut by SEGMENT_FULL
+        self._continued = False
+
+    def _adapt(self, is_speech):
+        # speech activity of the last adapt_ms, the hangover scales with it
+        self.activity += self._activity_alpha * (is_speech - self.activity)
+        busy = min(self.activity / self.config.busy_activity, 1.0) if self.config.busy_activity else 1.0
+        self.offset_window = int(round(self.min_offset_frames +
+                                       (self.max_offset_frames - self.min_offset_frames) * busy))
+
+    def _finish(self, reason, offset_latency_frames):
+        self.segment_info = {'reason': reason,
+                             'frames': self._segment_frames,
+                             'duration_ms': self._segment_frames * self.frame_ms,
+                             'onset_latency_ms': self._onset_latency * self.frame_ms,
+                             'offset_latency_ms': offset_latency_frames * self.frame_ms,
+                             'hangover_ms': self.offset_window * self.frame_ms}
+        self._segment_frames = 0
+        self._onset_latency = 0
+        self._continued = reason == 'full'
+
+    def process(self, frame, is_speech):
+        is_speech = 1 if is_speech else 0
+        if self.config.adaptive:
+            self._adapt(is_speech)
+
+        if not self.speech_onset:
+            if len(self._onset_decisions) == self.onset_frames:
+                self._num_onset_speech -= self._onset_decisions[0]
+            self._onset_decisions.append(is_speech)
+            self._num_onset_speech += is_speech
+            self._frames.append(frame)
+
+            if self._num_onset_speech / self.onset_frames > self.config.onset_ratio:
+                self.speech_onset = True
+                # frames from the first speech frame of the window to this one
+                self._onset_latency = len(self._onset_decisions) - 1 - list(self._onset_decisions).index(1)
+                ONSET_LATENCY.observe(self._onset_latency * self.frame_ms / 1000)
+
+                if self.utterance is None:
+                    self.utterance = UtteranceBuffer()
+                for buffered in self._frames:
+                    self.utterance.append(buffered)
+                self.num_segment_frames = len(self._frames)
+                self._segment_frames = len(self._frames)
+                self._frames_since_speech = 0
+
+                self._frames.clear()
+                self._onset_decisions.clear()
+                self._num_onset_speech = 0
+                return SPEECH_ONSET
+            return NO_SPEECH
+
+        if self.utterance is None:
+            self.utterance = UtteranceBuffer()
+        self.utterance.append(frame)
+        self.num_segment_frames += 1
+        self._segment_frames += 1
+        self._frames_since_speech = 0 if is_speech else self._frames_since_speech + 1
+
+        self._offset_decisions.append(is_speech)
+        window = self.offset_window
+        non_speech = window - sum(itertools.islice(reversed(self._offset_decisions), window))
+        # a partially filled window counts its missing frames as speech
+        non_speech -= max(window - len(self._offset_decisions), 0)
+        if non_speech / window > self.config.offset_ratio:
+            self.speech_onset = False
+            self._offset_decisions.clear()
+            OFFSET_LATENCY.observe(self._frames_since_speech * self.frame_ms / 1000)
+
+            if not self._continued and self._segment_frames < self.min_segment_frames:
+                self._finish('dropped', self._frames_since_speech)
+                self.utterance = None
+                return SEGMENT_DROPPED
+            self._finish('offset', self._frames_since_speech)
+            return SPEECH_OFFSET
+
+        if self.max_segment_frames and self.num_segment_frames >= self.max_segment_frames:
+            # force flush, the offset window is kept to find the real offset
+            self.num_segment_frames = 0
+            self._finish('full', 0)
+            return SEGMENT_FULL
+        return SPEECH
+
+    def pop_segment(self):
+        """
+        returns the collected segment as a memoryview of its own buffer.
+        """
+        segment = self.utterance.view()
+        self.utterance = None
+        return segment
+
+    def flush(self):
+        """
+        end of stream: resets the state and returns the unfinished segment,
+        None when there is none.
+        """
+        if self.speech_onset:
+            self._finish('flush', self._frames_since_speech)
+        self.speech_onset = False
+        self._frames.clear()
+        self._onset_decisions.clear()
+        self._num_onset_speech = 0
+        self._offset_decisions.clear()
+
+        if self.utterance is not None and len(self.utterance):
+            return self.pop_segment()
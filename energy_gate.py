@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Energy pre-gate that keeps obvious silence away from webrtcvad.
+
+    EnergyGate wraps a webrtcvad.Vad and has its is_speech method, so it is
+    passed to VadFilter (or vad_batch.speech_mask) as the vad and its
+    decisions reach the VadBuffer like plain vad decisions. Frames whose
+    energy is less than margin_db above a running noise floor are reported
+    as non speech without calling webrtcvad, unless webrtcvad found speech
+    within the last hangover_ms: speech offsets are always decided by it.
+
+    The noise floor follows quieter frames at once and rises by at most
+    floor_rise_db_per_s, so a gate that is wrong only lets more frames
+    through to webrtcvad, it never hides a louder noise floor for long.
+"""
+import math
+
+import numpy as np
+
+import metrics
+from audio_defaults import *
+
+GATE_FRAMES = metrics.REGISTRY.counter('energy_gate_frames_total', 'Frames seen by the energy gate')
+GATE_GATED = metrics.REGISTRY.counter('energy_gate_gated_total',
+                                      'Frames reported as non speech without calling webrtcvad')
+
+
+def energy_db(samples):
+    """
+    mean power of int16 samples in dB, 0 for digital silence.
+    """
+    samples = samples.astype(np.float32)
+    return 10 * math.log10(float(samples @ samples) / len(samples) + 1)
+
+
+class EnergyGate(object):
+    """
+    is_speech(frame, rate) of vad behind an energy gate.
+    num_frames and num_gated count the frames seen and the ones decided
+    without vad, gated_fraction is their ratio.
+    """
+    def __init__(self, vad, margin_db=ENERGY_GATE_MARGIN_DB,
+                 floor_rise_db_per_s=ENERGY_GATE_FLOOR_RISE_DB_PER_S,
+                 warmup_ms=ENERGY_GATE_WARMUP_MS, hangover_ms=ENERGY_GATE_HANGOVER_MS):
+        self.vad = vad
+        self.margin_db = margin_db
+        self.floor_rise_db_per_s = floor_rise_db_per_s
+        self.warmup_ms = warmup_ms
+        self.hangover_ms = hangover_ms
+        self.floor_db = None
+        self.num_frames = 0
+        self.num_gated = 0
+        self._rise_db = 0
+        self._warmup_frames = 0
+        self._hangover_frames = 0
+        # frames left that go to vad after its last speech decision
+        self._hangover = 0
+
+    @property
+    def gated_fraction(self):
+        return self.num_gated / self.num_frames if self.num_frames else 0.0
+
+    def _start(self, num_samples, rate):
+        frame_ms = 1000 * num_samples / rate
+        self._rise_db = self.floor_rise_db_per_s * frame_ms / 1000
+        self._warmup_frames = int(self.warmup_ms / frame_ms)
+        self._hangover_frames = int(math.ceil(self.hangover_ms / frame_ms))
+        self.floor_db = float('inf')
+
+    def _decide(self, frame, rate):
+        is_speech = self.vad.is_speech(frame, rate)
+        if is_speech:
+            self._hangover = self._hangover_frames
+        elif self._hangover:
+            self._hangover -= 1
+        return is_speech
+
+    def is_speech(self, frame, rate):
+        samples = np.frombuffer(frame, np.int16)
+        if self.floor_db is None:
+            self._start(len(samples), rate)
+
+        level_db = energy_db(samples)
+        self.floor_db = min(level_db, self.floor_db + self._rise_db)
+        self.num_frames += 1
+        GATE_FRAMES.inc()
+
+        if (self.num_frames > self._warmup_frames and not self._hangover and
+                level_db < self.floor_db + self.margin_db):
+            self.num_gated += 1
+            GATE_GATED.inc()
+            return False
+        return self._decide(frame, rate)
+
+    def speech_mask(self, samples, rate=RATE, chunk=CHUNK):
+        """
+        vad decisions of every chunk sized frame of the int16 samples, with
+        the frame energies and noise floors computed for all frames at once.
+        Continues the state of previous calls and decides exactly like
+        is_speech for the same frames.
+        """
+        samples = np.ascontiguousarray(samples, dtype=np.int16)
+        num_frames = len(samples) // chunk
+        mask = np.zeros(num_frames, dtype=bool)
+        if num_frames == 0:
+            return mask
+        if self.floor_db is None:
+            self._start(chunk, rate)
+
+        frames = samples[:num_frames * chunk].reshape(num_frames, chunk).astype(np.float32)
+        levels = 10 * np.log10(np.einsum('ij,ij->i', frames, frames).astype(np.float64) / chunk + 1)
+
+        # floor[i] = min(levels[i], floor[i-1] + rise), unrolled into
+        # rise * i + the running minimum of levels[j] - rise * j
+        ramp = self._rise_db * np.arange(num_frames)
+        floors = np.minimum.accumulate(np.concatenate(([self.floor_db + self._rise_db],
+                                                       levels - ramp)))[1:] + ramp
+        self.floor_db = float(floors[-1])
+
+        index = self.num_frames + np.arange(1, num_frames + 1)
+        loud = (index <= self._warmup_frames) | (levels >= floors + self.margin_db)
+        self.num_frames += num_frames
+
+        # the hangover depends on the vad decisions, only that part is a loop
+        data = memoryview(samples[:num_frames * chunk]).cast('B')
+        frame_bytes = chunk * SAMPLE_WIDTH
+        num_gated = 0
+        for i in range(num_frames):
+            if loud[i] or self._hangover:
+                mask[i] = self._decide(data[i * frame_bytes:(i + 1) * frame_bytes], rate)
+            else:
+                num_gated += 1
+
+        self.num_gated += num_gated
+        GATE_FRAMES.inc(num_frames)
+        GATE_GATED.inc(num_gated)
+        return mask
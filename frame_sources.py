@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Offline frame sources for VadFilter.
+
+    Every source here implements the same small interface VadFilter uses on
+    AudioStream (get_rate, get_chunk, is_active, get_frame), so recorded
+    audio can be segmented without a sound card and as fast as the CPU
+    allows: get_frame never waits on a queue timeout.
+"""
+import sys
+import wave
+import mmap
+import struct
+
+from audio_defaults import *
+
+# pages of a MappedWaveSource behind the read position are given back to
+# the OS every this many bytes
+MAPPED_RELEASE_BYTES = 16 * 1024 * 1024
+
+
+def vad_buffer_frames(vad_buffer_ms, rate=RATE, chunk=CHUNK):
+    """
+    number of frames in a vad buffer of vad_buffer_ms.
+    """
+    frame_ms = (1/rate ) * chunk * 1000
+    return int(vad_buffer_ms / frame_ms)
+
+
+class FrameSource(object):
+    """
+        base class of the offline frame sources.
+        Subclasses implement _read(num_bytes) returning up to num_bytes of
+        16 bit mono PCM, and an empty result once the data is exhausted.
+        A trailing partial frame is dropped since webrtcvad only accepts
+        frames of exactly 10, 20 or 30 ms.
+    """
+    def __init__(self, rate=RATE, chunk=CHUNK):
+        self._rate = rate
+        self._chunk = chunk
+        self._frame_bytes = chunk * SAMPLE_WIDTH * CHANNELS
+        self._exhausted = False
+        self.closed = True
+
+    def get_rate(self):
+        return self._rate
+
+    def get_chunk(self):
+        return self._chunk
+
+    def __enter__(self):
+        self.closed = False
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    def start_stream(self):
+        self.closed = False
+
+    def stop_stream(self):
+        self.closed = True
+
+    def is_active(self):
+        return not self.closed and not self._exhausted
+
+    def get_frame(self):
+        if self.closed or self._exhausted:
+            return None
+
+        frame = self._read(self._frame_bytes)
+        if len(frame) < self._frame_bytes:
+            self._exhausted = True
+            return None
+        return frame
+
+    def _read(self, num_bytes):
+        raise NotImplementedError
+
+
+class WaveFileSource(FrameSource):
+    """
+        frames from a 16 bit mono WAV file, read chunk by chunk.
+        The source rate is taken from the file header.
+    """
+    def __init__(self, file_name, chunk=CHUNK):
+        self._wave = wave.open(file_name, 'rb')
+        if self._wave.getsampwidth() != SAMPLE_WIDTH or self._wave.getnchannels() != CHANNELS:
+            self._wave.close()
+            raise(ValueError("{}: expected {} byte samples with {} channel(s)".
+                             format(file_name, SAMPLE_WIDTH, CHANNELS)))
+
+        super(WaveFileSource, self).__init__(self._wave.getframerate(), chunk)
+
+    def _read(self, num_bytes):
+        return self._wave.readframes(num_bytes // SAMPLE_WIDTH)
+
+    def close(self):
+        super(WaveFileSource, self).close()
+        self._wave.close()
+
+
+class PcmStreamSource(FrameSource):
+    """
+        frames from a raw 16 bit mono PCM byte stream such as a pipe or
+        stdin (the default). The stream is read until EOF and is not closed
+        by the source.
+    """
+    def __init__(self, stream=None, rate=RATE, chunk=CHUNK):
+        super(PcmStreamSource, self).__init__(rate, chunk)
+        self._stream = stream if stream is not None else sys.stdin.buffer
+
+    def _read(self, num_bytes):
+        # raw (unbuffered) streams may return short reads before EOF
+        data = self._stream.read(num_bytes)
+        while data and len(data) < num_bytes:
+            more = self._stream.read(num_bytes - len(data))
+            if not more:
+                break
+            data += more
+        return data or b''
+
+
+class BytesSource(FrameSource):
+    """
+        frames from an in-memory bytes-like PCM buffer.
+        Frames are handed out as memoryview slices, no data is copied.
+    """
+    def __init__(self, data, rate=RATE, chunk=CHUNK):
+        super(BytesSource, self).__init__(rate, chunk)
+        self._data = memoryview(data).cast('B')
+        self._pos = 0
+
+    def _read(self, num_bytes):
+        frame = self._data[self._pos:self._pos + num_bytes]
+        self._pos += len(frame)
+        return frame
+
+
+def wav_data_chunk(fileobj):
+    """
+    parses the RIFF header of a WAV file and returns
+    (rate, channels, sample_width, data_offset, data_size).
+    A data size beyond the end of the file, as left by recorders that were
+    killed, is clamped to the file size.
+    """
+    fileobj.seek(0, 2)
+    file_size = fileobj.tell()
+    fileobj.seek(0)
+
+    riff, _, wave_id = struct.unpack('<4sI4s', fileobj.read(12))
+    if riff != b'RIFF' or wave_id != b'WAVE':
+        raise(ValueError("not a RIFF WAVE file"))
+
+    fmt = None
+    while True:
+        header = fileobj.read(8)
+        if len(header) < 8:
+            raise(ValueError("no data chunk"))
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+        if chunk_id == b'fmt ':
+            format_tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', fileobj.read(16))
+            if format_tag not in (1, 0xFFFE):
+                raise(ValueError("unsupported WAV format tag {}".format(format_tag)))
+            fmt = (rate, channels, bits // 8)
+            chunk_size -= 16
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise(ValueError("data chunk before fmt chunk"))
+            data_offset = fileobj.tell()
+            data_size = min(chunk_size, file_size - data_offset)
+            return fmt + (data_offset, data_size)
+
+        # chunks are padded to an even size
+        fileobj.seek(chunk_size + (chunk_size & 1), 1)
+
+
+class MappedWaveSource(BytesSource):
+    """
+        frames from a 16 bit mono WAV file memory mapped instead of read.
+        Frames are memoryview slices of the mapping, and samples is the
+        whole data chunk as an int16 NumPy view, so very large recordings
+        are never loaded into memory. Pages behind the read position are
+        released every MAPPED_RELEASE_BYTES, memory use stays flat over
+        the file.
+    """
+    def __init__(self, file_name, chunk=CHUNK):
+        with open(file_name, 'rb') as fin:
+            rate, channels, sample_width, data_offset, data_size = wav_data_chunk(fin)
+            if sample_width != SAMPLE_WIDTH or channels != CHANNELS:
+                raise(ValueError("{}: expected {} byte samples with {} channel(s)".
+                                 format(file_name, SAMPLE_WIDTH, CHANNELS)))
+            self._mmap = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if hasattr(self._mmap, 'madvise'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+        data_size -= data_size % SAMPLE_WIDTH
+        self._data_offset = data_offset
+        data = memoryview(self._mmap)[data_offset:data_offset + data_size]
+        super(MappedWaveSource, self).__init__(data, rate, chunk)
+        self._released = 0
+
+    @property
+    def samples(self):
+        import numpy as np
+        return np.frombuffer(self._data, np.int16)
+
+    def _read(self, num_bytes):
+        frame = super(MappedWaveSource, self)._read(num_bytes)
+        if self._pos - self._released >= MAPPED_RELEASE_BYTES:
+            self._release(self._pos)
+        return frame
+
+    def _release(self, pos):
+        # the pages are read back from the file if they are touched again
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        start = (self._data_offset + self._released) // mmap.PAGESIZE * mmap.PAGESIZE
+        end = (self._data_offset + pos) // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > start:
+            self._mmap.madvise(mmap.MADV_DONTNEED, start, end - start)
+        self._released = pos
+
+    def close(self):
+        super(MappedWaveSource, self).close()
+        self._data.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # views of the mapping are still in use, it is closed with them
+            pass
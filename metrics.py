@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Latency and throughput metrics of the capture, VAD and inference stages.
+
+    Counters, gauges and histograms live in a Registry, REGISTRY is the one
+    the stages report to. The registry is the in-process sink; its snapshot
+    can also be written periodically as JSON lines (JsonLinesSink) or served
+    in the Prometheus text format on a local port (PrometheusExporter).
+"""
+import bisect
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# default histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# buckets of real time factors (processing time / audio time)
+RATIO_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class Counter(object):
+    """
+    monotonically increasing count.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Gauge(object):
+    """
+    value that goes up and down. With fn the value is read from fn() when
+    the gauge is read, e.g. the depth of a queue.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help='', fn=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self._value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram(object):
+    """
+    distribution of observed values over fixed buckets, bucket i counts the
+    values <= buckets[i] and greater than buckets[i-1].
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help='', buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # the last count is the +Inf bucket
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def sum(self):
+        return self._sum
+
+    def quantile(self, q):
+        """
+        upper bound of the bucket holding the q quantile, None when empty.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = []
+            running = 0
+            for count in self._counts:
+                running += count
+                cumulative.append(running)
+            return {'count': self._count,
+                    'sum': self._sum,
+                    'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], cumulative))}
+
+
+class Registry(object):
+    """
+    named metrics. Asking twice for the same name returns the same metric.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise(ValueError("metric {} is a {}".format(name, metric.kind)))
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help='', fn=None):
+        gauge = self._get(Gauge, name, help)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help='', buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics()}
+
+
+# registry the capture, VAD and inference stages report to
+REGISTRY = Registry()
+
+# counted by every VAD path: VadFilter, async, multi stream and vad_batch
+VAD_CALLS = REGISTRY.counter('vad_calls_total', 'Frames passed to webrtcvad is_speech')
+
+
+def prometheus_text(registry=REGISTRY):
+    """
+    registry in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry.metrics():
+        if metric.help:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+
+        if metric.kind == 'histogram':
+            snapshot = metric.snapshot()
+            for bound, count in snapshot['buckets'].items():
+                lines.append('{}_bucket{{le="{}"}} {}'.format(metric.name, bound, count))
+            lines.append('{}_sum {}'.format(metric.name, snapshot['sum']))
+            lines.append('{}_count {}'.format(metric.name, snapshot['count']))
+        else:
+            lines.append('{} {}'.format(metric.name, metric.snapshot()))
+    return '\n'.join(lines) + '\n'
+
+
+class JsonLinesSink(object):
+    """
+    writes a timestamped registry snapshot as one JSON line to stream every
+    interval seconds from a background thread, and once more on stop().
+    """
+    def __init__(self, stream, interval=10.0, registry=REGISTRY):
+        self.stream = stream
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self):
+        line = {'time': time.time()}
+        line.update(self.registry.snapshot())
+        self.stream.write(json.dumps(line) + '\n')
+        self.stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-jsonl', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
+
+
+class PrometheusExporter(object):
+    """
+    serves prometheus_text(registry) on http://host:port/metrics from a
+    background thread. Port 0 picks a free port, see server_address.
+    """
+    def __init__(self, port, host='127.0.0.1', registry=REGISTRY):
+        self.registry = registry
+        exporter = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(exporter.registry).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def server_address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='metrics-http', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
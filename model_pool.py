@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Pool of preloaded model instances shared by worker threads.
+
+    A deepspeech.Model must not decode two segments at once, so every
+    concurrent request needs an instance of its own. ModelPool holds K
+    speech2text-like instances, possibly of different models or decoder
+    settings, each with a set of tags such as a language or a domain.
+    Requests check out an idle instance carrying the requested tag, wait
+    while all of them are busy and give it back when done. The pool keeps
+    the queue wait of the requests and the busy time of every instance.
+"""
+import collections
+import contextlib
+import threading
+
+from timeit import default_timer as timer
+
+import audio_defaults
+import metrics
+
+POOL_WAIT = metrics.REGISTRY.histogram(
+    'model_pool_wait_seconds', 'Time a request waited for an idle model instance')
+
+
+class PoolInstance(object):
+    """
+    one recognizer of a ModelPool and its usage.
+    """
+    def __init__(self, index, recognizer, tags):
+        self.index = index
+        self.recognizer = recognizer
+        self.tags = frozenset(tags)
+        self.num_requests = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.busy_since = None
+
+
+class ModelPool(object):
+    """
+    Routes requests to the idle instance with the requested tag.
+    checkout(tag) picks, among the idle instances with tag (any instance
+    without tag), the one with the fewest tags, so requests that could run
+    anywhere leave the specialized instances free, and among those the one
+    idle the longest. detect_buffer(audio_buffer, tag) has the signature of
+    speech2text.detect_buffer, a pool can stand in for a recognizer.
+    """
+    def __init__(self):
+        self.instances = []
+        self._idle = collections.deque()
+        self._cond = threading.Condition()
+        self._started = timer()
+        self._num_waiting = 0
+        metrics.REGISTRY.gauge('model_pool_busy_instances', 'Model instances decoding a segment',
+                               fn=lambda: len(self.instances) - len(self._idle))
+        metrics.REGISTRY.gauge('model_pool_waiting_requests', 'Requests waiting for a model instance',
+                               fn=lambda: self._num_waiting)
+
+    def __len__(self):
+        return len(self.instances)
+
+    @property
+    def tags(self):
+        return frozenset().union(*(instance.tags for instance in self.instances))
+
+    def add(self, recognizer, tags=()):
+        """
+        adds a loaded (or loading) recognizer, returns its PoolInstance.
+        """
+        with self._cond:
+            instance = PoolInstance(len(self.instances), recognizer, tags)
+            self.instances.append(instance)
+            self._idle.append(instance)
+            self._cond.notify_all()
+        return instance
+
+    def load(self, model, alphabet, lm=None, trie=None, tags=(), instances=1, cache=None,
+             beam_width=audio_defaults.BEAM_WIDTH, lm_weight=audio_defaults.LM_WEIGHT,
+             valid_word_count_weight=audio_defaults.VALID_WORD_COUNT_WEIGHT):
+        """
+        adds instances speech2text instances of a model, loaded in the
+        background. Requests routed to them wait until they are loaded.
+        """
+        # speech2text imports deepspeech on use, the pool works without it
+        import speech2text
+
+        added = []
+        for _ in range(instances):
+            stt = speech2text.speech2text(cache=cache, beam_width=beam_width, lm_weight=lm_weight,
+                                          valid_word_count_weight=valid_word_count_weight)
+            stt.load_model_async(model, alphabet, lm, trie)
+            added.append(self.add(stt, tags))
+        return added
+
+    def wait_ready(self, timeout=None):
+        """
+        waits for the instances loading in the background, False on timeout.
+        """
+        deadline = None if timeout is None else timer() + timeout
+        for instance in self.instances:
+            wait_ready = getattr(instance.recognizer, 'wait_ready', None)
+            if wait_ready is None:
+                continue
+            remaining = None if deadline is None else max(deadline - timer(), 0)
+            if not wait_ready(remaining):
+                return False
+        return True
+
+    def _pick(self, tag):
+        best = None
+        for instance in self._idle:
+            if tag is not None and tag not in instance.tags:
+                continue
+            if best is None or len(instance.tags) < len(best.tags):
+                best = instance
+        return best
+
+    def acquire(self, tag=None, timeout=None):
+        """
+        checks out an idle instance with tag, waiting at most timeout
+        seconds for one. Raises ValueError when no instance has tag and
+        TimeoutError when none became idle in time.
+        """
+        start = timer()
+        with self._cond:
+            if tag is not None and tag not in self.tags:
+                raise(ValueError("no model instance with tag {!r}, tags are {}".
+                                 format(tag, sorted(self.tags))))
+            if not self.instances:
+                raise(ValueError("the pool has no model instances"))
+
+            self._num_waiting += 1
+            try:
+                instance = self._pick(tag)
+                while instance is None:
+                    remaining = None if timeout is None else timeout - (timer() - start)
+                    if remaining is not None and remaining <= 0:
+                        raise(TimeoutError("no idle model instance with tag {!r} after {}s".
+                                           format(tag, timeout)))
+                    self._cond.wait(remaining)
+                    instance = self._pick(tag)
+            finally:
+                self._num_waiting -= 1
+
+            self._idle.remove(instance)
+            now = timer()
+            instance.num_requests += 1
+            instance.wait_seconds += now - start
+            instance.busy_since = now
+        POOL_WAIT.observe(now - start)
+        return instance
+
+    def release(self, instance):
+        with self._cond:
+            instance.busy_seconds += timer() - instance.busy_since
+            instance.busy_since = None
+            self._idle.append(instance)
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def checkout(self, tag=None, timeout=None):
+        """
+        with pool.checkout('de') as recognizer: ... holds an instance for
+        the block.
+        """
+        instance = self.acquire(tag, timeout)
+        try:
+            yield instance.recognizer
+        finally:
+            self.release(instance)
+
+    def detect_buffer(self, audio_buffer, tag=None):
+        with self.checkout(tag) as recognizer:
+            return recognizer.detect_buffer(audio_buffer)
+
+    @property
+    def stats(self):
+        """
+        usage per instance: requests served, their total and mean queue
+        wait, busy time and utilization (busy time / pool lifetime).
+        """
+        with self._cond:
+            now = timer()
+            elapsed = now - self._started
+            stats = []
+            for instance in self.instances:
+                busy = instance.busy_seconds
+                if instance.busy_since is not None:
+                    busy += now - instance.busy_since
+                stats.append({'instance': instance.index,
+                              'tags': sorted(instance.tags),
+                              'requests': instance.num_requests,
+                              'wait_s': instance.wait_seconds,
+                              'mean_wait_s': (instance.wait_seconds / instance.num_requests
+                                              if instance.num_requests else 0.0),
+                              'busy_s': busy,
+                              'utilization': busy / elapsed if elapsed > 0 else 0.0})
+            return stats
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Multiplexed VAD segmentation of many concurrent channels in one process.
+
+    Frames arrive interleaved and tagged with a channel id. Every channel
+    keeps its own webrtcvad.Vad, which adapts to its input, and its own
+    VadSegmenter, so each channel is segmented exactly like a single
+    VadFilter.voice_segment_collector would segment it.
+"""
+import webrtcvad
+
+from audio_defaults import *
+from AudioStream import VadSegmenter, SPEECH_OFFSET, SEGMENT_FULL
+from metrics import VAD_CALLS
+from energy_gate import EnergyGate
+from frame_sources import vad_buffer_frames
+
+
+class _Channel(object):
+    __slots__ = ('vad', 'segmenter')
+
+    def __init__(self, vad, segmenter):
+        self.vad = vad
+        self.segmenter = segmenter
+
+
+class MultiStreamSegmenter(object):
+    """
+    Segments interleaved frames of many channels.
+    Channels are created on their first frame and hold only the vad state,
+    a VadBuffer ring of vad_buffer_ms and, during speech, the utterance.
+    All channels share rate, chunk, mode and buffer settings. With
+    energy_gate, every channel puts an energy_gate.EnergyGate with its own
+    noise floor in front of its vad.
+    """
+    def __init__(self, vad_buffer_ms, mode=DETECTION_MODE, rate=RATE, chunk=CHUNK,
+                 max_segment_ms=None, energy_gate=False):
+        if(mode not in [0,1,2,3]):
+            raise(ValueError("invalid mode:{}, should be [0,1,2,3]".format(mode)))
+
+        self.mode = mode
+        self.rate = rate
+        self.energy_gate = energy_gate
+        self.vad_num_frames = vad_buffer_frames(vad_buffer_ms, rate, chunk)
+        self.max_segment_frames = None
+        if max_segment_ms:
+            self.max_segment_frames = vad_buffer_frames(max_segment_ms, rate, chunk)
+
+        self.frame_bytes = chunk * SAMPLE_WIDTH
+        self.channels = {}
+
+    def _channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            segmenter = VadSegmenter(self.vad_num_frames, VAD_BUFFER_RATIO,
+                                     max_segment_frames=self.max_segment_frames,
+                                     frame_bytes=self.frame_bytes)
+            vad = webrtcvad.Vad(self.mode)
+            if self.energy_gate:
+                vad = EnergyGate(vad)
+            channel = _Channel(vad, segmenter)
+            self.channels[channel_id] = channel
+        return channel
+
+    def process(self, channel_id, frame):
+        """
+        pushes one frame of a channel, returns the finished segment of the
+        channel or None.
+        """
+        channel = self._channel(channel_id)
+        event = channel.segmenter.process(frame, channel.vad.is_speech(frame, self.rate))
+        VAD_CALLS.inc()
+        if event == SPEECH_OFFSET or event == SEGMENT_FULL:
+            return channel.segmenter.pop_segment()
+
+    def segment_collector(self, tagged_frames):
+        """
+        consumes (channel_id, frame) tuples and yields (channel_id, segment)
+        events as segments finish. Open segments of all channels are flushed
+        when tagged_frames ends.
+        """
+        for channel_id, frame in tagged_frames:
+            segment = self.process(channel_id, frame)
+            if segment is not None:
+                yield channel_id, segment
+
+        for channel_id in list(self.channels):
+            segment = self.close_channel(channel_id)
+            if segment:
+                yield channel_id, segment
+
+    def close_channel(self, channel_id):
+        """
+        forgets a channel and returns its unfinished segment, if any.
+        """
+        channel = self.channels.pop(channel_id, None)
+        if channel is not None:
+            return channel.segmenter.flush()
+
+    def __len__(self):
+        return len(self.channels)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Parallel transcription of the segments of one long recording.
+
+    The file is cut into VAD segments as it is read, the segments are
+    decoded concurrently by several loaded models, threads sharing
+    speech2text-like recognizers or worker processes with one model each,
+    and the transcripts are put back in time order. Every result carries the
+    start and end time of its segment and is handed out as soon as all
+    earlier segments are done, so the transcript streams in order while the
+    rest of the file is still decoded.
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import os
+import argparse
+import json
+import threading
+
+from timeit import default_timer as timer
+
+import backends
+from audio_defaults import *
+from pipeline import TranscriptionPipeline, BLOCK
+
+# vad buffer of the segmentation, as in speech2text.detect_file
+SEGMENT_VAD_BUFFER_MS = 200
+
+# segments cut but not yet transcribed, per worker
+PENDING_SEGMENTS_PER_WORKER = 4
+
+
+def timed_segments(file_name, vad_buffer_ms=SEGMENT_VAD_BUFFER_MS, max_segment_ms=MAX_SEGMENT_MS,
+                   mode=DETECTION_MODE):
+    """
+    yields (index, start_s, end_s, segment) for every VAD segment of a WAV
+    file, segment is its 16 kHz mono PCM as bytes.
+    """
+    # AudioStream pulls in the capture stack, import it on use
+    from AudioStream import VadFilter
+    from resample import open_wave_source
+
+    with open_wave_source(file_name) as source:
+        vad_filter = VadFilter(source, mode)
+        segments = vad_filter.speech_segment_collector(vad_buffer_ms, max_segment_ms)
+        for index, segment in enumerate(segments):
+            yield index, segment.start_s, segment.end_s, bytes(segment)
+
+
+def in_order(results, first_index=0):
+    """
+    takes (index, item) pairs in any order and yields them in index order,
+    each as soon as all pairs before it arrived. Pairs after a missing
+    index are yielded at the end.
+    """
+    pending = {}
+    next_index = first_index
+    for index, item in results:
+        pending[index] = item
+        while next_index in pending:
+            yield next_index, pending.pop(next_index)
+            next_index += 1
+
+    for index in sorted(pending):
+        yield index, pending[index]
+
+
+def transcribe_segments(segments, recognizers, queue_size=None):
+    """
+    transcribes (index, start_s, end_s, segment) tuples on one thread per
+    recognizer and yields result dicts in time order:
+        segment, start_s, end_s, text
+    text is None when inference failed. recognizers are speech2text-like
+    objects, one per thread, or a model_pool.ModelPool repeated.
+    """
+    queue_size = queue_size or PENDING_SEGMENTS_PER_WORKER * len(recognizers)
+    times = {}
+
+    def audio():
+        for index, start_s, end_s, segment in segments:
+            times[index] = (start_s, end_s)
+            yield segment
+
+    # blocking queue: every segment is transcribed, segmentation waits for
+    # the workers once queue_size segments are pending
+    pipeline = TranscriptionPipeline(recognizers, queue_size, BLOCK)
+    for index, speech_text in in_order(pipeline.run(audio())):
+        start_s, end_s = times.pop(index)
+        yield {'segment': index, 'start_s': start_s, 'end_s': end_s, 'text': speech_text}
+
+
+def transcribe_file(file_name, recognizers, vad_buffer_ms=SEGMENT_VAD_BUFFER_MS,
+                    max_segment_ms=MAX_SEGMENT_MS):
+    """
+    transcribes the segments of file_name with recognizers on threads,
+    yields the result dicts of transcribe_segments in time order.
+    """
+    segments = timed_segments(file_name, vad_buffer_ms, max_segment_ms)
+    for result in transcribe_segments(segments, recognizers):
+        result['file'] = file_name
+        yield result
+
+
+def transcribe_file_processes(file_name, workers, model, alphabet, lm=None, trie=None,
+                              vad_buffer_ms=SEGMENT_VAD_BUFFER_MS, max_segment_ms=MAX_SEGMENT_MS,
+                              cache_path=None, preload=False, backend=None):
+    """
+    transcribes the segments of file_name on workers processes, each
+    loading the model once or, with preload, forked from this process after
+    it loaded the model, and yields the batch_transcribe segment result
+    dicts in time order, with start_s and end_s added.
+    backend is a backends.parse_backend spec, DeepSpeech by default.
+    """
+    # the worker functions are shared with batch transcription
+    import batch_transcribe
+
+    # bounds the segments held in memory while the workers are busy
+    pending = threading.Semaphore(PENDING_SEGMENTS_PER_WORKER * workers)
+    stopped = threading.Event()
+    times = {}
+
+    def tasks():
+        for index, start_s, end_s, segment in timed_segments(file_name, vad_buffer_ms,
+                                                             max_segment_ms):
+            # runs on the task thread of the pool, which must see the stop
+            while not pending.acquire(timeout=0.1):
+                if stopped.is_set():
+                    return
+            times[index] = (start_s, end_s)
+            yield file_name, index, segment
+
+    def completed(results):
+        for result in results:
+            pending.release()
+            yield result['segment'], result
+
+    with batch_transcribe.worker_pool(workers, model, alphabet, lm, trie, cache_path,
+                                      preload, backend) as pool:
+        try:
+            results = pool.imap_unordered(batch_transcribe.transcribe_segment, tasks())
+            for index, result in in_order(completed(results)):
+                result['start_s'], result['end_s'] = times.pop(index)
+                yield result
+        finally:
+            stopped.set()
+
+
+def main(args):
+    start = timer()
+    if args.threads:
+        # AudioStream pulls in the capture stack, import it on use
+        from AudioStream import load_recognizers
+        recognizers = load_recognizers(args.workers, args.model, args.alphabet, args.lm,
+                                       args.trie, background=True,
+                                       backend=backends.parse_backend(args.backend))
+        results = transcribe_file(args.audio, recognizers, args.vad_buffer_ms)
+    else:
+        results = transcribe_file_processes(args.audio, args.workers, args.model, args.alphabet,
+                                            args.lm, args.trie, args.vad_buffer_ms,
+                                            cache_path=args.cache, preload=args.prefork,
+                                            backend=args.backend)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    num_results = 0
+    try:
+        for result in results:
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            num_results += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print('transcribed {} segments on {} workers in {:.3f}s'.format(num_results, args.workers,
+                                                                     timer() - start),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parallel DeepSpeech transcription of one WAV file.')
+    parser.add_argument('audio',
+                        help='Path to the WAV file')
+    parser.add_argument('--output', required=False,
+                        help='Path to the JSON lines result file, stdout by default')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of models decoding segments at the same time')
+    parser.add_argument('--threads', action='store_true',
+                        help='Decode on threads of this process instead of worker processes')
+    parser.add_argument('--vad-buffer-ms', type=int, default=SEGMENT_VAD_BUFFER_MS,
+                        help='VAD buffer length used to cut the file into segments')
+    parser.add_argument('--cache', required=False,
+                        help='SQLite file caching transcripts by audio content (worker processes)')
+    parser.add_argument('--prefork', action='store_true',
+                        help='Load the model once and fork the worker processes from the loaded process')
+    parser.add_argument('--backend', default='deepspeech',
+                        help='Inference backend: deepspeech, or fake:rtf=0.3,fixed_s=0.05,text=... '
+                             'to load test without a model')
+    parser.add_argument('--model', required=False,
+                        help='Path to the model (protocol buffer binary file)')
+    parser.add_argument('--alphabet', required=False,
+                        help='Path to the configuration file specifying the alphabet used by the network')
+    parser.add_argument('--lm', nargs='?',
+                        help='Path to the language model binary file')
+    parser.add_argument('--trie', nargs='?',
+                        help='Path to the language model trie file created with native_client/generate_trie')
+
+    args = parser.parse_args()
+    try:
+        backends.parse_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.backend == 'deepspeech' and (args.model is None or args.alphabet is None):
+        parser.error('--model and --alphabet are required by the deepspeech backend')
+    main(args)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Producer/consumer pipeline that decouples VAD segmentation from inference.
+
+    Segmentation runs on its own thread so the audio data queue keeps being
+    drained while the models decode. Segments reach a pool of inference
+    workers through a BoundedQueue whose backpressure policy decides what
+    happens when inference falls behind.
+"""
+import queue
+import threading
+import logging
+import time
+
+from timeit import default_timer as timer
+
+import metrics
+
+OFFSET_TO_TRANSCRIPT = metrics.REGISTRY.histogram(
+    'speech_offset_to_transcript_seconds', 'Time from speech offset to the transcript')
+CAPTURE_TO_TRANSCRIPT = metrics.REGISTRY.histogram(
+    'capture_to_transcript_seconds', 'Wall-clock time from capturing the last frame of an '
+    'utterance to its transcript')
+
+# backpressure policies of BoundedQueue
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+# max number of segments waiting for an inference worker
+SEGMENT_QUEUE_MAX_SIZE = 8
+
+# end of input marker for the inference workers
+_STOP = object()
+
+
+class BoundedQueue(queue.Queue):
+    """
+    queue.Queue with a backpressure policy applied when it is full:
+        block       - put waits for free space (plain queue.Queue behaviour)
+        drop-oldest - the oldest item is discarded to make space
+        drop-newest - the new item is discarded
+    num_queued and num_dropped count the items accepted and discarded.
+    A maxsize of 0 is unbounded and never drops.
+    """
+    def __init__(self, maxsize=0, policy=BLOCK):
+        if(policy not in POLICIES):
+            raise(ValueError("invalid policy:{}, should be one of {}".format(policy, POLICIES)))
+
+        super(BoundedQueue, self).__init__(maxsize)
+        self.policy = policy
+        self.num_queued = 0
+        self.num_dropped = 0
+
+    def put(self, item, block=True, timeout=None, policy=None):
+        """
+        puts item with the queue policy, or with policy when given.
+        Returns False when the item was dropped.
+        """
+        policy = policy or self.policy
+
+        if policy == BLOCK:
+            super(BoundedQueue, self).put(item, block, timeout)
+            with self.mutex:
+                self.num_queued += 1
+            return True
+
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self.num_dropped += 1
+                if policy == DROP_NEWEST:
+                    return False
+                self._get()
+                self.unfinished_tasks -= 1
+
+            self._put(item)
+            self.num_queued += 1
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+        return True
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def set_maxsize(self, maxsize):
+        """
+        changes the size limit, 0 for unbounded. Items above a smaller
+        limit stay queued; puts drop or block until the queue is below it.
+        """
+        with self.mutex:
+            self.maxsize = maxsize
+            self.not_full.notify_all()
+
+    @property
+    def stats(self):
+        with self.mutex:
+            return {'queued': self.num_queued,
+                    'dropped': self.num_dropped,
+                    'depth': self._qsize()}
+
+
+class TranscriptionPipeline(object):
+    """
+    Runs segmentation and inference concurrently.
+    recognizers are speech2text-like objects with a detect_buffer method, one
+    per inference worker thread since a single model must not decode two
+    segments at once.
+    """
+    def __init__(self, recognizers, queue_size=SEGMENT_QUEUE_MAX_SIZE, policy=BLOCK):
+        if not recognizers:
+            raise(ValueError("at least one recognizer is required"))
+
+        self.recognizers = list(recognizers)
+        self.segment_q = BoundedQueue(queue_size, policy)
+        self._result_q = queue.Queue()
+        metrics.REGISTRY.gauge('segment_queue_depth', 'Segments waiting for an inference worker',
+                               fn=self.segment_q.qsize)
+        metrics.REGISTRY.gauge('segments_dropped', 'Segments dropped by a full segment queue',
+                               fn=lambda: self.segment_q.num_dropped)
+
+    def _segment_producer(self, segments):
+        try:
+            for index, segment in enumerate(segments):
+                self.segment_q.put((index, segment, timer()))
+        except Exception:
+            logging.exception("segmentation failed")
+        finally:
+            # stop markers are never dropped
+            for _ in self.recognizers:
+                self.segment_q.put(_STOP, policy=BLOCK)
+
+    def _inference_worker(self, recognizer):
+        while True:
+            task = self.segment_q.get()
+            if task is _STOP:
+                break
+
+            index, segment, offset_time = task
+            # SpeechSegment records carry their PCM and capture time
+            capture_time = getattr(segment, 'capture_time', None)
+            try:
+                speech_text = recognizer.detect_buffer(getattr(segment, 'pcm', segment))
+            except Exception:
+                logging.exception("inference failed for segment {}".format(index))
+                speech_text = None
+            OFFSET_TO_TRANSCRIPT.observe(timer() - offset_time)
+            if capture_time is not None:
+                CAPTURE_TO_TRANSCRIPT.observe(time.time() - capture_time)
+            self._result_q.put((index, speech_text))
+
+        self._result_q.put(_STOP)
+
+    def run(self, segments):
+        """
+        consumes the segments iterable on a producer thread and yields
+        (segment_index, speech_text) in completion order. Indexes of dropped
+        segments never show up. Segments are bytes-like PCM or SpeechSegment
+        records, whose capture to transcript latency is recorded as well.
+        """
+        threads = [threading.Thread(target=self._segment_producer, args=(segments,),
+                                    name='segmentation', daemon=True)]
+        for i, recognizer in enumerate(self.recognizers):
+            threads.append(threading.Thread(target=self._inference_worker, args=(recognizer,),
+                                            name='inference-{}'.format(i), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        running = len(self.recognizers)
+        while running:
+            result = self._result_q.get()
+            if result is _STOP:
+                running -= 1
+                continue
+            yield result
+
+        for thread in threads:
+            thread.join()
+
+    @property
+    def stats(self):
+        return self.segment_q.stats
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Worker process pools with a readiness handshake, optionally preforked.
+
+    A worker pool where every process loads the model itself pays the model
+    and LM load time and memory once per worker. PreforkPool can instead run
+    a preload function once in the parent, e.g. loading the model and LM,
+    and then fork the workers: they start with the loaded model and share
+    its pages with the parent copy-on-write until a page is written.
+
+    Every worker reports back once its initializer is done, with its pid,
+    startup time and memory (RSS, PSS and private memory on Linux), and the
+    pool only hands out work when all workers are ready. A worker whose
+    initializer fails fails the start.
+"""
+import os
+import time
+import multiprocessing
+import queue
+
+# seconds all workers of a pool have to become ready
+PREFORK_READY_TIMEOUT_S = 600
+
+
+def memory_mb(pid='self'):
+    """
+    rss, pss (shared pages divided among the processes sharing them) and
+    private memory of a process in MB, from /proc/<pid>/smaps_rollup.
+    Empty where that is not available.
+    """
+    fields = {'Rss': 'rss_mb', 'Pss': 'pss_mb', 'Private_Clean': 'private_mb',
+              'Private_Dirty': 'private_mb'}
+    memory = {}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as fin:
+            for line in fin:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    key = fields[name]
+                    memory[key] = memory.get(key, 0.0) + int(value.split()[0]) / 1024
+    except (IOError, ValueError, IndexError):
+        return {}
+    return memory
+
+
+def _ready_initializer(ready, started, initializer, initargs):
+    # runs first thing in every worker of the pool
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+    except Exception as e:
+        ready.put({'pid': os.getpid(), 'error': repr(e)})
+        raise
+    worker = {'pid': os.getpid(), 'startup_s': time.time() - started}
+    worker.update(memory_mb())
+    ready.put(worker)
+
+
+class PreforkPool(object):
+    """
+    multiprocessing.Pool of worker processes that waits until every worker
+    ran initializer(*initargs).
+    With preload, preload(*preload_args) runs in the parent first and the
+    workers are forked from it (fork start method, so not on Windows).
+    After start(), load_s is the preload time, startup_s the time until all
+    workers were ready and workers has the report of every worker.
+        with PreforkPool(4, init_worker, preload=load_model, preload_args=...) as pool:
+            pool.imap_unordered(task, items)
+    """
+    def __init__(self, workers, initializer=None, initargs=(), preload=None, preload_args=(),
+                 ready_timeout=PREFORK_READY_TIMEOUT_S):
+        if workers < 1:
+            raise(ValueError("a pool needs at least one worker, not {}".format(workers)))
+        if preload is not None and 'fork' not in multiprocessing.get_all_start_methods():
+            raise(ValueError("preloading needs the fork start method"))
+        self.num_workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.preload = preload
+        self.preload_args = preload_args
+        self.ready_timeout = ready_timeout
+        self.load_s = 0.0
+        self.startup_s = None
+        self.workers = []
+        self._pool = None
+
+    def start(self):
+        started = time.time()
+        if self.preload is not None:
+            # on the main thread, nothing else may run while forking
+            self.preload(*self.preload_args)
+            self.load_s = time.time() - started
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+
+        ready = context.Queue()
+        self._pool = context.Pool(self.num_workers, initializer=_ready_initializer,
+                                  initargs=(ready, started, self.initializer, self.initargs))
+        try:
+            self._wait_ready(ready, started)
+        except BaseException:
+            self.terminate()
+            raise
+        self.startup_s = time.time() - started
+        return self
+
+    def _wait_ready(self, ready, started):
+        deadline = started + self.ready_timeout
+        while len(self.workers) < self.num_workers:
+            try:
+                worker = ready.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                raise(TimeoutError("{} of {} workers ready after {}s".
+                                   format(len(self.workers), self.num_workers, self.ready_timeout)))
+            if 'error' in worker:
+                raise(RuntimeError("worker {} failed to start: {}".
+                                   format(worker['pid'], worker['error'])))
+            self.workers.append(worker)
+
+    @property
+    def stats(self):
+        """
+        load and startup time, and memory of the workers when they were
+        ready: mean RSS and private memory per worker, total PSS.
+        """
+        stats = {'workers': self.num_workers,
+                 'preforked': self.preload is not None,
+                 'load_s': self.load_s,
+                 'startup_s': self.startup_s,
+                 'max_worker_startup_s': max(w['startup_s'] for w in self.workers)}
+        for key in ['rss_mb', 'private_mb']:
+            values = [worker[key] for worker in self.workers if key in worker]
+            if values:
+                stats['mean_worker_' + key] = sum(values) / len(values)
+        if all('pss_mb' in worker for worker in self.workers):
+            stats['total_worker_pss_mb'] = sum(worker['pss_mb'] for worker in self.workers)
+        return stats
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        return self._pool.imap_unordered(func, iterable, chunksize)
+
+    def imap(self, func, iterable, chunksize=1):
+        return self._pool.imap(func, iterable, chunksize)
+
+    def close(self):
+        self._pool.close()
+
+    def terminate(self):
+        if self._pool is not None:
+            self._pool.terminate()
+
+    def join(self):
+        self._pool.join()
+
+    def __enter__(self):
+        if self._pool is None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        # like multiprocessing.Pool, leaving the block stops the workers
+        self.terminate()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Sample rate conversion and channel downmix to the 16 kHz mono PCM the
+    VAD and the model expect.
+
+    Resampler is a streaming polyphase FIR resampler: a Kaiser windowed sinc
+    lowpass is split into `up` phases and every output sample is the dot
+    product of one phase with the latest input samples, computed for a whole
+    block at once with NumPy. Blocks of any size can be pushed, the filter
+    history is carried over, so 8 kHz telephony or 44.1/48 kHz stereo is
+    converted inline while it is read.
+"""
+import math
+import wave
+
+import numpy as np
+
+from audio_defaults import *
+from frame_sources import FrameSource, MappedWaveSource
+
+# zero crossings of the sinc on each side of the filter center
+RESAMPLE_ZERO_CROSSINGS = 12
+
+# lowpass cutoff as a fraction of the lower Nyquist frequency
+RESAMPLE_ROLLOFF = 0.94
+
+# Kaiser window shape, about 80 dB of stopband attenuation
+RESAMPLE_KAISER_BETA = 8.0
+
+# frames read from a WAV file per resampled block
+RESAMPLE_BLOCK_FRAMES = 8192
+
+# output samples computed per vectorized step, bounds the gathered windows
+RESAMPLE_BATCH_OUTPUTS = 4096
+
+
+def lowpass_filter(up, down, zero_crossings=RESAMPLE_ZERO_CROSSINGS,
+                   rolloff=RESAMPLE_ROLLOFF, beta=RESAMPLE_KAISER_BETA):
+    """
+    windowed sinc lowpass at the upsampled rate, scaled by up so that
+    interpolation keeps the signal level.
+    """
+    # cutoff normalized to the upsampled rate
+    cutoff = rolloff * 0.5 / max(up, down)
+    half = int(math.ceil(zero_crossings / (2 * cutoff)))
+    m = np.arange(-half, half + 1)
+    taps = 2 * cutoff * np.sinc(2 * cutoff * m) * np.kaiser(len(m), beta)
+    return taps * up
+
+
+def downmix(samples, channels):
+    """
+    interleaved int16 samples of channels to mono, as the channel mean.
+    """
+    if channels == 1:
+        return np.asarray(samples, dtype=np.int16)
+    frames = np.asarray(samples, dtype=np.int16).reshape(-1, channels)
+    return (frames.sum(axis=1, dtype=np.int32) // channels).astype(np.int16)
+
+
+class Resampler(object):
+    """
+    Streaming conversion of interleaved 16 bit PCM of in_rate and channels
+    to mono out_rate.
+    process() takes bytes-like blocks of any length and returns the
+    converted int16 bytes available so far, flush() returns the rest once
+    the input ended. The output is aligned with the input, the filter delay
+    is compensated, and has ceil(num_input_frames * out_rate / in_rate)
+    samples in total.
+    """
+    def __init__(self, in_rate, out_rate=RATE, channels=CHANNELS):
+        if in_rate <= 0 or out_rate <= 0 or channels < 1:
+            raise(ValueError("invalid conversion: {} Hz with {} channel(s) to {} Hz".
+                             format(in_rate, channels, out_rate)))
+
+        g = math.gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.channels = channels
+        self.up = out_rate // g
+        self.down = in_rate // g
+
+        taps = lowpass_filter(self.up, self.down)
+        # the polyphase matrix: phase p holds taps[p], taps[p + up], ...
+        num_taps = int(math.ceil(len(taps) / self.up))
+        padded = np.zeros(num_taps * self.up)
+        padded[:len(taps)] = taps
+        self._phases = padded.reshape(num_taps, self.up).T.astype(np.float32)
+        self._delay = (len(taps) - 1) // 2
+        self._offsets = np.arange(num_taps)
+
+        self._frame_bytes = SAMPLE_WIDTH * channels
+        self._partial = b''
+        self._history = np.zeros(num_taps - 1, dtype=np.float32)
+        self._num_in = 0
+        self._num_out = 0
+        # position of the next output sample at the upsampled rate
+        self._t = self._delay
+
+    def _convert(self, mono):
+        history_len = len(self._history)
+        x = np.concatenate((self._history, mono.astype(np.float32)))
+        start = self._num_in - history_len
+        self._num_in += len(mono)
+
+        num_out = max(-(-(self._num_in * self.up - self._t) // self.down), 0)
+        y = np.empty(num_out, dtype=np.float32)
+        # the gathered windows are num_out x num_taps, bound them
+        for begin in range(0, num_out, RESAMPLE_BATCH_OUTPUTS):
+            t = self._t + np.arange(begin, min(begin + RESAMPLE_BATCH_OUTPUTS, num_out),
+                                    dtype=np.int64) * self.down
+            base = t // self.up - start
+            windows = x[base[:, None] - self._offsets[None, :]]
+            y[begin:begin + len(t)] = np.einsum('nk,nk->n', windows, self._phases[t % self.up])
+
+        self._t += num_out * self.down
+        if history_len:
+            self._history = x[-history_len:]
+        return y
+
+    def _to_pcm(self, y):
+        self._num_out += len(y)
+        return np.clip(np.rint(y), -32768, 32767).astype(np.int16).tobytes()
+
+    def process(self, block):
+        data = self._partial + bytes(block) if self._partial else block
+        usable = len(data) - len(data) % self._frame_bytes
+        self._partial = bytes(data[usable:])
+
+        samples = np.frombuffer(data, np.int16, count=usable // SAMPLE_WIDTH)
+        mono = downmix(samples, self.channels)
+        if self.up == self.down:
+            self._num_in += len(mono)
+            self._num_out += len(mono)
+            return mono.tobytes()
+        return self._to_pcm(self._convert(mono))
+
+    def flush(self):
+        """
+        converts the input still held back by the filter delay.
+        """
+        expected = -(-self._num_in * self.up // self.down)
+        if self.up == self.down or self._num_out >= expected:
+            return b''
+        # zeros push the last input samples through the filter
+        zeros = np.zeros(self._delay // self.up + 1, dtype=np.int16)
+        num_in = self._num_in
+        y = self._convert(zeros)
+        self._num_in = num_in
+        return self._to_pcm(y[:expected - self._num_out])
+
+
+def convert(audio_buffer, in_rate, channels=CHANNELS, out_rate=RATE):
+    """
+    converts a whole interleaved 16 bit PCM buffer to mono out_rate bytes.
+    """
+    resampler = Resampler(in_rate, out_rate, channels)
+    return resampler.process(audio_buffer) + resampler.flush()
+
+
+class ResampledWaveSource(FrameSource):
+    """
+        frames of RATE mono audio from a 16 bit WAV file of any rate and
+        channel count. The file is read in RESAMPLE_BLOCK_FRAMES blocks and
+        converted as it is read, so VAD starts before the file is converted.
+    """
+    def __init__(self, file_name, chunk=CHUNK, rate=RATE):
+        self._wave = wave.open(file_name, 'rb')
+        if self._wave.getsampwidth() != SAMPLE_WIDTH:
+            self._wave.close()
+            raise(ValueError("{}: expected {} byte samples".format(file_name, SAMPLE_WIDTH)))
+
+        super(ResampledWaveSource, self).__init__(rate, chunk)
+        self._resampler = Resampler(self._wave.getframerate(), rate, self._wave.getnchannels())
+        self._buffer = bytearray()
+        self._flushed = False
+
+    def _read(self, num_bytes):
+        while len(self._buffer) < num_bytes and not self._flushed:
+            block = self._wave.readframes(RESAMPLE_BLOCK_FRAMES)
+            if block:
+                self._buffer += self._resampler.process(block)
+            else:
+                self._buffer += self._resampler.flush()
+                self._flushed = True
+
+        data = bytes(self._buffer[:num_bytes])
+        del self._buffer[:num_bytes]
+        return data
+
+    def close(self):
+        super(ResampledWaveSource, self).close()
+        self._wave.close()
+
+
+def open_wave_source(file_name, chunk=CHUNK):
+    """
+    frame source of a WAV file: memory mapped when it already is RATE mono,
+    converted on the fly otherwise.
+    """
+    with wave.open(file_name, 'rb') as fin:
+        native = fin.getframerate() == RATE and fin.getnchannels() == CHANNELS
+    if native:
+        return MappedWaveSource(file_name, chunk)
+    return ResampledWaveSource(file_name, chunk)
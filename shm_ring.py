@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Audio capture through a lock-free shared memory ring.
+
+    AudioStream's callback puts every chunk into a queue.Queue, which takes
+    a lock, while VAD and inference compete for the GIL of the same process.
+    Here capture runs in a process of its own: the PortAudio callback copies
+    each chunk into a preallocated slot of a multiprocessing.shared_memory
+    ring and publishes it by advancing the head index. The consumer process
+    (VAD, inference) reads the slots and advances the tail index. There is
+    one writer and one reader, each index is only written by its owner, so
+    no lock is needed. A full ring drops the new chunk and counts an overrun.
+
+    Ring layout: a header of 64 bit counters, head and tail on cache lines of
+    their own, then num_slots slots of [capture time, length, PCM bytes].
+"""
+import struct
+import time
+import multiprocessing
+
+from multiprocessing import shared_memory
+
+import metrics
+from audio_defaults import *
+from frame_sources import FrameSource
+
+# slots of the ring, about 4 seconds of 30 ms chunks
+SHM_RING_SLOTS = 128
+
+# how long a reader sleeps while the ring is empty
+SHM_RING_POLL_S = 0.002
+
+# header words (64 bit), head and tail 64 bytes apart
+_HEAD = 0
+_TAIL = 8
+_OVERRUNS = 16
+_INPUT_OVERFLOWS = 17
+_CLOSED = 18
+_NUM_SLOTS = 19
+_FRAME_BYTES = 20
+_HEADER_BYTES = 192
+
+# per slot: capture time (time.time()) and PCM length
+_SLOT_HEADER = struct.Struct('<dQ')
+
+# PortAudio status flag of a callback that lost input
+_PA_INPUT_OVERFLOW = 2
+
+
+class SharedFrameRing(object):
+    """
+    Single producer, single consumer ring of audio frames in shared memory.
+    The creating side (create=True, name None for a fresh name) owns the
+    memory and unlinks it on close(), the other side attaches by name.
+    write() is for the producer, read() for the consumer; each side must be
+    used by one thread only.
+    """
+    def __init__(self, name=None, num_slots=SHM_RING_SLOTS, frame_bytes=CHUNK * SAMPLE_WIDTH,
+                 create=True):
+        if create:
+            if num_slots < 1 or frame_bytes < 1:
+                raise(ValueError("invalid ring of {} slots of {} bytes".format(num_slots, frame_bytes)))
+            slot_bytes = _SLOT_HEADER.size + frame_bytes
+            self._shm = shared_memory.SharedMemory(name, create=True,
+                                                   size=_HEADER_BYTES + num_slots * slot_bytes)
+            self._header = self._shm.buf[:_HEADER_BYTES].cast('Q')
+            for index in range(len(self._header)):
+                self._header[index] = 0
+            self._header[_NUM_SLOTS] = num_slots
+            self._header[_FRAME_BYTES] = frame_bytes
+        else:
+            # processes started by multiprocessing share the resource
+            # tracker of the creator, which unlinks the memory only once
+            self._shm = shared_memory.SharedMemory(name)
+            self._header = self._shm.buf[:_HEADER_BYTES].cast('Q')
+
+        self.name = self._shm.name
+        self.owner = create
+        self.num_slots = self._header[_NUM_SLOTS]
+        self.frame_bytes = self._header[_FRAME_BYTES]
+        self._slot_bytes = _SLOT_HEADER.size + self.frame_bytes
+        self._buf = self._shm.buf
+
+    def write(self, frame, capture_time=None):
+        """
+        copies frame into the next free slot, frames longer than
+        frame_bytes are truncated. Returns False and counts an overrun when
+        the ring is full.
+        """
+        header = self._header
+        head = header[_HEAD]
+        if head - header[_TAIL] >= self.num_slots:
+            header[_OVERRUNS] += 1
+            return False
+
+        length = min(len(frame), self.frame_bytes)
+        pos = _HEADER_BYTES + (head % self.num_slots) * self._slot_bytes
+        _SLOT_HEADER.pack_into(self._buf, pos, capture_time or time.time(), length)
+        start = pos + _SLOT_HEADER.size
+        self._buf[start:start + length] = memoryview(frame).cast('B')[:length]
+        # publish the slot only once it is written
+        header[_HEAD] = head + 1
+        return True
+
+    def read(self):
+        """
+        returns (capture_time, frame bytes) of the oldest unread slot, None
+        when the ring is empty.
+        """
+        header = self._header
+        tail = header[_TAIL]
+        if tail >= header[_HEAD]:
+            return None
+
+        pos = _HEADER_BYTES + (tail % self.num_slots) * self._slot_bytes
+        capture_time, length = _SLOT_HEADER.unpack_from(self._buf, pos)
+        start = pos + _SLOT_HEADER.size
+        frame = bytes(self._buf[start:start + length])
+        # the slot may be overwritten from here on
+        header[_TAIL] = tail + 1
+        return capture_time, frame
+
+    def count_input_overflow(self):
+        self._header[_INPUT_OVERFLOWS] += 1
+
+    def close_writer(self):
+        """
+        the producer is done, readers stop once the ring is drained.
+        """
+        self._header[_CLOSED] = 1
+
+    @property
+    def writer_closed(self):
+        return bool(self._header[_CLOSED])
+
+    @property
+    def num_written(self):
+        return self._header[_HEAD]
+
+    @property
+    def num_read(self):
+        return self._header[_TAIL]
+
+    @property
+    def num_overruns(self):
+        return self._header[_OVERRUNS]
+
+    @property
+    def num_input_overflows(self):
+        return self._header[_INPUT_OVERFLOWS]
+
+    def __len__(self):
+        return self._header[_HEAD] - self._header[_TAIL]
+
+    @property
+    def stats(self):
+        return {'written': self.num_written,
+                'read': self.num_read,
+                'depth': len(self),
+                'overruns': self.num_overruns,
+                'input_overflows': self.num_input_overflows}
+
+    def close(self):
+        # the views into the buffer must go before the memory is closed
+        self._header.release()
+        self._header = None
+        self._buf = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+def ring_callback(ring):
+    """
+    PyAudio stream callback writing every chunk into ring.
+    """
+    # pyaudio is only needed by the capture process
+    import pyaudio
+
+    write = ring.write
+
+    def callback(in_data, frame_count, time_info, status_flags):
+        if status_flags & _PA_INPUT_OVERFLOW:
+            ring.count_input_overflow()
+        write(in_data)
+        return None, pyaudio.paContinue
+    return callback
+
+
+def pyaudio_writer(ring, stop, rate=RATE, chunk=CHUNK):
+    """
+    captures from the default input device into ring until stop is set.
+    """
+    import pyaudio
+
+    paudio = pyaudio.PyAudio()
+    stream = paudio.open(format=FORMAT, channels=CHANNELS, rate=rate, input=True,
+                         frames_per_buffer=chunk, stream_callback=ring_callback(ring))
+    try:
+        while not stop.wait(0.1) and stream.is_active():
+            pass
+    finally:
+        stream.stop_stream()
+        stream.close()
+        paudio.terminate()
+
+
+def synthetic_writer(ring, stop, pcm, rate=RATE, chunk=CHUNK, realtime=True):
+    """
+    writes pcm into ring chunk by chunk in place of a sound card, paced like
+    a device when realtime. Frames are dropped like the callback drops them
+    when the reader falls behind.
+    """
+    frame_bytes = chunk * SAMPLE_WIDTH
+    frame_s = chunk / rate
+    start = time.time()
+    for index, pos in enumerate(range(0, len(pcm) - frame_bytes + 1, frame_bytes)):
+        if stop.is_set():
+            break
+        if realtime:
+            delay = start + (index + 1) * frame_s - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        ring.write(pcm[pos:pos + frame_bytes])
+
+
+def _capture_main(ring_name, stop, writer, rate, chunk):
+    ring = SharedFrameRing(ring_name, create=False)
+    try:
+        writer(ring, stop, rate=rate, chunk=chunk)
+    finally:
+        ring.close_writer()
+        ring.close()
+
+
+class RingFrameSource(FrameSource):
+    """
+        frames read from a SharedFrameRing, for VadFilter. get_frame waits
+        up to 0.3 s for the next frame like AudioStream.get_frame, and
+        last_capture_time is the time.time() the frame was written.
+        The source ends once the writer is closed and the ring drained.
+    """
+    def __init__(self, ring, rate=RATE, chunk=CHUNK):
+        super(RingFrameSource, self).__init__(rate, chunk)
+        self.ring = ring
+        self.last_capture_time = None
+        metrics.REGISTRY.gauge('shm_ring_depth', 'Frames waiting in the capture ring',
+                               fn=lambda: len(ring) if ring._header is not None else 0)
+        metrics.REGISTRY.gauge('shm_ring_overruns', 'Frames dropped by a full capture ring',
+                               fn=lambda: ring.num_overruns if ring._header is not None else 0)
+
+    def is_active(self):
+        return not self.closed and not self._exhausted
+
+    def get_frame(self):
+        if self.closed or self._exhausted:
+            return None
+
+        deadline = time.time() + 0.3
+        while True:
+            item = self.ring.read()
+            if item is not None:
+                self.last_capture_time, frame = item
+                return frame
+            if self.ring.writer_closed:
+                # the writer may have published a last frame before closing
+                item = self.ring.read()
+                if item is None:
+                    self._exhausted = True
+                    return None
+                self.last_capture_time, frame = item
+                return frame
+            if time.time() > deadline:
+                return None
+            time.sleep(SHM_RING_POLL_S)
+
+
+class ShmCapture(object):
+    """
+    Runs capture in a child process writing into a SharedFrameRing and
+    hands out a RingFrameSource over it:
+        with ShmCapture() as source:
+            VadFilter(source, DETECTION_MODE).speech_segment_collector(200)
+    writer(ring, stop, rate=, chunk=) produces the audio, pyaudio_writer by
+    default, e.g. functools.partial(synthetic_writer, pcm=pcm) in tests.
+    The capture process is spawned, not forked, so it does not inherit the
+    threads (model loading) and locks of this process; writer has to be
+    picklable, a module level function or a partial of one.
+    stats has the ring counters, also after the capture ended.
+    """
+    def __init__(self, rate=RATE, chunk=CHUNK, num_slots=SHM_RING_SLOTS, writer=None):
+        self.rate = rate
+        self.chunk = chunk
+        self.num_slots = num_slots
+        self.writer = writer if writer is not None else pyaudio_writer
+        self.ring = None
+        self.source = None
+        self.stats = None
+        self._stop = None
+        self._process = None
+
+    def __enter__(self):
+        self.ring = SharedFrameRing(num_slots=self.num_slots,
+                                    frame_bytes=self.chunk * SAMPLE_WIDTH * CHANNELS)
+        # forking a process with running threads can copy locks they hold
+        context = multiprocessing.get_context('spawn')
+        self._stop = context.Event()
+        self._process = context.Process(
+            target=_capture_main, name='capture', daemon=True,
+            args=(self.ring.name, self._stop, self.writer, self.rate, self.chunk))
+        self._process.start()
+        self.source = RingFrameSource(self.ring, self.rate, self.chunk).__enter__()
+        return self.source
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._stop.set()
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._process = None
+
+        self.source.close()
+        self.stats = self.ring.stats
+        self.ring.close()
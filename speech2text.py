@@ -2,72 +2,267 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
-import numpy as np
 import wave
+import threading
+import logging
 
-from deepspeech import Model
 from timeit import default_timer as timer
 import audio_defaults 
+import backends
+import metrics
+import transcript_cache
+
+INFERENCE_TIME = metrics.REGISTRY.histogram(
+    'inference_seconds', 'Time of speech2text.detect_buffer inference')
+INFERENCE_RTF = metrics.REGISTRY.histogram(
+    'inference_real_time_factor', 'Inference time / audio time of a segment',
+    buckets=metrics.RATIO_BUCKETS)
 
 MODEL = "./models/output_graph.pbmm"
 ALPHABET =  "./models/alphabet.txt"
 LM = "./models/lm.binary"
 TRIE = "./models/trie"
 
+# vad buffer used to cut long files in detect_file
+FILE_VAD_BUFFER_MS = 200
+
+
+# scripted stand-in for deepspeech.Model, the name predates backends.py
+FakeModel = backends.FakeBackend
+
+
+class StreamingRecognizer(object):
+    """
+    Incremental decoding of one utterance at a time.
+    feed() pushes audio into the model stream and returns a partial transcript
+    after every partial_interval_ms of fed audio, None in between.
+    finish() returns the final transcript and closes the stream, the next
+    feed() starts a new utterance.
+    """
+    def __init__(self, ds, partial_interval_ms=audio_defaults.STREAM_PARTIAL_INTERVAL_MS):
+        self.ds = ds
+        self._partial_interval_samples = int(partial_interval_ms * audio_defaults.RATE / 1000)
+        self._ctx = None
+        self._samples_since_partial = 0
+
+    def feed(self, audio_buffer):
+        if self._ctx is None:
+            self._ctx = self.ds.setupStream(sample_rate=audio_defaults.RATE)
+            self._samples_since_partial = 0
+
+        import numpy as np
+        audio = np.frombuffer(audio_buffer, np.int16)
+        self.ds.feedAudioContent(self._ctx, audio)
+
+        self._samples_since_partial += len(audio)
+        if self._samples_since_partial >= self._partial_interval_samples:
+            self._samples_since_partial = 0
+            return self.ds.intermediateDecode(self._ctx)
+
+    def finish(self):
+        if self._ctx is None:
+            return ''
+        ctx, self._ctx = self._ctx, None
+        return self.ds.finishStream(ctx)
+
 
 class speech2text(object):
 
-    def __init__(self):
-        self.ds = None
+    def __init__(self, model=None, cache=None, beam_width=audio_defaults.BEAM_WIDTH,
+                 lm_weight=audio_defaults.LM_WEIGHT,
+                 valid_word_count_weight=audio_defaults.VALID_WORD_COUNT_WEIGHT, backend=None,
+                 model_id=None):
+        """
+        model is an already loaded backend such as FakeModel,
+        otherwise load_model has to be called.
+        cache is a transcript_cache.TranscriptCache consulted by
+        detect_buffer before running inference. Transcripts are only cached
+        for a model known by its files (load_model) or by model_id.
+        beam_width, lm_weight and valid_word_count_weight are the decoder
+        settings load_model uses.
+        backend is the backends.Backend load_model loads, a
+        DeepSpeechBackend with the decoder settings by default.
+        """
+        self.ds = model
+        if model is None and backend is None:
+            backend = backends.DeepSpeechBackend(beam_width, lm_weight, valid_word_count_weight)
+        self.backend = backend
+        self.model_id = model_id
+        self.load_times = {}
+        self.cache = cache
+        self.beam_width = beam_width
+        self.lm_weight = lm_weight
+        self.valid_word_count_weight = valid_word_count_weight
+        self.model_path = None
+        self.lm_path = None
+        self.trie_path = None
+
+        # cleared while load_model_async runs
+        self._model_ready = threading.Event()
+        self._model_ready.set()
+        self._load_error = None
+
+    def _set_model_paths(self, model, lm, trie):
+        # the model files are part of the transcript cache key
+        self.model_path = model
+        self.lm_path = lm if lm and trie else None
+        self.trie_path = trie if lm and trie else None
         
     def load_model(self, model, alphabet, lm, trie):
-        print('Loading model from file {}'.format(model), file=sys.stderr)
-        model_load_start = timer()
-        self.ds = Model(model, audio_defaults.N_FEATURES, audio_defaults.N_CONTEXT, alphabet, audio_defaults.BEAM_WIDTH)
-        model_load_end = timer() - model_load_start
-        print('Loaded model in {:.3}s.'.format(model_load_end), file=sys.stderr)
-    
-        if lm and trie:
-            print('Loading language model from files {} {}'.format(lm, trie), file=sys.stderr)
-            lm_load_start = timer()
-            self.ds.enableDecoderWithLM(alphabet, lm, trie, audio_defaults.LM_WEIGHT,
-                                   audio_defaults.VALID_WORD_COUNT_WEIGHT)
-            lm_load_end = timer() - lm_load_start
-            print('Loaded language model in {:.3}s.'.format(lm_load_end), file=sys.stderr)
-        else: 
-            print('Empty Language Model or trie {} {}'.format(lm, trie), file=sys.stderr)
-    
+        self._set_model_paths(model, lm, trie)
+        backend = self.backend
+        if backend is None:
+            backend = backends.DeepSpeechBackend(self.beam_width, self.lm_weight,
+                                                 self.valid_word_count_weight)
+        backend.load(model, alphabet, lm, trie)
+        self.load_times = backend.load_times
+        self.ds = backend
+
+    def load_model_async(self, model, alphabet, lm, trie):
+        """
+        loads the model and LM on a background thread and returns the thread.
+        Capture and VAD can start right away, detect_buffer and create_stream
+        wait until the model is loaded.
+        """
+        self._set_model_paths(model, lm, trie)
+        self._load_error = None
+        self._model_ready.clear()
+
+        def load():
+            try:
+                self.load_model(model, alphabet, lm, trie)
+            except Exception as e:
+                logging.exception("loading model {} failed".format(model))
+                self._load_error = e
+            finally:
+                self._model_ready.set()
+
+        thread = threading.Thread(target=load, name='model-load', daemon=True)
+        thread.start()
+        return thread
+
+    def wait_ready(self, timeout=None):
+        """
+        waits for load_model_async to finish, returns False on timeout.
+        Raises RuntimeError when loading failed.
+        """
+        if not self._model_ready.wait(timeout):
+            return False
+        if self._load_error is not None:
+            raise(RuntimeError("loading model {} failed: {!r}".format(self.model_path, self._load_error)))
+        return True
     
+    def _cache_key(self, audio_buffer):
+        # None when there is no cache or the model has no path or id to key on
+        model_id = self.model_path if self.model_path is not None else self.model_id
+        if self.cache is None or model_id is None:
+            return None
+        backend = self.ds if self.ds is not None else self.backend
+        backend_id = getattr(backend, 'cache_id', (type(backend).__name__,))
+        return transcript_cache.cache_key(audio_buffer, model_id, self.lm_path, self.trie_path,
+                                          backend_id)
+
     def detect_buffer(self, audio_buffer):
-        
+
+        # a cached transcript is returned even while the model still loads
+        key = self._cache_key(audio_buffer)
+        if key is not None:
+            speech_text = self.cache.get(key)
+            if speech_text is not None:
+                return speech_text
+
+        self.wait_ready()
+
+        import numpy as np
         audio = np.frombuffer(audio_buffer, np.int16)
         
         inference_start = timer()
         speech_text = self.ds.stt(audio, audio_defaults.RATE)
         inference_end = timer() - inference_start
         
-        audio_length = float(len(audio_buffer)/(audio_defaults.RATE * audio_defaults.CHANNELS * 2))
-        print ("Inference took {0:.3f}s for {0:.3f}s audio buffer".
+        audio_length = float(len(audio_buffer)/(audio_defaults.RATE * audio_defaults.CHANNELS * audio_defaults.SAMPLE_WIDTH))
+        INFERENCE_TIME.observe(inference_end)
+        if audio_length > 0:
+            INFERENCE_RTF.observe(inference_end / audio_length)
+        print ("Inference took {0:.3f}s for {1:.3f}s audio buffer".
                format(inference_end, audio_length))
 
+        if key is not None:
+            self.cache.put(key, speech_text)
+
         return speech_text    
+
+    def create_stream(self, partial_interval_ms=audio_defaults.STREAM_PARTIAL_INTERVAL_MS):
+        self.wait_ready()
+        if not getattr(self.ds, 'streaming', True):
+            raise(ValueError("{} does not support streaming".format(type(self.ds).__name__)))
+        return StreamingRecognizer(self.ds, partial_interval_ms)
+
+    def detect_stream(self, voice_frames, partial_interval_ms=audio_defaults.STREAM_PARTIAL_INTERVAL_MS):
+        """
+        Streaming recognition over the (frames, end_of_segment) tuples of
+        AudioStream.VadFilter.voice_frame_collector.
+        Frames are fed into the model as they pass the vad and
+        (speech_text, is_final) tuples are yielded: partial hypotheses every
+        partial_interval_ms of speech and the final transcript at the offset.
+        """
+        stream = self.create_stream(partial_interval_ms)
+        for frames, end_of_segment in voice_frames:
+            for frame in frames:
+                partial_text = stream.feed(frame)
+                if partial_text is not None and not end_of_segment:
+                    yield partial_text, False
+
+            if end_of_segment:
+                yield stream.finish(), True
     
-    def detect_file(self, file_name = None):
-        
+    def detect_file(self, file_name = None, vad_buffer_ms = None):
+        """
+        transcribes a WAV file. Files longer than MAX_SEGMENT_MS, or any file
+        when vad_buffer_ms is given, are decoded segment by segment with
+        detect_file_segments and the transcripts are joined.
+        Other rates and channel counts are converted to 16 kHz mono.
+        """
         speech_text = None
         
         with wave.open(file_name) as fin:
             fs = fin.getframerate()
+            channels = fin.getnchannels()
+            num_frames = fin.getnframes()
 
             print ("filename:{} framerate:{}".format(file_name, fs))
-            if fs != audio_defaults.RATE:
-                print('Warning: original sample rate ({}) is different than 16kHz.\
-                 Resampling might produce erratic speech recognition.'.
-                 format(fs), file=sys.stderr)
-            else:
-                audio_buffer = fin.readframes(fin.getnframes())
+            if fs != audio_defaults.RATE or channels != audio_defaults.CHANNELS:
+                print('converting {} Hz {} channel(s) to {} Hz mono'.
+                      format(fs, channels, audio_defaults.RATE), file=sys.stderr)
+
+            if vad_buffer_ms is None and num_frames * 1000 <= audio_defaults.MAX_SEGMENT_MS * fs:
+                audio_buffer = fin.readframes(num_frames)
+                if fs != audio_defaults.RATE or channels != audio_defaults.CHANNELS:
+                    import resample
+                    audio_buffer = resample.convert(audio_buffer, fs, channels)
                 speech_text = self.detect_buffer(audio_buffer)
+            else:
+                texts = self.detect_file_segments(file_name, vad_buffer_ms or FILE_VAD_BUFFER_MS)
+                speech_text = ' '.join(text.strip() for text in texts if text and text.strip())
                 
         return speech_text
 
+    def detect_file_segments(self, file_name, vad_buffer_ms=FILE_VAD_BUFFER_MS,
+                             max_segment_ms=audio_defaults.MAX_SEGMENT_MS):
+        """
+        yields the transcript of every VAD segment of a WAV file.
+        The file is memory mapped, or converted to 16 kHz mono block by
+        block, and segmented as it is read. Only the current segment is held
+        in memory, so memory use is bounded by max_segment_ms and not by
+        the file length.
+        """
+        # AudioStream imports this module, import it on use
+        from AudioStream import VadFilter
+        from resample import open_wave_source
+
+        with open_wave_source(file_name) as source:
+            vad_filter = VadFilter(source, audio_defaults.DETECTION_MODE)
+            for segment in vad_filter.speech_segment_collector(vad_buffer_ms, max_segment_ms):
+                yield self.detect_buffer(segment.pcm)
+
 
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Model server: keeps speech2text instances loaded and transcribes PCM
+    segments sent by clients over a Unix domain socket or localhost TCP.
+    The server is not authenticated, TCP on other interfaces has to be
+    allowed explicitly (--allow-remote).
+
+    Every message on the socket is framed as a 1 byte type and a 4 byte big
+    endian payload length followed by the payload:
+        AUDIO      client -> server  16 bit mono PCM at audio_defaults.RATE
+        ROUTE      client -> server  UTF-8 tag of the model instances that
+                                     decode the following AUDIO messages,
+                                     empty for any instance
+        TRANSCRIPT server -> client  UTF-8 transcript
+        ERROR      server -> client  UTF-8 error message
+    A connection can send any number of segments, one at a time.
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import os
+import argparse
+import ipaddress
+import json
+import socket
+import socketserver
+import stat
+import struct
+import logging
+
+import transcript_cache
+from model_pool import ModelPool
+
+AUDIO = b'A'
+ROUTE = b'R'
+TRANSCRIPT = b'T'
+ERROR = b'E'
+
+HEADER = struct.Struct('!cI')
+
+# larger messages are refused, about 30 minutes of audio
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def send_message(sock, kind, payload):
+    sock.sendall(HEADER.pack(kind, len(payload)))
+    sock.sendall(payload)
+
+
+def _recv_exact(sock, num_bytes):
+    data = bytearray(num_bytes)
+    view = memoryview(data)
+    received = 0
+    while received < num_bytes:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            return None
+        received += n
+    return data
+
+
+def recv_message(sock):
+    """
+    returns (kind, payload), or (None, None) when the peer closed the
+    connection.
+    """
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None, None
+
+    kind, length = HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise(ValueError("message of {} bytes is larger than {}".format(length, MAX_MESSAGE_BYTES)))
+
+    payload = _recv_exact(sock, length)
+    if payload is None:
+        return None, None
+    return kind, payload
+
+
+def is_loopback(host):
+    """
+    True for localhost and loopback IP addresses.
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_address(address, allow_remote=False):
+    """
+    'host:port' or ':port' is a TCP address, anything else a Unix socket path.
+    Hosts other than loopback raise ValueError unless allow_remote.
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        host = host or '127.0.0.1'
+        if not allow_remote and not is_loopback(host):
+            raise(ValueError("{} is not a loopback address, the server is not authenticated".
+                             format(host)))
+        return (host, int(port))
+    return address
+
+
+def _is_stale_socket(path):
+    """
+    True when path is a Unix socket no server listens on.
+    """
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except ConnectionRefusedError:
+        return True
+    finally:
+        sock.close()
+    return False
+
+
+class _SttRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        tag = None
+        while True:
+            try:
+                kind, payload = recv_message(self.request)
+            except ValueError as e:
+                # the rest of the oversized message is not read, the
+                # connection can not be used any more
+                send_message(self.request, ERROR, str(e).encode('utf-8'))
+                break
+            if kind is None:
+                break
+
+            if kind == ROUTE:
+                tag = payload.decode('utf-8') or None
+                continue
+            if kind != AUDIO:
+                send_message(self.request, ERROR,
+                             "unknown message type {!r}".format(kind).encode('utf-8'))
+                continue
+
+            try:
+                speech_text = self.server.detect_buffer(payload, tag)
+            except Exception as e:
+                logging.exception("inference failed")
+                send_message(self.request, ERROR, repr(e).encode('utf-8'))
+                continue
+            send_message(self.request, TRANSCRIPT, (speech_text or '').encode('utf-8'))
+
+
+class _UnixSttServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _TcpSttServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SttServer(object):
+    """
+    Serves the recognizers on address, a Unix socket path or a (host, port)
+    tuple. recognizers is a model_pool.ModelPool or a list of recognizers.
+    Every connection is handled on its own thread and checks out one
+    instance of the pool per segment, routed by the tag of the connection,
+    so at most len(recognizers) segments are decoded at once.
+    TCP hosts other than loopback raise ValueError unless allow_remote. A
+    socket file left over at address is replaced, any other file, or a
+    socket a server listens on, raises FileExistsError.
+    """
+    def __init__(self, address, recognizers, allow_remote=False):
+        if not recognizers:
+            raise(ValueError("at least one recognizer is required"))
+        if isinstance(address, tuple) and not allow_remote and not is_loopback(address[0]):
+            raise(ValueError("{} is not a loopback address, the server is not authenticated".
+                             format(address[0])))
+
+        if isinstance(recognizers, ModelPool):
+            self.pool = recognizers
+        else:
+            self.pool = ModelPool()
+            for recognizer in recognizers:
+                self.pool.add(recognizer)
+
+        if isinstance(address, tuple):
+            self._server = _TcpSttServer(address, _SttRequestHandler)
+        else:
+            if os.path.exists(address):
+                if not _is_stale_socket(address):
+                    raise(FileExistsError("{} exists and is not a stale socket".format(address)))
+                os.unlink(address)
+            self._server = _UnixSttServer(address, _SttRequestHandler)
+        self._server.detect_buffer = self.detect_buffer
+
+    @property
+    def server_address(self):
+        return self._server.server_address
+
+    def detect_buffer(self, audio_buffer, tag=None):
+        return self.pool.detect_buffer(audio_buffer, tag)
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        # another server may have taken the path meanwhile
+        address = self.server_address
+        if isinstance(address, str) and os.path.exists(address) and _is_stale_socket(address):
+            os.unlink(address)
+
+
+class SttClient(object):
+    """
+    Client of SttServer. detect_buffer has the signature of
+    speech2text.detect_buffer, so a client can be used wherever a loaded
+    speech2text is, e.g. with VadFilter segments or TranscriptionPipeline.
+    With tag, its segments are decoded by the instances with that tag.
+    One client must not be used by two threads at once.
+    """
+    def __init__(self, address, tag=None):
+        if isinstance(address, str):
+            address = parse_address(address, allow_remote=True)
+
+        if isinstance(address, tuple):
+            self._sock = socket.create_connection(address)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(address)
+        if tag:
+            send_message(self._sock, ROUTE, tag.encode('utf-8'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        self._sock.close()
+
+    def detect_buffer(self, audio_buffer):
+        send_message(self._sock, AUDIO, audio_buffer)
+        kind, payload = recv_message(self._sock)
+        if kind is None:
+            raise(ConnectionError("server closed the connection"))
+
+        text = payload.decode('utf-8')
+        if kind == ERROR:
+            raise(RuntimeError("server error: {}".format(text)))
+        return text
+
+
+def load_pool(specs, cache=None):
+    """
+    ModelPool of the model specs, dicts with the arguments of
+    ModelPool.load: model, alphabet and optionally lm, trie, tags,
+    instances, beam_width, lm_weight and valid_word_count_weight.
+    """
+    pool = ModelPool()
+    for spec in specs:
+        # the socket is served right away, requests wait for the models
+        pool.load(cache=cache, **spec)
+    return pool
+
+
+def main(args):
+    # one cache for all instances, the model files and decoder settings are
+    # part of the cache key
+    cache = None
+    if args.cache is not None:
+        cache = transcript_cache.open_cache(args.cache or None)
+
+    if args.pool is not None:
+        with open(args.pool) as fin:
+            specs = json.load(fin)
+    else:
+        specs = [{'model': args.model, 'alphabet': args.alphabet, 'lm': args.lm,
+                  'trie': args.trie, 'tags': args.tags, 'instances': args.instances}]
+    pool = load_pool(specs, cache)
+
+    server = SttServer(parse_address(args.address, args.allow_remote), pool,
+                       allow_remote=args.allow_remote)
+    print('serving {} model instance(s) with tags {} on {}'.
+          format(len(pool), sorted(pool.tags), server.server_address), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        for stats in pool.stats:
+            logging.info("model instance:{}".format(stats))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serving DeepSpeech inference over a local socket.')
+    parser.add_argument('--address', required=True,
+                        help='Unix socket path, or host:port (:port for localhost) for TCP')
+    parser.add_argument('--allow-remote', action='store_true',
+                        help='Allow TCP addresses other than loopback, anyone who can connect '
+                             'can use the models')
+    parser.add_argument('--instances', type=int, default=1,
+                        help='Number of model instances, segments decoded at the same time')
+    parser.add_argument('--cache', nargs='?', const='',
+                        help='Cache transcripts by audio content in this SQLite file, '
+                             'or in memory when no file is given')
+    parser.add_argument('--tags', nargs='*', default=[],
+                        help='Tags of the model instances, clients route segments to them by tag')
+    parser.add_argument('--pool', required=False,
+                        help='JSON file with a list of model specs (model, alphabet, lm, trie, tags, '
+                             'instances, beam_width, lm_weight, valid_word_count_weight) to serve '
+                             'instead of --model')
+    parser.add_argument('--model', required=False,
+                        help='Path to the model (protocol buffer binary file)')
+    parser.add_argument('--alphabet', required=False,
+                        help='Path to the configuration file specifying the alphabet used by the network')
+    parser.add_argument('--lm', nargs='?',
+                        help='Path to the language model binary file')
+    parser.add_argument('--trie', nargs='?',
+                        help='Path to the language model trie file created with native_client/generate_trie')
+
+    args = parser.parse_args()
+    if args.pool is None and (args.model is None or args.alphabet is None):
+        parser.error('--model and --alphabet are required without --pool')
+    try:
+        parse_address(args.address, args.allow_remote)
+    except ValueError as e:
+        parser.error(str(e))
+    main(args)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import wave
+import asyncio
+import threading
+import unittest
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import async_audio
+import audio_defaults
+import frame_sources
+
+
+class TestAsyncAudio(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        with wave.open(os.path.abspath("./data/open_the_door.wav")) as fin:
+            self.pcm = fin.readframes(fin.getnframes())
+
+    async def test_callback_frames(self):
+        """
+        frames handed over from a foreign thread, as PortAudio does.
+        """
+        stream = async_audio.AsyncAudioStream(queue_size=2)
+        stream.bind(asyncio.get_running_loop())
+
+        def portaudio_thread():
+            for frame in [b'data1', b'data2', b'data3']:
+                stream.async_callback(frame, 1, {}, 0)
+            stream._loop.call_soon_threadsafe(stream._put_frame, None)
+
+        thread = threading.Thread(target=portaudio_thread)
+        thread.start()
+        thread.join()
+
+        frames = [frame async for frame in stream.frames()]
+        # the queue holds two frames, the oldest was dropped
+        self.assertEqual(frames, [b'data2', b'data3'])
+        self.assertEqual(stream.num_dropped, 1)
+        # the frames never pass AudioStream.data_q
+        self.assertIsNone(stream.data_q)
+
+    async def test_frame_source_yields_without_frames(self):
+        """
+        a source without a frame ready hands control back to the loop.
+        """
+        ready = asyncio.Event()
+        source = frame_sources.BytesSource(b'')
+        source.is_active = lambda: not ready.is_set()
+        asyncio.get_running_loop().call_soon(ready.set)
+
+        frames = [frame async for frame in async_audio.AsyncFrameSource(source).frames()]
+        self.assertEqual(frames, [])
+        self.assertTrue(ready.is_set())
+
+    async def test_async_voice_segment_collector(self):
+        with frame_sources.BytesSource(self.pcm) as source:
+            vf = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+            expected = list(vf.voice_segment_collector(200))
+
+        with frame_sources.BytesSource(self.pcm) as source:
+            avf = async_audio.AsyncVadFilter(async_audio.AsyncFrameSource(source),
+                                             audio_defaults.DETECTION_MODE)
+            segments = [s async for s in avf.voice_segment_collector(200)]
+
+        self.assertGreater(len(segments), 0)
+        self.assertEqual(segments, expected)
+        self.assertEqual(avf.num_frames, vf.num_frames)
+
+    async def test_async_speech_segment_collector(self):
+        with frame_sources.BytesSource(self.pcm) as source:
+            vf = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+            expected = [(bytes(s), s.offset, s.num_frames, s.voice_ratio)
+                        for s in vf.speech_segment_collector(200)]
+
+        with frame_sources.BytesSource(self.pcm) as source:
+            avf = async_audio.AsyncVadFilter(async_audio.AsyncFrameSource(source),
+                                             audio_defaults.DETECTION_MODE)
+            records = [s async for s in avf.speech_segment_collector(200)]
+
+        self.assertGreater(len(records), 0)
+        self.assertEqual([(bytes(s), s.offset, s.num_frames, s.voice_ratio) for s in records],
+                         expected)
+        self.assertTrue(all(s.capture_time is not None for s in records))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import subprocess
+import threading
+import time
 import webrtcvad
 import unittest
 import unittest.mock as mock
@@ -45,6 +48,18 @@ class TestAudioStream(unittest.TestCase):
                 self.assertEqual(len(frame), audio_defaults.CHUNK * 2)
                 counter +=1
 
+    def test_data_queue_is_bounded(self):
+        # the callback is driven by hand, no audio device needed
+        with mock.patch.dict(sys.modules, {'pyaudio': mock.Mock()}):
+            stream = AudioStream.AudioStream(audio_defaults.RATE, audio_defaults.CHUNK)
+        self.assertGreater(AudioStream.DATA_QUEUE_MAX_SIZE, 0)
+        for i in range(AudioStream.DATA_QUEUE_MAX_SIZE + 5):
+            stream.queuing_callback(bytes([i % 256]), 1, None, 0)
+        self.assertEqual(stream.data_q.qsize(), AudioStream.DATA_QUEUE_MAX_SIZE)
+        self.assertEqual(stream.data_q.num_dropped, 5)
+        # the oldest frames were dropped
+        self.assertEqual(stream.data_q.get()[1], bytes([5]))
+
 class TestVadFilter(unittest.TestCase):
 
     def test_init_pass(self):
@@ -240,7 +255,77 @@ class TestVadFilter(unittest.TestCase):
         segments = self.mock_VAD_segment_collector(vad_detection_items, mocked_audio_frames, 200)
         # making sure no segment is detected
         self.assertEqual(len(segments), 1)
+
+    def test_voice_frame_collector(self):
+        """
+        speech frames are handed out as they pass the vad,
+        the segment ends with the same frame as voice_segment_collector.
+        """
+        vad_detection_items = [0,0,1,1,1,1,1,1,0,0]
+        mocked_audio_frames = [b'data1', b'data2', b'data3', b'data4', b'data5',
+                               b'data6', b'data7', b'data8', b'data9', b'data10']
+        with mock.patch('webrtcvad.Vad', ) as MockVadObj:
+            MockVadObj.return_value.is_speech.side_effect = vad_detection_items
+            with mock.patch.object(AudioStream.AudioStream, 'get_frame') as MockAudioStream:
+                MockAudioStream.return_value.get_frame.side_effect = mocked_audio_frames
+                mas= MockAudioStream()
+
+                vf = AudioStream.VadFilter(audio_stream = mas, mode = 3)
+                voice_frames = vf.voice_frame_collector(200)
+                received = []
+                for frames, end_of_segment in voice_frames:
+                    received.extend(frames)
+                    if end_of_segment:
+                        break
+
+        self.assertEqual(b''.join(received), b'data3data4data5data6data7data8data9')
+
+
+class TestVadSegmenter(unittest.TestCase):
+
+    def test_max_segment_frames(self):
+        segmenter = AudioStream.VadSegmenter(1, max_segment_frames=3)
+        segments = []
+        for frame in [b'a', b'b', b'c', b'd', b'e', b'f', b'g']:
+            if segmenter.process(frame, 1) == AudioStream.SEGMENT_FULL:
+                segments.append(bytes(segmenter.pop_segment()))
+        segments.append(bytes(segmenter.flush()))
+
+        self.assertEqual(segments, [b'abc', b'def', b'g'])
+
+    def test_events(self):
+        segmenter = AudioStream.VadSegmenter(2)
+        events = [segmenter.process(frame, is_speech) for frame, is_speech in
+                  [(b'a', 0), (b'b', 1), (b'c', 1), (b'd', 1), (b'e', 0), (b'f', 0)]]
+
+        self.assertEqual(events, [AudioStream.NO_SPEECH, AudioStream.NO_SPEECH,
+                                  AudioStream.SPEECH_ONSET, AudioStream.SPEECH,
+                                  AudioStream.SPEECH, AudioStream.SPEECH_OFFSET])
+        self.assertEqual(segmenter.pop_segment(), b'bcdef')
+        self.assertEqual(segmenter.flush(), None)
+
+    def test_num_voice_frames(self):
+        segmenter = AudioStream.VadSegmenter(2)
+        for frame, is_speech in [(b'a', 0), (b'b', 1), (b'c', 1), (b'd', 0), (b'e', 1),
+                                 (b'f', 0), (b'g', 0)]:
+            event = segmenter.process(frame, is_speech)
+
+        self.assertEqual(event, AudioStream.SPEECH_OFFSET)
+        # b c d e f g, speech in b c e
+        self.assertEqual(segmenter.num_voice_frames, 3)
+        self.assertEqual(segmenter.pop_segment(), b'bcdefg')
+        self.assertEqual(segmenter.num_voice_frames, 0)
+
+    def test_flush_during_speech(self):
+        segmenter = AudioStream.VadSegmenter(1)
+        segmenter.process(b'a', 1)
+        segmenter.process(b'b', 1)
+
+        self.assertTrue(segmenter.speech_onset)
+        self.assertEqual(segmenter.flush(), b'ab')
+        self.assertFalse(segmenter.speech_onset)
         
+
 class TestVadBuffer(unittest.TestCase):
     
     def setUp(self):
@@ -307,6 +392,116 @@ class TestVadBuffer(unittest.TestCase):
         self.assertEqual(self.vb.num_non_voice,0)
         self.assertEqual( self.vb.size , 0)
 
+    def test_window(self):
+        for frame, is_speech in [(b'aa', True), (b'bb', False), (b'cc', True)]:
+            self.vb.append(frame, is_speech)
+        self.assertEqual([bytes(run) for run in self.vb.window()], [b'aabbcc'])
+
+        # wraps around the ring
+        for frame in [b'dd', b'ee', b'ff', b'gg']:
+            self.vb.append(frame, False)
+        self.assertEqual(b''.join(self.vb.window()), b'ccddeeffgg')
+        self.assertEqual(len(self.vb.window()), 2)
+        self.assertEqual(self.vb.get_speech_mask(), bytes([1, 0, 0, 0, 0]))
+        self.assertEqual(self.vb.get_data_list(), [b'cc', b'dd', b'ee', b'ff', b'gg'])
+
+    def test_utterance_buffer(self):
+        utterance = AudioStream.UtteranceBuffer(capacity=4)
+        for frame in [b'\x01\x00', b'\x02\x00\x03\x00', b'\x04\x00']:
+            utterance.append(frame)
+
+        self.assertEqual(len(utterance), 8)
+        self.assertEqual(utterance.view(), b'\x01\x00\x02\x00\x03\x00\x04\x00')
+        self.assertEqual(utterance.as_array().tolist(), [1, 2, 3, 4])
+
+    def test_frames_of_different_size(self):
+        self.vb.append(b'data1', True)
+        self.vb.append(b'data10', False)
+        self.vb.append(b'd', True)
+        self.assertEqual(self.vb.get_data_list(), [b'data1', b'data10', b'd'])
+        self.assertEqual(b''.join(self.vb.window()), b'data1data10d')
+        self.assertEqual(self.vb.num_voice, 2)
+
+
+class TestSpeechSegment(unittest.TestCase):
+
+    def setUp(self):
+        import wave
+        with wave.open(os.path.abspath("./data/open_the_door.wav")) as fin:
+            clip = fin.readframes(fin.getnframes())
+        # the clip after a second of silence, twice
+        silence = bytes(audio_defaults.RATE * audio_defaults.SAMPLE_WIDTH)
+        self.pcm = silence + clip + silence + clip
+
+    def collect(self, collector):
+        import frame_sources
+        with frame_sources.BytesSource(self.pcm) as source:
+            vad_filter = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+            return list(getattr(vad_filter, collector)(200))
+
+    def test_records(self):
+        before = time.time()
+        segments = self.collect('speech_segment_collector')
+        frame_bytes = audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH
+
+        self.assertGreater(len(segments), 1)
+        for segment in segments:
+            self.assertIsInstance(segment, AudioStream.SpeechSegment)
+            # the offset points at the segment audio in the stream
+            start = segment.offset * audio_defaults.SAMPLE_WIDTH
+            self.assertEqual(bytes(segment), self.pcm[start:start + len(segment)])
+            self.assertEqual(segment.num_frames * frame_bytes, len(segment))
+            self.assertAlmostEqual(segment.duration, segment.num_frames * 0.03)
+            self.assertAlmostEqual(segment.end_s - segment.start_s, segment.duration)
+            self.assertTrue(0 < segment.voice_ratio <= 1)
+            self.assertGreaterEqual(segment.capture_time, before)
+            self.assertEqual(segment.as_array().nbytes, len(segment))
+        self.assertGreater(segments[0].start_s, 1.0)
+        self.assertFalse(hasattr(segments[0], '__dict__'))
+
+    def test_voice_segment_collector_is_bytes(self):
+        records = self.collect('speech_segment_collector')
+        segments = self.collect('voice_segment_collector')
+        self.assertEqual(segments, [bytes(r) for r in records])
+        self.assertIsInstance(segments[0], bytes)
+
+
+class TestBoundWhenReady(unittest.TestCase):
+
+    def test_unbounded_while_loading(self):
+        loaded = threading.Event()
+        recognizer = mock.Mock()
+        recognizer.wait_ready.side_effect = lambda: loaded.wait()
+        q = AudioStream.BoundedQueue(2, AudioStream.DROP_OLDEST)
+
+        thread = AudioStream.bound_when_ready(q, [recognizer], 2)
+        for item in range(10):
+            q.put(item)
+        self.assertEqual(q.stats, {'queued': 10, 'dropped': 0, 'depth': 10})
+
+        loaded.set()
+        thread.join(1)
+        self.assertEqual(q.maxsize, 2)
+        q.put(10)
+        self.assertEqual(q.num_dropped, 1)
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_import_without_native_stack(self):
+        # None in sys.modules makes importing the module fail
+        code = ("import sys\n"
+                "for name in ['pyaudio', 'deepspeech', 'webrtcvad', 'numpy']:\n"
+                "    sys.modules[name] = None\n"
+                "import AudioStream\n"
+                "segmenter = AudioStream.VadSegmenter(2)\n"
+                "for is_speech in [1, 1, 1, 0, 0]:\n"
+                "    segmenter.process(b'frame', is_speech)\n"
+                "print(bytes(segmenter.pop_segment()))\n")
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.abspath(".."), stderr=subprocess.DEVNULL)
+        self.assertEqual(output.strip(), b"b'frameframeframeframeframe'")
+
         
         
 if __name__ == '__main__':
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import time
+import types
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import audio_defaults
+import backends
+import speech2text
+
+# 1 s of 16 kHz silence
+SECOND = bytes(audio_defaults.RATE * audio_defaults.SAMPLE_WIDTH)
+
+
+class BatchOnlyBackend(backends.Backend):
+
+    def load(self, model, alphabet, lm=None, trie=None):
+        pass
+
+    def stt(self, audio, rate):
+        return "batch"
+
+
+class TestFakeBackend(unittest.TestCase):
+
+    def test_scripted_text(self):
+        stt = speech2text.speech2text(backends.FakeBackend(["open the door", "close the door"]))
+        self.assertEqual([stt.detect_buffer(SECOND) for _ in range(3)],
+                         ["open the door", "close the door", "open the door"])
+        self.assertIs(speech2text.FakeModel, backends.FakeBackend)
+        self.assertRaises(ValueError, backends.FakeBackend, [])
+
+    def test_inference_cost(self):
+        fake = backends.FakeBackend(["open the door"], real_time_factor=0.1, fixed_s=0.02)
+        stt = speech2text.speech2text(fake)
+        start = time.perf_counter()
+        stt.detect_buffer(SECOND)
+        elapsed = time.perf_counter() - start
+        # 0.02 s + 0.1 * 1 s of audio
+        self.assertGreaterEqual(elapsed, 0.12)
+        self.assertLess(elapsed, 0.5)
+        self.assertAlmostEqual(fake.busy_seconds, 0.12)
+        self.assertEqual(fake.num_calls, 1)
+
+    def test_cpu_cost(self):
+        fake = backends.FakeBackend(["open the door"], fixed_s=0.05, cpu=True)
+        start = time.perf_counter()
+        # the time is spent busy, not asleep
+        with mock.patch('time.sleep') as sleep:
+            fake.stt(b'', audio_defaults.RATE)
+        sleep.assert_not_called()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+
+    def test_jitter_is_repeatable(self):
+        costs = []
+        for _ in range(2):
+            fake = backends.FakeBackend(["a"], fixed_s=0.001, jitter=0.5, seed=3)
+            for _ in range(5):
+                fake.stt(b'', audio_defaults.RATE)
+            costs.append(fake.busy_seconds)
+        self.assertEqual(costs[0], costs[1])
+        self.assertNotAlmostEqual(costs[0], 0.005)
+
+    def test_streaming_cost(self):
+        fake = backends.FakeBackend(["open the door"], real_time_factor=0.1, fixed_s=0.01)
+        stt = speech2text.speech2text(fake)
+        stream = stt.create_stream(partial_interval_ms=500)
+        stream.feed(SECOND)
+        self.assertEqual(stream.finish(), "open the door")
+        self.assertAlmostEqual(fake.busy_seconds, 0.11)
+
+    def test_load(self):
+        fake = backends.FakeBackend(["open the door"], load_s=0.05)
+        stt = speech2text.speech2text(backend=fake)
+        stt.load_model_async('model', 'alphabet', None, None)
+        self.assertFalse(stt.wait_ready(0))
+        self.assertTrue(stt.wait_ready(5))
+        self.assertIs(stt.ds, fake)
+        self.assertGreaterEqual(stt.load_times['model_s'], 0.05)
+        self.assertEqual(stt.detect_buffer(SECOND), "open the door")
+
+
+class TestBackends(unittest.TestCase):
+
+    def test_deepspeech_backend(self):
+        model = mock.MagicMock()
+        model.stt.return_value = "open the door"
+        deepspeech = types.ModuleType('deepspeech')
+        deepspeech.Model = mock.MagicMock(return_value=model)
+
+        stt = speech2text.speech2text(beam_width=100, lm_weight=1.5, valid_word_count_weight=2.0)
+        with mock.patch.dict(sys.modules, {'deepspeech': deepspeech}):
+            stt.load_model('model.pbmm', 'alphabet.txt', 'lm.binary', 'trie')
+
+        deepspeech.Model.assert_called_once_with('model.pbmm', audio_defaults.N_FEATURES,
+                                                 audio_defaults.N_CONTEXT, 'alphabet.txt', 100)
+        model.enableDecoderWithLM.assert_called_once_with('alphabet.txt', 'lm.binary', 'trie',
+                                                          1.5, 2.0)
+        self.assertIsInstance(stt.ds, backends.DeepSpeechBackend)
+        self.assertEqual(sorted(stt.load_times), ['lm_s', 'model_s'])
+        self.assertEqual(stt.detect_buffer(SECOND), "open the door")
+
+    def test_streaming_not_supported(self):
+        stt = speech2text.speech2text(BatchOnlyBackend())
+        self.assertEqual(stt.detect_buffer(SECOND), "batch")
+        self.assertRaises(ValueError, stt.create_stream)
+
+    def test_parse_backend(self):
+        create = backends.parse_backend('fake:rtf=0.25,fixed_s=0.1,cpu=1,text=yes,text=no')
+        first, second = create(), create()
+        self.assertIsNot(first, second)
+        self.assertEqual(first.texts, ["yes", "no"])
+        self.assertEqual((first.real_time_factor, first.fixed_s, first.cpu), (0.25, 0.1, True))
+        self.assertEqual(backends.parse_backend('fake')().texts, ["open the door"])
+        self.assertIsInstance(backends.parse_backend('deepspeech')(), backends.DeepSpeechBackend)
+        self.assertRaises(ValueError, backends.parse_backend, 'kaldi')
+        self.assertRaises(ValueError, backends.parse_backend, 'fake:speed=2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import io
+import json
+import tempfile
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import batch_transcribe
+
+
+class TestBatchTranscribe(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = os.path.abspath("./data")
+        self.audio_test_file1 = os.path.join(self.data_dir, "open_the_door.wav")
+
+    def test_find_wav_files_in_directory(self):
+        wav_files = batch_transcribe.find_wav_files(self.data_dir)
+        self.assertEqual([os.path.basename(f) for f in wav_files],
+                         ['open_the_door.wav', 'please_close_the_door.wav'])
+
+    def test_find_wav_files_in_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest = os.path.join(tmp_dir, 'manifest.txt')
+            with open(manifest, 'w') as fout:
+                fout.write('# nightly recordings\n\n')
+                fout.write(self.audio_test_file1 + '\n')
+                fout.write('relative.wav\n')
+
+            wav_files = batch_transcribe.find_wav_files(manifest)
+        self.assertEqual(wav_files, [self.audio_test_file1,
+                                     os.path.join(tmp_dir, 'relative.wav')])
+
+    def test_transcribe_file(self):
+        with mock.patch.object(batch_transcribe, '_stt') as mock_stt:
+            mock_stt.detect_file.return_value = "open the door "
+            result = batch_transcribe.transcribe_file(self.audio_test_file1)
+
+        self.assertEqual(result['text'], "open the door ")
+        self.assertAlmostEqual(result['audio_s'], 2.944)
+        self.assertIn('inference_s', result)
+        self.assertNotIn('error', result)
+
+    def test_transcribe_file_error_is_reported(self):
+        with mock.patch.object(batch_transcribe, '_stt') as mock_stt:
+            result = batch_transcribe.transcribe_file('missing.wav')
+        self.assertIn('error', result)
+
+    def test_segment_tasks(self):
+        tasks = list(batch_transcribe.segment_tasks([self.audio_test_file1], 200))
+        self.assertGreater(len(tasks), 0)
+        for index, (file_name, segment_index, pcm) in enumerate(tasks):
+            self.assertEqual(file_name, self.audio_test_file1)
+            self.assertEqual(segment_index, index)
+            self.assertIsInstance(pcm, bytes)
+
+    def test_run_batch_with_backend(self):
+        output = io.StringIO()
+        wav_files = batch_transcribe.find_wav_files(self.data_dir)
+        num_results = batch_transcribe.run_batch(wav_files, output, 2, None, None,
+                                                 backend='fake:text=open the door')
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(num_results, 2)
+        self.assertEqual(sorted(r['file'] for r in results), wav_files)
+        self.assertEqual({r['text'] for r in results}, {"open the door"})
+
+
+if __name__ == '__main__':
+    unittest.main()
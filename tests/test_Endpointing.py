@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import random
+import unittest
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import endpointing
+import frame_sources
+
+
+def frames_of(decisions):
+    # distinct frames so the segments show which frames they hold
+    return [bytes([i % 256, i // 256]) for i in range(len(decisions))]
+
+
+def run(segmenter, decisions):
+    events = []
+    segments = []
+    for frame, is_speech in zip(frames_of(decisions), decisions):
+        event = segmenter.process(frame, is_speech)
+        events.append(event)
+        if event in (AudioStream.SPEECH_OFFSET, AudioStream.SEGMENT_FULL):
+            segments.append(bytes(segmenter.pop_segment()))
+    segment = segmenter.flush()
+    if segment:
+        segments.append(bytes(segment))
+    return events, segments
+
+
+class TestEndpointer(unittest.TestCase):
+
+    def test_default_matches_vad_segmenter(self):
+        rng = random.Random(3)
+        for max_segment_frames in [None, 7]:
+            decisions = []
+            while len(decisions) < 3000:
+                decisions += [rng.random() < 0.5] * rng.randint(1, 30)
+
+            config = endpointing.EndpointConfig(
+                onset_window_ms=60, offset_window_ms=60,
+                max_segment_ms=max_segment_frames and max_segment_frames * 30)
+            self.assertEqual(run(endpointing.Endpointer(config), decisions),
+                             run(AudioStream.VadSegmenter(2, max_segment_frames=max_segment_frames),
+                                 decisions))
+
+    def test_pre_roll(self):
+        decisions = [0] * 10 + [1] * 10 + [0] * 10
+        frames = frames_of(decisions)
+        config = endpointing.EndpointConfig(onset_window_ms=60, offset_window_ms=60,
+                                            pre_roll_ms=90)
+        _, segments = run(endpointing.Endpointer(config), decisions)
+        # onset on the 2nd speech frame, 3 pre-roll + 2 window frames before it
+        self.assertEqual(segments[0][:10], b''.join(frames[7:12]))
+
+    def test_min_segment(self):
+        decisions = [0] * 5 + [1] * 3 + [0] * 5 + [1] * 20 + [0] * 5
+        config = endpointing.EndpointConfig(onset_window_ms=60, offset_window_ms=60,
+                                            min_segment_ms=300)
+        endpointer = endpointing.Endpointer(config)
+        events, segments = run(endpointer, decisions)
+        self.assertIn(endpointing.SEGMENT_DROPPED, events)
+        self.assertEqual(len(segments), 1)
+        self.assertEqual(endpointer.segment_info['reason'], 'offset')
+
+    def test_no_speech_lost_after_full_cut(self):
+        """
+        the tail of an utterance cut by max_segment_ms is kept even when it
+        is shorter than min_segment_ms.
+        """
+        decisions = [1] * 60 + [0] * 33
+        frames = frames_of(decisions)
+        config = endpointing.EndpointConfig(max_segment_ms=1500, min_segment_ms=600)
+        endpointer = endpointing.Endpointer(config)
+        events, segments = run(endpointer, decisions)
+
+        self.assertIn(AudioStream.SEGMENT_FULL, events)
+        self.assertNotIn(endpointing.SEGMENT_DROPPED, events)
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(endpointer.segment_info['reason'], 'offset')
+        # every speech frame ends up in a segment, in order
+        self.assertIn(b''.join(frames[:60]), b''.join(segments))
+
+    def test_offset_latency(self):
+        decisions = [0] * 5 + [1] * 20 + [0] * 20
+        config = endpointing.EndpointConfig(onset_window_ms=90, offset_window_ms=300)
+        endpointer = endpointing.Endpointer(config)
+        run(endpointer, decisions)
+
+        info = endpointer.segment_info
+        self.assertEqual(info['reason'], 'offset')
+        # more than 90% of 10 frames non speech: the 10th silent frame
+        self.assertEqual(info['offset_latency_ms'], 300)
+        self.assertEqual(info['onset_latency_ms'], 60)
+        self.assertEqual(info['hangover_ms'], 300)
+
+    def test_adaptive_hangover(self):
+        # a short command after a long quiet stretch
+        decisions = [0] * 400 + [1] * 20 + [0] * 30
+        latencies = []
+        for adaptive in [False, True]:
+            config = endpointing.EndpointConfig(offset_window_ms=600, adaptive=adaptive,
+                                                min_offset_window_ms=150)
+            endpointer = endpointing.Endpointer(config)
+            run(endpointer, decisions)
+            latencies.append(endpointer.segment_info['offset_latency_ms'])
+        self.assertLess(latencies[1], latencies[0])
+        self.assertGreaterEqual(latencies[1], 150)
+
+    def test_invalid_ratio(self):
+        self.assertRaises(ValueError, endpointing.EndpointConfig, onset_ratio=1.0)
+
+
+class TestEndpointCollector(unittest.TestCase):
+
+    def test_matches_voice_segment_collector(self):
+        for name in ["open_the_door.wav", "please_close_the_door.wav"]:
+            file_name = os.path.abspath(os.path.join("./data", name))
+            with frame_sources.WaveFileSource(file_name) as source:
+                vad_filter = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+                expected = [bytes(s) for s in vad_filter.voice_segment_collector(200)]
+            with frame_sources.WaveFileSource(file_name) as source:
+                vad_filter = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+                results = list(vad_filter.endpoint_collector())
+
+            self.assertEqual([bytes(s) for s, _ in results], expected)
+            for segment, info in results:
+                self.assertEqual(info['frames'] * audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH,
+                                 len(segment))
+
+
+if __name__ == '__main__':
+    unittest.main()
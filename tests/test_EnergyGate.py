@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import wave
+import unittest
+
+import numpy as np
+import webrtcvad
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import energy_gate
+import frame_sources
+import metrics
+import multistream
+import vad_batch
+
+FRAME_BYTES = audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH
+
+
+class CountingVad(object):
+    """
+    says speech for frames with samples above 1000 and counts the calls.
+    """
+    def __init__(self):
+        self.num_calls = 0
+
+    def is_speech(self, frame, rate):
+        self.num_calls += 1
+        return bool(np.abs(np.frombuffer(frame, np.int16)).max() > 1000)
+
+
+def tone(num_frames, amplitude):
+    t = np.arange(num_frames * audio_defaults.CHUNK)
+    return (amplitude * np.sin(2 * np.pi * 440 * t / audio_defaults.RATE)).astype(np.int16)
+
+
+class TestEnergyGate(unittest.TestCase):
+
+    def setUp(self):
+        pcm = b''
+        for name in ["open_the_door.wav", "please_close_the_door.wav"] * 2:
+            with wave.open(os.path.abspath(os.path.join("./data", name))) as fin:
+                pcm += fin.readframes(fin.getnframes())
+        # low level noise, so the silence is not digital
+        rng = np.random.default_rng(1)
+        samples = np.frombuffer(pcm, np.int16) + rng.normal(0, 30, len(pcm) // 2)
+        self.samples = np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+
+    def frames(self, samples):
+        data = samples.tobytes()
+        return [data[pos:pos + FRAME_BYTES] for pos in range(0, len(data) - FRAME_BYTES + 1, FRAME_BYTES)]
+
+    def test_silence_skips_vad(self):
+        vad = CountingVad()
+        gate = energy_gate.EnergyGate(vad, warmup_ms=300, hangover_ms=0)
+        decisions = [gate.is_speech(frame, audio_defaults.RATE) for frame in self.frames(tone(50, 0))]
+
+        # 10 warmup frames go to the vad, all other frames are gated
+        self.assertEqual(vad.num_calls, 10)
+        self.assertEqual(decisions, [False] * 50)
+        self.assertEqual(gate.num_frames, 50)
+        self.assertEqual(gate.num_gated, 40)
+        self.assertAlmostEqual(gate.gated_fraction, 0.8)
+
+    def test_loud_frames_reach_vad(self):
+        vad = CountingVad()
+        gate = energy_gate.EnergyGate(vad, warmup_ms=0, hangover_ms=0)
+        samples = np.concatenate((tone(20, 10), tone(10, 3000), tone(20, 10)))
+        decisions = [gate.is_speech(frame, audio_defaults.RATE) for frame in self.frames(samples)]
+
+        self.assertEqual(decisions, [False] * 20 + [True] * 10 + [False] * 20)
+        self.assertEqual(vad.num_calls, 10)
+
+    def test_hangover(self):
+        vad = CountingVad()
+        gate = energy_gate.EnergyGate(vad, warmup_ms=0, hangover_ms=150)
+        samples = np.concatenate((tone(20, 10), tone(10, 3000), tone(20, 10)))
+        decisions = [gate.is_speech(frame, audio_defaults.RATE) for frame in self.frames(samples)]
+
+        # the 5 frames after the last speech decision go to the vad as well
+        self.assertEqual(decisions, [False] * 20 + [True] * 10 + [False] * 20)
+        self.assertEqual(vad.num_calls, 15)
+
+    def test_noise_floor_rises_slowly(self):
+        gate = energy_gate.EnergyGate(CountingVad(), floor_rise_db_per_s=1.0)
+        for frame in self.frames(tone(10, 10)):
+            gate.is_speech(frame, audio_defaults.RATE)
+        quiet_floor = gate.floor_db
+        for frame in self.frames(tone(100, 3000)):
+            gate.is_speech(frame, audio_defaults.RATE)
+        # 3 seconds of loud audio raise the floor by 3 dB
+        self.assertAlmostEqual(gate.floor_db - quiet_floor, 3.0, places=3)
+
+    def test_counters(self):
+        frames_total = metrics.REGISTRY.counter('energy_gate_frames_total').value
+        gated_total = metrics.REGISTRY.counter('energy_gate_gated_total').value
+        gate = energy_gate.EnergyGate(webrtcvad.Vad(audio_defaults.DETECTION_MODE))
+        vad_batch.speech_mask(self.samples, gate)
+
+        self.assertGreater(gate.num_gated, 0)
+        self.assertEqual(metrics.REGISTRY.counter('energy_gate_frames_total').value - frames_total,
+                         gate.num_frames)
+        self.assertEqual(metrics.REGISTRY.counter('energy_gate_gated_total').value - gated_total,
+                         gate.num_gated)
+
+    def test_speech_mask_matches_is_speech(self):
+        mode = audio_defaults.DETECTION_MODE
+        batch_gate = energy_gate.EnergyGate(webrtcvad.Vad(mode))
+        half = len(self.samples) // 2 // audio_defaults.CHUNK * audio_defaults.CHUNK
+        # in two calls, the state carries over
+        mask = np.concatenate((vad_batch.speech_mask(self.samples[:half], batch_gate),
+                               vad_batch.speech_mask(self.samples[half:], batch_gate)))
+
+        gate = energy_gate.EnergyGate(webrtcvad.Vad(mode))
+        decisions = [gate.is_speech(frame, audio_defaults.RATE) for frame in self.frames(self.samples)]
+
+        self.assertEqual(mask.tolist(), decisions)
+        self.assertEqual(batch_gate.num_gated, gate.num_gated)
+        self.assertAlmostEqual(batch_gate.floor_db, gate.floor_db, places=3)
+
+    def test_segments_match_ungated(self):
+        mode = audio_defaults.DETECTION_MODE
+        gate = energy_gate.EnergyGate(webrtcvad.Vad(mode))
+        gated = vad_batch.speech_mask(self.samples, gate)
+        plain = vad_batch.speech_mask(self.samples, webrtcvad.Vad(mode))
+
+        vad_num_frames = vad_batch.vad_buffer_frames(200)
+        self.assertGreater(gate.gated_fraction, 0.1)
+        self.assertGreater(np.mean(gated == plain), 0.95)
+        self.assertEqual(vad_batch.find_segments(gated, vad_num_frames).tolist(),
+                         vad_batch.find_segments(plain, vad_num_frames).tolist())
+
+    def test_vad_filter(self):
+        def segments(vad):
+            with frame_sources.BytesSource(self.samples.tobytes()) as source:
+                vad_filter = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE, vad=vad)
+                return [bytes(s) for s in vad_filter.voice_segment_collector(200)]
+
+        gate = energy_gate.EnergyGate(webrtcvad.Vad(audio_defaults.DETECTION_MODE))
+        self.assertEqual(segments(gate), segments(None))
+        self.assertGreater(gate.num_gated, 0)
+
+    def test_multistream(self):
+        segmenter = multistream.MultiStreamSegmenter(200, energy_gate=True)
+        for frame in self.frames(self.samples):
+            segmenter.process('a', frame)
+        self.assertIsInstance(segmenter.channels['a'].vad, energy_gate.EnergyGate)
+        self.assertGreater(segmenter.channels['a'].vad.num_gated, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import io
+import wave
+import struct
+import tempfile
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import frame_sources
+
+
+class TestFrameSources(unittest.TestCase):
+
+    def setUp(self):
+        self.audio_test_file1 = os.path.abspath("./data/open_the_door.wav")
+        with wave.open(self.audio_test_file1) as fin:
+            self.pcm = fin.readframes(fin.getnframes())
+        self.frame_bytes = audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH
+
+    def read_all(self, source):
+        frames = []
+        with source as src:
+            while src.is_active():
+                frame = src.get_frame()
+                if frame is not None:
+                    frames.append(bytes(frame))
+        return frames
+
+    def test_wave_file_source(self):
+        source = frame_sources.WaveFileSource(self.audio_test_file1)
+        self.assertEqual(source.get_rate(), audio_defaults.RATE)
+        self.assertEqual(source.get_chunk(), audio_defaults.CHUNK)
+
+        frames = self.read_all(source)
+        self.assertEqual(len(frames), len(self.pcm) // self.frame_bytes)
+        self.assertEqual(b''.join(frames), self.pcm[:len(frames) * self.frame_bytes])
+
+    def test_pcm_stream_source(self):
+        source = frame_sources.PcmStreamSource(io.BytesIO(self.pcm))
+        frames = self.read_all(source)
+        self.assertEqual(b''.join(frames), self.pcm[:len(frames) * self.frame_bytes])
+
+    def test_bytes_source_drops_partial_frame(self):
+        data = bytes(self.frame_bytes * 3 + 10)
+        frames = self.read_all(frame_sources.BytesSource(data))
+        self.assertEqual(len(frames), 3)
+
+    def test_source_inactive_when_closed(self):
+        source = frame_sources.BytesSource(bytes(self.frame_bytes))
+        self.assertFalse(source.is_active())
+        self.assertEqual(source.get_frame(), None)
+
+    def test_mapped_wave_source(self):
+        source = frame_sources.MappedWaveSource(self.audio_test_file1)
+        self.assertEqual(source.get_rate(), audio_defaults.RATE)
+        self.assertEqual(source.samples.tobytes(), self.pcm)
+
+        with mock.patch.object(frame_sources, 'MAPPED_RELEASE_BYTES', 4096):
+            frames = self.read_all(source)
+        self.assertEqual(frames, self.read_all(frame_sources.WaveFileSource(self.audio_test_file1)))
+
+    def test_mapped_wave_source_chunks(self):
+        # a LIST chunk before the data and a data size past the end of file
+        fmt = struct.pack('<HHIIHH', 1, 1, 8000, 16000, 2, 16)
+        data = self.pcm[:self.frame_bytes * 2]
+        riff = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt +
+                b'LIST' + struct.pack('<I', 3) + b'abc\x00' +
+                b'data' + struct.pack('<I', 0xFFFFFFFF) + data)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'killed.wav')
+            with open(file_name, 'wb') as fout:
+                fout.write(b'RIFF' + struct.pack('<I', len(riff)) + riff)
+
+            source = frame_sources.MappedWaveSource(file_name)
+            self.assertEqual(source.get_rate(), 8000)
+            self.assertEqual(b''.join(self.read_all(source)), data)
+
+    def test_mapped_wave_source_stereo_fails(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'stereo.wav')
+            with wave.open(file_name, 'wb') as fout:
+                fout.setnchannels(2)
+                fout.setsampwidth(2)
+                fout.setframerate(audio_defaults.RATE)
+                fout.writeframes(bytes(self.frame_bytes * 2))
+            self.assertRaises(ValueError, frame_sources.MappedWaveSource, file_name)
+
+    def test_vad_filter_on_wave_file(self):
+        """
+        segmenting a file runs through the real webrtcvad without a microphone.
+        """
+        with frame_sources.WaveFileSource(self.audio_test_file1) as source:
+            vf = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+            segments = list(vf.voice_segment_collector(200))
+
+        self.assertGreater(len(segments), 0)
+        for segment in segments:
+            self.assertEqual(len(segment) % self.frame_bytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import io
+import json
+import unittest
+import urllib.request
+
+sys.path.append(os.path.abspath(".."))
+
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter('calls_total')
+        counter.inc()
+        counter.inc(4)
+        self.assertEqual(counter.value, 5)
+        self.assertIs(self.registry.counter('calls_total'), counter)
+
+    def test_name_kind_clash(self):
+        self.registry.counter('calls_total')
+        self.assertRaises(ValueError, self.registry.histogram, 'calls_total')
+
+    def test_gauge_fn(self):
+        items = [1, 2, 3]
+        gauge = self.registry.gauge('depth', fn=lambda: len(items))
+        self.assertEqual(gauge.value, 3)
+        items.pop()
+        self.assertEqual(self.registry.snapshot()['depth'], 2)
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('latency_seconds', buckets=(0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 2.0]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+        self.assertEqual(histogram.snapshot()['buckets'], {'0.1': 2, '1.0': 3, '+Inf': 4})
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.75), 1.0)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+        self.assertIsNone(self.registry.histogram('empty').quantile(0.5))
+
+    def test_prometheus_text(self):
+        self.registry.counter('calls_total', 'VAD calls').inc(3)
+        self.registry.histogram('latency_seconds', buckets=(0.1,)).observe(0.05)
+        text = metrics.prometheus_text(self.registry)
+
+        self.assertIn('# HELP calls_total VAD calls\n', text)
+        self.assertIn('# TYPE calls_total counter\ncalls_total 3\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('latency_seconds_count 1\n', text)
+
+    def test_json_lines_sink(self):
+        self.registry.counter('calls_total').inc(2)
+        stream = io.StringIO()
+        sink = metrics.JsonLinesSink(stream, interval=60, registry=self.registry).start()
+        sink.stop()
+
+        line = json.loads(stream.getvalue())
+        self.assertEqual(line['calls_total'], 2)
+        self.assertIn('time', line)
+
+    def test_prometheus_exporter(self):
+        self.registry.counter('calls_total').inc()
+        exporter = metrics.PrometheusExporter(0, registry=self.registry).start()
+        try:
+            host, port = exporter.server_address
+            url = 'http://{}:{}/metrics'.format(host, port)
+            body = urllib.request.urlopen(url, timeout=5).read().decode('utf-8')
+        finally:
+            exporter.stop()
+        self.assertIn('calls_total 1\n', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
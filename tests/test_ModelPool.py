@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.abspath(".."))
+
+import model_pool
+import speech2text
+
+
+class BlockingRecognizer(object):
+    """
+    detect_buffer returns name once release is set.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def detect_buffer(self, audio_buffer):
+        self.started.set()
+        self.release.wait(5)
+        return self.name
+
+
+class TestModelPool(unittest.TestCase):
+
+    def fake(self, text):
+        return speech2text.speech2text(speech2text.FakeModel([text]))
+
+    def test_routing(self):
+        pool = model_pool.ModelPool()
+        pool.add(self.fake("hallo"), tags=['de'])
+        pool.add(self.fake("hello"), tags=['en', 'medical'])
+        pool.add(self.fake("hello"), tags=['en'])
+
+        self.assertEqual(pool.tags, {'de', 'en', 'medical'})
+        self.assertEqual(pool.detect_buffer(bytes(960), 'de'), "hallo")
+        self.assertEqual(pool.detect_buffer(bytes(960), 'en'), "hello")
+        self.assertEqual(pool.detect_buffer(bytes(960), 'medical'), "hello")
+        self.assertRaises(ValueError, pool.detect_buffer, bytes(960), 'fr')
+
+        # untagged requests go to the instances with the fewest tags first
+        with pool.checkout() as first, pool.checkout() as second, pool.checkout() as third:
+            self.assertEqual([pool.instances[i].recognizer for i in [0, 2, 1]],
+                             [first, second, third])
+
+    def test_checkout_waits(self):
+        pool = model_pool.ModelPool()
+        recognizer = BlockingRecognizer("busy")
+        pool.add(recognizer, tags=['en'])
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(pool.detect_buffer(b'', 'en')))
+        first.start()
+        self.assertTrue(recognizer.started.wait(5))
+
+        # the only instance is busy
+        self.assertRaises(TimeoutError, pool.acquire, 'en', 0.05)
+
+        second = threading.Thread(target=lambda: results.append(pool.detect_buffer(b'', 'en')))
+        second.start()
+        time.sleep(0.1)
+        recognizer.release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(results, ["busy", "busy"])
+        stats = pool.stats[0]
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['tags'], ['en'])
+        # the second request waited for the first one
+        self.assertGreaterEqual(stats['wait_s'], 0.09)
+        self.assertGreater(stats['busy_s'], 0.09)
+        self.assertGreater(stats['utilization'], 0)
+        self.assertLessEqual(stats['utilization'], 1)
+
+    def test_concurrent_requests_use_all_instances(self):
+        pool = model_pool.ModelPool()
+        recognizers = [BlockingRecognizer(str(i)) for i in range(3)]
+        for recognizer in recognizers:
+            pool.add(recognizer)
+
+        threads = [threading.Thread(target=pool.detect_buffer, args=(b'',)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for recognizer in recognizers:
+            self.assertTrue(recognizer.started.wait(5))
+            recognizer.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual([stats['requests'] for stats in pool.stats], [1, 1, 1])
+
+    def test_empty_pool(self):
+        pool = model_pool.ModelPool()
+        self.assertRaises(ValueError, pool.acquire)
+        self.assertTrue(pool.wait_ready(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import wave
+import unittest
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import frame_sources
+import multistream
+
+
+class TestMultiStreamSegmenter(unittest.TestCase):
+
+    def setUp(self):
+        self.pcm = []
+        for name in ["open_the_door.wav", "please_close_the_door.wav"]:
+            with wave.open(os.path.abspath(os.path.join("./data", name))) as fin:
+                self.pcm.append(fin.readframes(fin.getnframes()))
+        # a third channel starting with a second of silence
+        self.pcm.append(bytes(audio_defaults.RATE * audio_defaults.SAMPLE_WIDTH) + self.pcm[0])
+
+    def single_stream_segments(self, pcm):
+        with frame_sources.BytesSource(pcm) as source:
+            vf = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+            return [bytes(s) for s in vf.voice_segment_collector(200)]
+
+    def interleave(self):
+        frame_bytes = audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH
+        longest = max(len(pcm) for pcm in self.pcm)
+        for pos in range(0, longest - frame_bytes + 1, frame_bytes):
+            for channel_id, pcm in enumerate(self.pcm):
+                if pos + frame_bytes <= len(pcm):
+                    yield channel_id, pcm[pos:pos + frame_bytes]
+
+    def test_channels_match_single_stream(self):
+        segmenter = multistream.MultiStreamSegmenter(200)
+        segments = {}
+        for channel_id, segment in segmenter.segment_collector(self.interleave()):
+            segments.setdefault(channel_id, []).append(bytes(segment))
+
+        for channel_id, pcm in enumerate(self.pcm):
+            self.assertEqual(segments.get(channel_id, []), self.single_stream_segments(pcm))
+        self.assertEqual(len(segmenter), 0)
+
+    def test_close_channel(self):
+        segmenter = multistream.MultiStreamSegmenter(200)
+        frame = bytes(audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH)
+        self.assertEqual(segmenter.process('call-1', frame), None)
+        self.assertEqual(len(segmenter), 1)
+        self.assertEqual(segmenter.close_channel('call-1'), None)
+        self.assertEqual(len(segmenter), 0)
+
+    def test_invalid_mode(self):
+        self.assertRaises(ValueError, multistream.MultiStreamSegmenter, 200, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
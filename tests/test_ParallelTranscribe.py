@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import wave
+import tempfile
+import time
+import multiprocessing
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import audio_defaults
+import batch_transcribe
+import parallel_transcribe
+import speech2text
+
+
+class SlowRecognizer(object):
+    """
+    takes longer for earlier segments, so they finish out of order.
+    """
+    def __init__(self, delays):
+        self.delays = delays
+
+    def detect_buffer(self, audio_buffer):
+        index = audio_buffer[0]
+        time.sleep(self.delays[index])
+        return "segment {}".format(index)
+
+
+def _fake_init_worker(*args):
+    batch_transcribe._stt = speech2text.speech2text(speech2text.FakeModel(["open the door"]))
+
+
+class TestParallelTranscribe(unittest.TestCase):
+
+    def setUp(self):
+        with wave.open(os.path.abspath("./data/open_the_door.wav")) as fin:
+            clip = fin.readframes(fin.getnframes())
+        silence = bytes(audio_defaults.RATE * audio_defaults.SAMPLE_WIDTH)
+        # the 2.944 s clip at 1 s and at 5.944 s
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.file_name = os.path.join(tmp_dir.name, 'long.wav')
+        with wave.open(self.file_name, 'wb') as fout:
+            fout.setnchannels(1)
+            fout.setsampwidth(2)
+            fout.setframerate(audio_defaults.RATE)
+            self.pcm = silence + clip + silence * 2 + clip + silence
+            fout.writeframes(self.pcm)
+
+    def test_in_order(self):
+        results = [(2, 'c'), (0, 'a'), (3, 'd'), (1, 'b'), (5, 'f')]
+        self.assertEqual(list(parallel_transcribe.in_order(results)),
+                         [(0, 'a'), (1, 'b'), (2, 'c'), (3, 'd'), (5, 'f')])
+
+    def test_in_order_streams(self):
+        yielded = []
+
+        def results():
+            for pair in [(1, 'b'), (0, 'a'), (3, 'd'), (2, 'c')]:
+                yielded.append(pair[0])
+                yield pair
+
+        ordered = parallel_transcribe.in_order(results())
+        self.assertEqual(next(ordered), (0, 'a'))
+        # 0 and 1 are handed out before 3 and 2 arrive
+        self.assertEqual(next(ordered), (1, 'b'))
+        self.assertEqual(yielded, [1, 0])
+
+    def test_timed_segments(self):
+        segments = list(parallel_transcribe.timed_segments(self.file_name))
+        self.assertEqual(len(segments), 4)
+        bytes_per_s = audio_defaults.RATE * audio_defaults.SAMPLE_WIDTH
+        for index, start_s, end_s, segment in segments:
+            # the timestamps point at the segment audio in the file
+            start = int(round(start_s * bytes_per_s))
+            self.assertEqual(self.pcm[start:int(round(end_s * bytes_per_s))], segment)
+        # two segments in each clip
+        self.assertTrue(1.0 <= segments[0][1] < segments[1][2] <= 3.944)
+        self.assertTrue(5.944 <= segments[2][1] < segments[3][2] <= 8.888)
+
+    def test_transcribe_segments_in_order(self):
+        delays = [0.2, 0.15, 0.1, 0.05, 0.0, 0.0, 0.0, 0.0]
+        segments = [(i, i * 1.0, i + 0.5, bytes([i]) * 10) for i in range(len(delays))]
+        recognizers = [SlowRecognizer(delays) for _ in range(4)]
+
+        start = time.perf_counter()
+        results = list(parallel_transcribe.transcribe_segments(segments, recognizers))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([r['text'] for r in results],
+                         ["segment {}".format(i) for i in range(len(delays))])
+        self.assertEqual([(r['start_s'], r['end_s']) for r in results],
+                         [(i * 1.0, i + 0.5) for i in range(len(delays))])
+        # serial decoding takes 0.5 s
+        self.assertLess(elapsed, 0.4)
+
+    def test_transcribe_file(self):
+        recognizers = [speech2text.speech2text(speech2text.FakeModel(["open the door"]))
+                       for _ in range(2)]
+        results = list(parallel_transcribe.transcribe_file(self.file_name, recognizers))
+        self.assertEqual([r['segment'] for r in results], [0, 1, 2, 3])
+        self.assertEqual([r['text'] for r in results], ["open the door"] * 4)
+        for result, next_result in zip(results, results[1:]):
+            self.assertLess(result['end_s'], next_result['start_s'])
+        self.assertEqual(results[0]['file'], self.file_name)
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork',
+                         'the fake worker model is installed by forking')
+    def test_transcribe_file_processes(self):
+        with mock.patch.object(batch_transcribe, '_init_worker', _fake_init_worker):
+            results = list(parallel_transcribe.transcribe_file_processes(
+                self.file_name, 2, 'model', 'alphabet'))
+        self.assertEqual([r['segment'] for r in results], [0, 1, 2, 3])
+        self.assertEqual([r['text'] for r in results], ["open the door"] * 4)
+        for result, next_result in zip(results, results[1:]):
+            self.assertLess(result['start_s'], result['end_s'])
+            self.assertLess(result['end_s'], next_result['start_s'])
+
+
+if __name__ == '__main__':
+    unittest.main()
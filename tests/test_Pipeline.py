@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import queue
+import threading
+import time
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import pipeline
+from AudioStream import SpeechSegment
+
+
+class TestBoundedQueue(unittest.TestCase):
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, pipeline.BoundedQueue, 2, 'drop-all')
+
+    def test_drop_oldest(self):
+        q = pipeline.BoundedQueue(2, pipeline.DROP_OLDEST)
+        for item in [1, 2, 3, 4]:
+            self.assertTrue(q.put(item))
+
+        self.assertEqual(q.num_queued, 4)
+        self.assertEqual(q.num_dropped, 2)
+        self.assertEqual([q.get_nowait(), q.get_nowait()], [3, 4])
+
+    def test_drop_newest(self):
+        q = pipeline.BoundedQueue(2, pipeline.DROP_NEWEST)
+        results = [q.put(item) for item in [1, 2, 3, 4]]
+
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(q.stats, {'queued': 2, 'dropped': 2, 'depth': 2})
+        self.assertEqual([q.get_nowait(), q.get_nowait()], [1, 2])
+
+    def test_block(self):
+        q = pipeline.BoundedQueue(1, pipeline.BLOCK)
+        q.put(1)
+        self.assertRaises(queue.Full, q.put, 2, timeout=0.01)
+        self.assertEqual(q.num_dropped, 0)
+
+    def test_unbounded_never_drops(self):
+        q = pipeline.BoundedQueue(0, pipeline.DROP_NEWEST)
+        for item in range(100):
+            q.put(item)
+        self.assertEqual(q.stats, {'queued': 100, 'dropped': 0, 'depth': 100})
+
+    def test_set_maxsize(self):
+        q = pipeline.BoundedQueue(0, pipeline.DROP_OLDEST)
+        for item in range(5):
+            q.put(item)
+        q.set_maxsize(2)
+        # the backlog stays, new items replace the oldest
+        self.assertTrue(q.put(5))
+        self.assertEqual(q.stats, {'queued': 6, 'dropped': 1, 'depth': 5})
+        self.assertEqual(q.get_nowait(), 1)
+
+
+class TestTranscriptionPipeline(unittest.TestCase):
+
+    def test_all_segments_transcribed(self):
+        recognizers = [mock.Mock(), mock.Mock()]
+        for recognizer in recognizers:
+            recognizer.detect_buffer.side_effect = lambda segment: segment.decode()
+
+        segments = [b'one', b'two', b'three', b'four']
+        p = pipeline.TranscriptionPipeline(recognizers, queue_size=2)
+        results = sorted(p.run(iter(segments)))
+
+        self.assertEqual(results, [(0, 'one'), (1, 'two'), (2, 'three'), (3, 'four')])
+        self.assertEqual(p.stats['dropped'], 0)
+
+    def test_drop_newest_under_backpressure(self):
+        """
+        a stalled worker makes the producer drop segments instead of blocking.
+        """
+        release = threading.Event()
+        recognizer = mock.Mock()
+        recognizer.detect_buffer.side_effect = lambda segment: release.wait() and segment
+
+        p = pipeline.TranscriptionPipeline([recognizer], queue_size=1,
+                                           policy=pipeline.DROP_NEWEST)
+
+        def segments():
+            for index in range(5):
+                yield index
+            release.set()
+
+        results = list(p.run(segments()))
+        self.assertEqual(len(results) + p.stats['dropped'], 5)
+        self.assertGreater(p.stats['dropped'], 0)
+
+    def test_failed_inference_yields_none(self):
+        recognizer = mock.Mock()
+        recognizer.detect_buffer.side_effect = RuntimeError("decoder error")
+        p = pipeline.TranscriptionPipeline([recognizer])
+
+        self.assertEqual(list(p.run([b'data1'])), [(0, None)])
+
+    def test_speech_segment_records(self):
+        """
+        workers decode the PCM of SpeechSegment records and record the
+        capture to transcript time.
+        """
+        recognizer = mock.Mock()
+        recognizer.detect_buffer.side_effect = lambda segment: bytes(segment).decode()
+        segments = [SpeechSegment(memoryview(b'one'), 0, 1, 1.0, time.time() - 1.0),
+                    SpeechSegment(memoryview(b'two'), 320, 1, 1.0, time.time())]
+
+        count = pipeline.CAPTURE_TO_TRANSCRIPT.count
+        p = pipeline.TranscriptionPipeline([recognizer])
+        self.assertEqual(sorted(p.run(segments)), [(0, 'one'), (1, 'two')])
+        self.assertEqual(pipeline.CAPTURE_TO_TRANSCRIPT.count, count + 2)
+        for call in recognizer.detect_buffer.call_args_list:
+            self.assertIsInstance(call[0][0], memoryview)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import time
+import multiprocessing
+import unittest
+
+sys.path.append(os.path.abspath(".."))
+
+import batch_transcribe
+import prefork
+
+# set by load_state, in the parent when preloaded
+_state = None
+
+
+def load_state(value):
+    global _state
+    _state = (value, os.getpid())
+
+
+def fail():
+    raise(IOError("no model"))
+
+
+def hang():
+    time.sleep(10)
+
+
+def get_state(_):
+    return _state
+
+
+@unittest.skipUnless(multiprocessing.get_start_method() == 'fork',
+                     'the test helpers are shared by forking')
+class TestPreforkPool(unittest.TestCase):
+
+    def tearDown(self):
+        global _state
+        _state = None
+        batch_transcribe._stt = None
+
+    def test_independent_workers(self):
+        with prefork.PreforkPool(2, load_state, ('model',)) as pool:
+            states = list(pool.imap_unordered(get_state, range(4)))
+            stats = pool.stats
+        # every worker loaded the model itself
+        self.assertEqual({state[0] for state in states}, {'model'})
+        self.assertNotIn(os.getpid(), {state[1] for state in states})
+        self.assertEqual(len(pool.workers), 2)
+        self.assertFalse(stats['preforked'])
+        self.assertEqual(stats['load_s'], 0.0)
+        self.assertGreaterEqual(stats['startup_s'], stats['max_worker_startup_s'])
+
+    def test_preloaded_workers(self):
+        with prefork.PreforkPool(2, preload=load_state, preload_args=('model',)) as pool:
+            states = set(pool.imap_unordered(get_state, range(4)))
+        # loaded once, by this process, before forking
+        self.assertEqual(states, {('model', os.getpid())})
+        self.assertNotIn(os.getpid(), [worker['pid'] for worker in pool.workers])
+        self.assertTrue(pool.stats['preforked'])
+
+    def test_initializer_error(self):
+        pool = prefork.PreforkPool(2, fail)
+        with self.assertRaises(RuntimeError) as error:
+            pool.start()
+        self.assertIn('no model', str(error.exception))
+
+    def test_ready_timeout(self):
+        pool = prefork.PreforkPool(1, hang, ready_timeout=0.2)
+        self.assertRaises(TimeoutError, pool.start)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, prefork.PreforkPool, 0)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), 'needs /proc smaps_rollup')
+    def test_memory_mb(self):
+        memory = prefork.memory_mb()
+        self.assertEqual(sorted(memory), ['private_mb', 'pss_mb', 'rss_mb'])
+        self.assertGreater(memory['rss_mb'], memory['private_mb'] * 0.5)
+        self.assertEqual(prefork.memory_mb(-1), {})
+
+    def test_batch_worker_pool(self):
+        tasks = [('file.wav', index, bytes(3200)) for index in range(4)]
+        for preload in [False, True]:
+            with batch_transcribe.worker_pool(2, 'model', 'alphabet', preload=preload,
+                                              backend='fake:text=open the door') as pool:
+                results = list(pool.imap_unordered(batch_transcribe.transcribe_segment, tasks))
+            self.assertEqual(sorted(result['segment'] for result in results), [0, 1, 2, 3])
+            self.assertEqual({result['text'] for result in results}, {"open the door"})
+            # only the preforked pool loaded the model in this process
+            self.assertEqual(batch_transcribe._stt is not None, preload)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import wave
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import resample
+import speech2text
+
+
+def tone(rate, seconds, frequency=440, channels=1, amplitude=8000):
+    t = np.arange(int(rate * seconds)) / rate
+    mono = (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+    return np.repeat(mono[:, None], channels, axis=1).tobytes()
+
+
+class TestResampler(unittest.TestCase):
+
+    def test_tone(self):
+        for in_rate, channels in [(8000, 1), (44100, 2), (48000, 2), (22050, 1)]:
+            out = np.frombuffer(resample.convert(tone(in_rate, 1, channels=channels),
+                                                 in_rate, channels), np.int16)
+            self.assertEqual(len(out), audio_defaults.RATE)
+
+            expected = 8000 * np.sin(2 * np.pi * 440 * np.arange(len(out)) / audio_defaults.RATE)
+            # the edges see the zeros before and after the tone
+            self.assertLess(np.abs(out[200:-200] - expected[200:-200]).max(), 4)
+
+    def test_aliasing_is_filtered(self):
+        out = np.frombuffer(resample.convert(tone(48000, 1, frequency=12000), 48000), np.int16)
+        self.assertLess(np.abs(out[500:-500]).max(), 10)
+
+    def test_blocks_match_whole_buffer(self):
+        pcm = tone(44100, 0.5, channels=2)
+        resampler = resample.Resampler(44100, audio_defaults.RATE, 2)
+        # odd block sizes split samples and frames
+        blocks = []
+        pos = 0
+        for size in [1, 3, 1001, 4096, 7, 30000] * 10:
+            blocks.append(resampler.process(pcm[pos:pos + size]))
+            pos += size
+        blocks.append(resampler.process(pcm[pos:]))
+        blocks.append(resampler.flush())
+
+        self.assertEqual(b''.join(blocks), resample.convert(pcm, 44100, 2))
+
+    def test_downmix(self):
+        stereo = np.array([100, 300, -100, -301, 7, 7], dtype=np.int16)
+        self.assertEqual(resample.downmix(stereo, 2).tolist(), [200, -201, 7])
+        out = resample.convert(stereo.tobytes(), audio_defaults.RATE, 2)
+        self.assertEqual(np.frombuffer(out, np.int16).tolist(), [200, -201, 7])
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, resample.Resampler, 0)
+
+
+class TestResampledWaveSource(unittest.TestCase):
+
+    def setUp(self):
+        with wave.open(os.path.abspath("./data/please_close_the_door.wav")) as fin:
+            self.pcm = fin.readframes(fin.getnframes())
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_wav(self, rate, channels):
+        mono = np.frombuffer(resample.convert(self.pcm, audio_defaults.RATE, 1, rate), np.int16)
+        file_name = os.path.join(self.tmp_dir.name, '{}_{}.wav'.format(rate, channels))
+        with wave.open(file_name, 'wb') as fout:
+            fout.setnchannels(channels)
+            fout.setsampwidth(audio_defaults.SAMPLE_WIDTH)
+            fout.setframerate(rate)
+            fout.writeframes(np.repeat(mono[:, None], channels, axis=1).tobytes())
+        return file_name
+
+    def segments(self, source):
+        with source:
+            vad_filter = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+            return [bytes(s) for s in vad_filter.voice_segment_collector(200)]
+
+    def test_segments_of_converted_file(self):
+        file_name = self.write_wav(48000, 2)
+        source = resample.open_wave_source(file_name)
+        self.assertIsInstance(source, resample.ResampledWaveSource)
+        self.assertEqual(source.get_rate(), audio_defaults.RATE)
+
+        segments = self.segments(source)
+        self.assertGreater(len(segments), 0)
+        total = sum(len(s) for s in segments)
+        self.assertLessEqual(total, len(self.pcm))
+
+    def test_native_file_is_mapped(self):
+        file_name = self.write_wav(audio_defaults.RATE, 1)
+        self.assertIsInstance(resample.open_wave_source(file_name), resample.MappedWaveSource)
+
+    def test_detect_file_converts(self):
+        stt = speech2text.speech2text(speech2text.FakeModel(["please close the door"]))
+        self.assertEqual(stt.detect_file(self.write_wav(8000, 1)), "please close the door")
+        self.assertTrue(stt.detect_file(self.write_wav(44100, 2), vad_buffer_ms=200).
+                        startswith("please close the door"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import wave
+import functools
+import threading
+import unittest
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import frame_sources
+import shm_ring
+
+FRAME_BYTES = audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH
+
+
+def slow_writer(ring, stop, rate=audio_defaults.RATE, chunk=audio_defaults.CHUNK):
+    # writes 10 frames without waiting for the reader
+    for index in range(10):
+        ring.write(bytes([index]) * FRAME_BYTES)
+
+
+class TestSharedFrameRing(unittest.TestCase):
+
+    def ring(self, num_slots):
+        ring = shm_ring.SharedFrameRing(num_slots=num_slots, frame_bytes=4)
+        self.addCleanup(ring.close)
+        return ring
+
+    def test_write_read(self):
+        ring = self.ring(4)
+        self.assertIsNone(ring.read())
+        for index in range(10):
+            self.assertTrue(ring.write(bytes([index]) * 4, capture_time=index + 0.5))
+            self.assertEqual(ring.read(), (index + 0.5, bytes([index]) * 4))
+        self.assertIsNone(ring.read())
+        self.assertEqual(ring.stats, {'written': 10, 'read': 10, 'depth': 0, 'overruns': 0,
+                                      'input_overflows': 0})
+
+    def test_overrun(self):
+        ring = self.ring(3)
+        results = [ring.write(bytes([index]) * 4) for index in range(5)]
+        # the newest frames are dropped once the ring is full
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.num_overruns, 2)
+        self.assertEqual([ring.read()[1] for _ in range(3)], [bytes([i]) * 4 for i in range(3)])
+        self.assertTrue(ring.write(b'\x09\x09'))
+        self.assertEqual(ring.read()[1], b'\x09\x09')
+
+    def test_attach(self):
+        ring = self.ring(4)
+        other = shm_ring.SharedFrameRing(ring.name, create=False)
+        self.assertEqual((other.num_slots, other.frame_bytes), (4, 4))
+        other.write(b'abcdefgh')
+        other.close_writer()
+        other.close()
+        # truncated to the slot size
+        self.assertEqual(ring.read()[1], b'abcd')
+        self.assertTrue(ring.writer_closed)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, shm_ring.SharedFrameRing, num_slots=0)
+
+
+class TestShmCapture(unittest.TestCase):
+
+    def setUp(self):
+        pcm = b''
+        for name in ["open_the_door.wav", "please_close_the_door.wav"]:
+            with wave.open(os.path.abspath(os.path.join("./data", name))) as fin:
+                pcm += fin.readframes(fin.getnframes())
+        self.pcm = pcm
+
+    def test_same_segments_as_bytes_source(self):
+        with frame_sources.BytesSource(self.pcm) as source:
+            expected = list(AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE).
+                            voice_segment_collector(200))
+
+        writer = functools.partial(shm_ring.synthetic_writer, pcm=self.pcm, realtime=False)
+        capture = shm_ring.ShmCapture(num_slots=512, writer=writer)
+        with capture as source:
+            segments = list(AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE).
+                            voice_segment_collector(200))
+            self.assertIsNotNone(source.last_capture_time)
+
+        self.assertEqual(segments, expected)
+        num_frames = len(self.pcm) // FRAME_BYTES
+        self.assertEqual(capture.stats['written'], num_frames)
+        self.assertEqual(capture.stats['read'], num_frames)
+        self.assertEqual(capture.stats['overruns'], 0)
+
+    def test_overruns_of_slow_reader(self):
+        capture = shm_ring.ShmCapture(num_slots=4, writer=slow_writer)
+        with capture as source:
+            # the reader only starts once the writer is done
+            while not capture.ring.writer_closed:
+                threading.Event().wait(0.01)
+            frames = []
+            while source.is_active():
+                frame = source.get_frame()
+                if frame is not None:
+                    frames.append(frame)
+
+        self.assertEqual(frames, [bytes([index]) * FRAME_BYTES for index in range(4)])
+        self.assertEqual(capture.stats['overruns'], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,10 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import threading
 
 import unittest
+import unittest.mock as mock
 
 sys.path.append(os.path.abspath(".."))
 
@@ -27,6 +29,89 @@ class TestSpeech2Text(unittest.TestCase):
         
         detected_text = stt.detect_file(self.audio_test_file1)
         self.assertEqual(detected_text, "open the door ")
+
+
+class TestStreamingRecognizer(unittest.TestCase):
+
+    def setUp(self):
+        self.model = speech2text.FakeModel(["open the door", "please close the door"],
+                                           words_per_second=4)
+        self.stt = speech2text.speech2text(self.model)
+        # 250 ms of 16 kHz silence
+        self.frame = bytes(8000)
+
+    def test_detect_buffer_with_fake_model(self):
+        self.assertEqual(self.stt.detect_buffer(self.frame), "open the door")
+        self.assertEqual(self.stt.detect_buffer(self.frame), "please close the door")
+
+    def test_partial_interval(self):
+        stream = self.stt.create_stream(partial_interval_ms=500)
+        self.assertEqual(stream.feed(self.frame), None)
+        self.assertEqual(stream.feed(self.frame), "open the")
+        self.assertEqual(stream.feed(self.frame), None)
+        self.assertEqual(stream.finish(), "open the door")
+        self.assertEqual(stream.finish(), '')
+
+    def test_detect_stream(self):
+        voice_frames = [([self.frame, self.frame], False),
+                        ([self.frame], False),
+                        ([self.frame], True),
+                        ([self.frame, self.frame], False),
+                        ([], True)]
+        results = list(self.stt.detect_stream(iter(voice_frames), partial_interval_ms=500))
+
+        self.assertEqual(results, [("open the", False),
+                                   ("open the door", True),
+                                   ("please close", False),
+                                   ("please close the door", True)])
+
+
+
+class TestDetectFileSegments(unittest.TestCase):
+
+    def setUp(self):
+        self.audio_test_file1 = os.path.abspath("./data/open_the_door.wav")
+        self.stt = speech2text.speech2text(speech2text.FakeModel(["open the door "]))
+
+    def test_detect_file_segments(self):
+        texts = list(self.stt.detect_file_segments(self.audio_test_file1))
+        self.assertGreater(len(texts), 0)
+        self.assertEqual(self.stt.detect_file(self.audio_test_file1, vad_buffer_ms=200),
+                         ' '.join(["open the door"] * len(texts)))
+
+    def test_long_file_is_segmented(self):
+        with mock.patch('audio_defaults.MAX_SEGMENT_MS', 100):
+            with mock.patch.object(self.stt, 'detect_file_segments',
+                                   return_value=iter(["open ", "", "the door"])) as segments:
+                self.assertEqual(self.stt.detect_file(self.audio_test_file1), "open the door")
+        segments.assert_called_once_with(self.audio_test_file1, speech2text.FILE_VAD_BUFFER_MS)
+
+
+class TestBackgroundLoading(unittest.TestCase):
+
+    def test_detect_waits_for_model(self):
+        stt = speech2text.speech2text()
+        release = threading.Event()
+
+        def load_model(model, alphabet, lm, trie):
+            release.wait()
+            stt.ds = speech2text.FakeModel(["open the door"])
+
+        with mock.patch.object(stt, 'load_model', side_effect=load_model):
+            thread = stt.load_model_async(MODEL, ALPHABET, LM, TRIE)
+            self.assertFalse(stt.wait_ready(timeout=0.01))
+            self.assertEqual(stt.model_path, MODEL)
+
+            release.set()
+            self.assertEqual(stt.detect_buffer(bytes(3200)), "open the door")
+            thread.join()
+
+    def test_load_error(self):
+        stt = speech2text.speech2text()
+        with mock.patch.object(stt, 'load_model', side_effect=IOError("no model")):
+            stt.load_model_async(MODEL, ALPHABET, LM, TRIE).join()
+        self.assertRaises(RuntimeError, stt.detect_buffer, bytes(3200))
+
         
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
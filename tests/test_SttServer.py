@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import model_pool
+import stt_server
+
+
+class TestSttServer(unittest.TestCase):
+
+    def start_server(self, address):
+        self.recognizer = mock.Mock()
+        self.recognizer.detect_buffer.side_effect = lambda audio: "{} bytes".format(len(audio))
+        server = stt_server.SttServer(address, [self.recognizer])
+
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_parse_address(self):
+        self.assertEqual(stt_server.parse_address('localhost:5005'), ('localhost', 5005))
+        self.assertEqual(stt_server.parse_address(':5005'), ('127.0.0.1', 5005))
+        self.assertEqual(stt_server.parse_address('/tmp/stt.sock'), '/tmp/stt.sock')
+        self.assertEqual(stt_server.parse_address('::1:5005'), ('::1', 5005))
+        self.assertRaises(ValueError, stt_server.parse_address, '0.0.0.0:5005')
+        self.assertEqual(stt_server.parse_address('0.0.0.0:5005', allow_remote=True),
+                         ('0.0.0.0', 5005))
+
+    def test_remote_needs_allow_remote(self):
+        self.assertRaises(ValueError, stt_server.SttServer, ('0.0.0.0', 0), [mock.Mock()])
+
+    def test_tcp(self):
+        server = self.start_server(('127.0.0.1', 0))
+        with stt_server.SttClient(server.server_address) as client:
+            self.assertEqual(client.detect_buffer(bytes(960)), "960 bytes")
+            self.assertEqual(client.detect_buffer(memoryview(bytes(32000))), "32000 bytes")
+
+    def test_unix_socket(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        server = self.start_server(os.path.join(tmp_dir.name, 'stt.sock'))
+
+        with stt_server.SttClient(server.server_address) as client:
+            self.assertEqual(client.detect_buffer(b''), "0 bytes")
+
+    def test_stale_socket_is_replaced(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        path = os.path.join(tmp_dir.name, 'stt.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+
+        server = self.start_server(path)
+        with stt_server.SttClient(server.server_address) as client:
+            self.assertEqual(client.detect_buffer(b''), "0 bytes")
+
+    def test_address_in_use(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        path = os.path.join(tmp_dir.name, 'model.pbmm')
+        with open(path, 'wb') as fout:
+            fout.write(b'weights')
+        # a file that is not a socket is never deleted
+        self.assertRaises(FileExistsError, stt_server.SttServer, path, [mock.Mock()])
+        self.assertTrue(os.path.exists(path))
+
+        # nor is the socket of a running server
+        path = os.path.join(tmp_dir.name, 'stt.sock')
+        self.start_server(path)
+        self.assertRaises(FileExistsError, stt_server.SttServer, path, [mock.Mock()])
+        self.assertTrue(os.path.exists(path))
+
+    def test_oversized_message(self):
+        server = self.start_server(('127.0.0.1', 0))
+        with mock.patch.object(stt_server, 'MAX_MESSAGE_BYTES', 100):
+            with stt_server.SttClient(server.server_address) as client:
+                self.assertRaises(RuntimeError, client.detect_buffer, bytes(960))
+        self.recognizer.detect_buffer.assert_not_called()
+
+    def test_inference_error(self):
+        server = self.start_server(('127.0.0.1', 0))
+        self.recognizer.detect_buffer.side_effect = ValueError("bad audio")
+
+        with stt_server.SttClient(server.server_address) as client:
+            self.assertRaises(RuntimeError, client.detect_buffer, bytes(960))
+
+            # the connection is still usable after an error
+            self.recognizer.detect_buffer.side_effect = None
+            self.recognizer.detect_buffer.return_value = "open the door"
+            self.assertEqual(client.detect_buffer(bytes(960)), "open the door")
+
+    def test_route_by_tag(self):
+        pool = model_pool.ModelPool()
+        for tag in ['en', 'de']:
+            recognizer = mock.Mock()
+            recognizer.detect_buffer.return_value = tag
+            pool.add(recognizer, tags=[tag])
+        server = stt_server.SttServer(('127.0.0.1', 0), pool)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+        with stt_server.SttClient(server.server_address, tag='de') as client:
+            self.assertEqual(client.detect_buffer(bytes(960)), "de")
+        with stt_server.SttClient(server.server_address, tag='en') as client:
+            self.assertEqual(client.detect_buffer(bytes(960)), "en")
+        with stt_server.SttClient(server.server_address, tag='fr') as client:
+            self.assertRaises(RuntimeError, client.detect_buffer, bytes(960))
+
+
+if __name__ == '__main__':
+    unittest.main()
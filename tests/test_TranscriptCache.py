@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import time
+import tempfile
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import backends
+import speech2text
+import transcript_cache
+
+
+class TestCacheKey(unittest.TestCase):
+
+    def test_key(self):
+        key = transcript_cache.cache_key(b'\x01\x02', 'model.pbmm')
+        self.assertEqual(key, transcript_cache.cache_key(memoryview(b'\x01\x02'), 'model.pbmm'))
+        self.assertNotEqual(key, transcript_cache.cache_key(b'\x01\x03', 'model.pbmm'))
+        self.assertNotEqual(key, transcript_cache.cache_key(b'\x01\x02', 'other.pbmm'))
+        self.assertNotEqual(key, transcript_cache.cache_key(b'\x01\x02', 'model.pbmm',
+                                                            backend_id=('DeepSpeechBackend', 100)))
+        self.assertRaises(ValueError, transcript_cache.cache_key, b'\x01\x02', None)
+
+
+class TestMemoryStore(unittest.TestCase):
+
+    def test_lru(self):
+        store = transcript_cache.MemoryStore(max_entries=2)
+        store.put('a', 'one')
+        store.put('b', 'two')
+        self.assertEqual(store.get('a'), 'one')
+        store.put('c', 'three')
+
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('a'), 'one')
+
+    def test_ttl(self):
+        store = transcript_cache.MemoryStore(ttl=10)
+        with mock.patch('time.time', return_value=100.0):
+            store.put('a', 'one')
+        with mock.patch('time.time', return_value=105.0):
+            self.assertEqual(store.get('a'), 'one')
+        with mock.patch('time.time', return_value=111.0):
+            self.assertIsNone(store.get('a'))
+        self.assertEqual(len(store), 0)
+
+
+class TestSqliteStore(unittest.TestCase):
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.db')
+            store = transcript_cache.SqliteStore(path)
+            store.put('a', 'one')
+            store.close()
+
+            store = transcript_cache.SqliteStore(path, ttl=60)
+            self.assertEqual(store.get('a'), 'one')
+            self.assertIsNone(store.get('b'))
+            with mock.patch('time.time', return_value=time.time() + 120):
+                self.assertIsNone(store.get('a'))
+            self.assertEqual(len(store), 0)
+            store.close()
+
+
+class TestCachedSpeech2Text(unittest.TestCase):
+
+    def test_detect_buffer_hits(self):
+        cache = transcript_cache.TranscriptCache()
+        model = speech2text.FakeModel(["open the door", "please close the door"])
+        stt = speech2text.speech2text(model, cache=cache, model_id='fake')
+        audio = bytes(3200)
+
+        with mock.patch.object(model, 'stt', wraps=model.stt) as stt_call:
+            self.assertEqual(stt.detect_buffer(audio), "open the door")
+            self.assertEqual(stt.detect_buffer(audio), "open the door")
+            self.assertEqual(stt.detect_buffer(bytes(1600)), "please close the door")
+            self.assertEqual(stt_call.call_count, 2)
+
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 2, 'entries': 2})
+        self.assertGreaterEqual(transcript_cache.CACHE_HITS.value, 1)
+
+    def test_model_path_in_key(self):
+        cache = transcript_cache.TranscriptCache()
+        first = speech2text.speech2text(speech2text.FakeModel(["open the door"]), cache=cache)
+        second = speech2text.speech2text(speech2text.FakeModel(["close the door"]), cache=cache)
+        first.model_path = 'first.pbmm'
+        second.model_path = 'second.pbmm'
+
+        self.assertEqual(first.detect_buffer(bytes(320)), "open the door")
+        self.assertEqual(second.detect_buffer(bytes(320)), "close the door")
+
+    def test_no_model_id_not_cached(self):
+        cache = transcript_cache.TranscriptCache()
+        stt = speech2text.speech2text(speech2text.FakeModel(["open the door", "close the door"]),
+                                      cache=cache)
+
+        self.assertEqual(stt.detect_buffer(bytes(320)), "open the door")
+        self.assertEqual(stt.detect_buffer(bytes(320)), "close the door")
+        self.assertEqual(cache.stats['entries'], 0)
+
+    def test_backend_in_key(self):
+        """
+        backends and decoder settings loading the same model files do not
+        share transcripts.
+        """
+        cache = transcript_cache.TranscriptCache()
+        keys = set()
+        for backend in [backends.FakeBackend(["open the door"]), backends.DeepSpeechBackend(),
+                        backends.DeepSpeechBackend(beam_width=1024)]:
+            stt = speech2text.speech2text(backend, cache=cache)
+            stt.model_path = 'model.pbmm'
+            keys.add(stt._cache_key(bytes(320)))
+        self.assertEqual(len(keys), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import wave
+import random
+import unittest
+
+import numpy as np
+import webrtcvad
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import frame_sources
+import vad_batch
+
+
+class TestVadBatch(unittest.TestCase):
+
+    def setUp(self):
+        pcm = b''
+        for name in ["open_the_door.wav", "please_close_the_door.wav"] * 2:
+            with wave.open(os.path.abspath(os.path.join("./data", name))) as fin:
+                pcm += fin.readframes(fin.getnframes())
+        self.pcm = pcm
+        self.samples = np.frombuffer(pcm, np.int16)
+
+    def streaming_segments(self, mask, vad_num_frames, max_segment_frames=None):
+        # one byte frames, the onset audio length is the number of onset frames
+        segmenter = AudioStream.VadSegmenter(vad_num_frames,
+                                             max_segment_frames=max_segment_frames)
+        bounds = []
+        start = None
+        for index, is_speech in enumerate(mask):
+            event = segmenter.process(b'x', is_speech)
+            if event == AudioStream.SPEECH_ONSET:
+                start = index - len(b''.join(segmenter.onset_frames)) + 1
+            elif event == AudioStream.SEGMENT_FULL:
+                bounds.append((start, index + 1))
+                start = index + 1
+            elif event == AudioStream.SPEECH_OFFSET:
+                bounds.append((start, index + 1))
+                start = None
+        if start is not None and start < len(mask):
+            bounds.append((start, len(mask)))
+        return bounds
+
+    def test_find_segments(self):
+        mask = [0,0,1,1,1,1,1,1,0,0,0,1,1,1,0,0,0,0,0,0]
+        segments = vad_batch.find_segments(mask, 2)
+        self.assertEqual(segments.tolist(), [[2, 10], [11, 16]])
+
+    def test_find_segments_matches_segmenter(self):
+        random.seed(5)
+        for _ in range(200):
+            vad_num_frames = random.randint(1, 12)
+            mask = [random.random() < 0.6 for _ in range(random.randint(0, 300))]
+            self.assertEqual(vad_batch.find_segments(mask, vad_num_frames).tolist(),
+                             [list(b) for b in self.streaming_segments(mask, vad_num_frames)])
+
+    def test_find_segments_max_length_matches_segmenter(self):
+        random.seed(7)
+        for _ in range(200):
+            vad_num_frames = random.randint(1, 8)
+            max_segment_frames = random.randint(1, 20)
+            mask = [random.random() < 0.8 for _ in range(random.randint(0, 300))]
+            self.assertEqual(vad_batch.find_segments(mask, vad_num_frames,
+                                                     max_segment_frames=max_segment_frames).tolist(),
+                             [list(b) for b in self.streaming_segments(mask, vad_num_frames,
+                                                                       max_segment_frames)])
+
+    def test_find_segments_invalid_buffer(self):
+        self.assertRaises(ValueError, vad_batch.find_segments, [1, 0], 0)
+
+    def test_speech_mask_matches_vad(self):
+        mask = vad_batch.speech_mask(self.samples)
+        vad = webrtcvad.Vad(audio_defaults.DETECTION_MODE)
+        frame_bytes = audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH
+        expected = [vad.is_speech(self.pcm[pos:pos + frame_bytes], audio_defaults.RATE)
+                    for pos in range(0, len(mask) * frame_bytes, frame_bytes)]
+        self.assertEqual(mask.tolist(), expected)
+
+    def test_voice_segments_match_collector(self):
+        for vad_buffer_ms in [60, 200, 300]:
+            with frame_sources.BytesSource(self.pcm) as source:
+                vf = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+                expected = [bytes(s) for s in vf.voice_segment_collector(vad_buffer_ms)]
+
+            segments = vad_batch.voice_segments(self.samples, vad_buffer_ms)
+            self.assertEqual([bytes(s) for s in segments], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import os
+import io
+import json
+import wave
+import logging
+import unittest
+import unittest.mock as mock
+
+sys.path.append(os.path.abspath(".."))
+
+import AudioStream
+import audio_defaults
+import frame_sources
+import vad_trace
+
+
+class TestVadTrace(unittest.TestCase):
+
+    def test_runs(self):
+        trace = vad_trace.VadTrace()
+        for is_speech in [0, 0, 1, 1, 1, 0]:
+            trace.record(is_speech)
+        trace.mark_onset()
+        record = trace.cut('offset')
+
+        self.assertEqual(record['runs'], [[0, 2], [1, 3], [0, 1]])
+        self.assertEqual(record['start_frame'], 0)
+        self.assertEqual(record['onset_frame'], 5)
+        self.assertEqual(record['end_frame'], 6)
+        self.assertEqual(record['reason'], 'offset')
+        self.assertEqual(vad_trace.expand_runs(record['runs']), '001110')
+        self.assertEqual(vad_trace.run_string(record['runs']), '0x2 1x3 0x1')
+
+        trace.record(True)
+        record = trace.cut('flush')
+        self.assertEqual(record['start_frame'], 6)
+        self.assertIsNone(record['onset_frame'])
+        self.assertEqual(record['runs'], [[1, 1]])
+
+    def test_cut_formats_runs_for_debug_only(self):
+        trace = vad_trace.VadTrace()
+        with mock.patch.object(vad_trace, 'run_string', wraps=vad_trace.run_string) as run_string:
+            trace.record(True)
+            trace.cut('offset')
+            self.assertEqual(run_string.call_count, 0)
+
+            with self.assertLogs(level=logging.DEBUG) as logs:
+                trace.record(True)
+                trace.cut('offset')
+            self.assertEqual(run_string.call_count, 1)
+        self.assertIn('vad trace offset at frame 2: 1x1', logs.output[0])
+
+    def test_bounded(self):
+        trace = vad_trace.VadTrace(max_runs=2, max_segments=3)
+        for i in range(10):
+            trace.record(i % 2)
+        record = trace.cut('full')
+        self.assertEqual(record['runs'], [[0, 1], [1, 1]])
+        self.assertEqual(record['dropped_frames'], 8)
+
+        for _ in range(5):
+            trace.record(False)
+            trace.cut('offset')
+        self.assertEqual(len(trace.segments), 3)
+
+    def test_dump(self):
+        trace = vad_trace.VadTrace(frame_ms=10)
+        trace.record(False)
+        trace.cut('flush')
+        stream = io.StringIO()
+        trace.dump(stream)
+        self.assertEqual(json.loads(stream.getvalue())['frame_ms'], 10)
+
+
+class TestVadFilterTrace(unittest.TestCase):
+
+    def setUp(self):
+        with wave.open(os.path.abspath("./data/please_close_the_door.wav")) as fin:
+            self.pcm = fin.readframes(fin.getnframes())
+
+    def segments(self, trace):
+        with frame_sources.BytesSource(self.pcm) as source:
+            vad_filter = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE, trace=trace)
+            return [bytes(s) for s in vad_filter.voice_segment_collector(200)]
+
+    def test_trace_matches_segments(self):
+        trace = vad_trace.VadTrace()
+        segments = self.segments(trace)
+        self.assertEqual(segments, self.segments(None))
+
+        # without max_segment_ms every segment starts with an onset
+        records = list(trace.segments)
+        onsets = [r for r in records if r['onset_frame'] is not None]
+        self.assertEqual(len(onsets), len(segments))
+        num_frames = len(self.pcm) // (audio_defaults.CHUNK * audio_defaults.SAMPLE_WIDTH)
+        self.assertEqual(records[-1]['end_frame'], num_frames)
+        self.assertEqual(sum(r['end_frame'] - r['start_frame'] for r in records), num_frames)
+
+    def test_set_trace_at_runtime(self):
+        trace = vad_trace.VadTrace()
+        with frame_sources.BytesSource(self.pcm) as source:
+            vad_filter = AudioStream.VadFilter(source, audio_defaults.DETECTION_MODE)
+            segments = vad_filter.voice_segment_collector(200)
+            next(segments)
+            self.assertEqual(len(trace.segments), 0)
+            vad_filter.set_trace(trace)
+            list(segments)
+        self.assertEqual(trace.segments[-1]['end_frame'] > 0, True)
+        self.assertIs(vad_filter.segmenter.trace, trace)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Transcript cache keyed by audio content.
+
+    The same clips (IVR prompts, test corpora) are often transcribed over and
+    over. A TranscriptCache given to speech2text returns the stored transcript
+    of audio it has seen before instead of running inference again.
+    The key is a BLAKE2 hash of the PCM bytes, the model files, the backend
+    and its decoder parameters, so changing any of them misses the cache.
+    Transcripts live in a pluggable store: MemoryStore (LRU with size and
+    TTL eviction) or SqliteStore (on disk, shared between processes).
+"""
+import collections
+import hashlib
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# max number of transcripts kept by MemoryStore
+CACHE_MAX_ENTRIES = 1024
+
+CACHE_HITS = metrics.REGISTRY.counter('transcript_cache_hits_total', 'Transcripts found in the cache')
+CACHE_MISSES = metrics.REGISTRY.counter('transcript_cache_misses_total', 'Transcripts not in the cache')
+
+
+def cache_key(audio_buffer, model_path, lm_path=None, trie_path=None, backend_id=None):
+    """
+    hex digest of the PCM bytes, the model files and backend_id, the
+    Backend.cache_id of the backend and its decoder parameters.
+    model_path may also be any other id of the model, but not None: without
+    it transcripts of different models would share keys.
+    """
+    if model_path is None:
+        raise(ValueError("a transcript cache key needs the model path or id"))
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(audio_buffer)
+    digest.update(repr((model_path, lm_path, trie_path, backend_id)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MemoryStore(object):
+    """
+    in-memory LRU of at most max_entries transcripts. With ttl, entries
+    older than ttl seconds are treated as missing.
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=None):
+        if max_entries < 1:
+            raise(ValueError("invalid max_entries:{}, should be > 0".format(max_entries)))
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            text, created = entry
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = (text, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteStore(object):
+    """
+    transcripts in an SQLite database file, kept across runs and shared by
+    processes using the same path. With ttl, entries older than ttl seconds
+    are treated as missing and removed.
+    """
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS transcripts '
+                             '(key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL)')
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT text, created FROM transcripts WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+
+            text, created = row
+            if self.ttl is not None and time.time() - created > self.ttl:
+                with self._db:
+                    self._db.execute('DELETE FROM transcripts WHERE key = ?', (key,))
+                return None
+            return text
+
+    def put(self, key, text):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?)',
+                             (key, text, time.time()))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM transcripts')
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM transcripts').fetchone()[0]
+
+
+class TranscriptCache(object):
+    """
+    memoizes transcripts in store, a MemoryStore by default.
+    num_hits and num_misses count the lookups of this cache, the
+    transcript_cache_* counters of metrics.REGISTRY those of all caches.
+    """
+    def __init__(self, store=None):
+        self.store = store if store is not None else MemoryStore()
+        self.num_hits = 0
+        self.num_misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        text = self.store.get(key)
+        with self._lock:
+            if text is None:
+                self.num_misses += 1
+                CACHE_MISSES.inc()
+            else:
+                self.num_hits += 1
+                CACHE_HITS.inc()
+        return text
+
+    def put(self, key, text):
+        if text is not None:
+            self.store.put(key, text)
+
+    @property
+    def stats(self):
+        return {'hits': self.num_hits,
+                'misses': self.num_misses,
+                'entries': len(self.store)}
+
+
+def open_cache(path=None, ttl=None):
+    """
+    TranscriptCache over an SqliteStore at path, or a MemoryStore without.
+    """
+    if path:
+        return TranscriptCache(SqliteStore(path, ttl))
+    return TranscriptCache(MemoryStore(ttl=ttl))
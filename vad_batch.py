@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Block level VAD segmentation of whole int16 NumPy buffers.
+
+    For offline audio the per frame vad decisions are collected into one
+    mask array first, then the speech onsets and offsets are found with
+    cumulative sums over the mask instead of pushing every decision through
+    a VadBuffer. The segments are exactly the ones VadSegmenter produces.
+"""
+import numpy as np
+import webrtcvad
+
+from audio_defaults import *
+from frame_sources import vad_buffer_frames
+from metrics import VAD_CALLS
+
+
+def speech_mask(samples, vad=None, rate=RATE, chunk=CHUNK, mode=DETECTION_MODE):
+    """
+    returns the vad decision of every chunk sized frame of the int16
+    samples as a bool array. A trailing partial frame is ignored.
+    vad may be an energy_gate.EnergyGate, its gate is then computed for all
+    frames at once.
+    """
+    if vad is None:
+        vad = webrtcvad.Vad(mode)
+
+    samples = np.ascontiguousarray(samples, dtype=np.int16)
+    num_frames = len(samples) // chunk
+    if hasattr(vad, 'speech_mask'):
+        VAD_CALLS.inc(num_frames)
+        return vad.speech_mask(samples, rate, chunk)
+
+    frame_bytes = chunk * SAMPLE_WIDTH
+    data = memoryview(samples[:num_frames * chunk]).cast('B')
+
+    is_speech = vad.is_speech
+    mask = np.fromiter((is_speech(data[pos:pos + frame_bytes], rate)
+                        for pos in range(0, num_frames * frame_bytes, frame_bytes)),
+                       dtype=bool, count=num_frames)
+    VAD_CALLS.inc(num_frames)
+    return mask
+
+
+class _RatioSearch(object):
+    """
+    finds the first frame at or after a start index where more than
+    vad_buffer_ratio of a buffer of num_frames, filled since start, counts.
+    counts is the int mask of the frames to count.
+    """
+    def __init__(self, counts, num_frames, vad_buffer_ratio):
+        self.num_frames = num_frames
+        self.vad_buffer_ratio = vad_buffer_ratio
+        self.cumsum = np.concatenate(([0], np.cumsum(counts)))
+
+        # indexes of the frames where the full buffer ending at them triggers
+        window = self.cumsum[num_frames:] - self.cumsum[:-num_frames]
+        self.full_hits = np.flatnonzero(window / num_frames > vad_buffer_ratio) + num_frames - 1
+
+    def find(self, start):
+        # the buffer is only partially filled for the first num_frames-1 frames
+        end = min(start + self.num_frames - 1, len(self.cumsum) - 1)
+        partial = self.cumsum[start + 1:end + 1] - self.cumsum[start]
+        hits = np.flatnonzero(partial / self.num_frames > self.vad_buffer_ratio)
+        if len(hits):
+            return start + hits[0]
+
+        k = np.searchsorted(self.full_hits, start + self.num_frames - 1)
+        if k < len(self.full_hits):
+            return self.full_hits[k]
+        return None
+
+
+def find_segments(mask, vad_num_frames, vad_buffer_ratio=VAD_BUFFER_RATIO,
+                  max_segment_frames=None):
+    """
+    returns the speech segments of a per frame speech mask as a (num, 2)
+    array of [start_frame, end_frame) rows.
+    The onset/offset semantics are the ones of VadSegmenter: a segment
+    starts with the buffered frames once more than vad_buffer_ratio of the
+    vad_num_frames buffer is speech and ends once more than vad_buffer_ratio
+    is non speech. The buffer is cleared at every onset and offset, and a
+    segment still open at the end of the mask is closed there. Segments
+    reaching max_segment_frames are cut like VadSegmenter cuts them.
+    """
+    if vad_num_frames < 1:
+        raise(ValueError("invalid vad_num_frames:{}, should be >= 1".format(vad_num_frames)))
+
+    mask = np.asarray(mask, dtype=bool)
+    num_frames = len(mask)
+    voice = _RatioSearch(mask.astype(np.int32), vad_num_frames, vad_buffer_ratio)
+    non_voice = _RatioSearch((~mask).astype(np.int32), vad_num_frames, vad_buffer_ratio)
+
+    segments = []
+    pos = 0
+    while pos < num_frames:
+        onset = voice.find(pos)
+        if onset is None:
+            break
+        start = max(pos, onset - vad_num_frames + 1)
+
+        offset = non_voice.find(onset + 1)
+        end = num_frames if offset is None else offset + 1
+
+        if max_segment_frames:
+            # cuts happen on speech frames after the onset, an offset wins
+            cut = max(start + max_segment_frames - 1, onset + 1)
+            while cut < end - 1:
+                segments.append((start, cut + 1))
+                start = cut + 1
+                cut = start + max_segment_frames - 1
+
+        segments.append((start, end))
+        pos = end
+
+    return np.array(segments, dtype=np.int64).reshape(-1, 2)
+
+
+def voice_segments(samples, vad_buffer_ms, vad=None, rate=RATE, chunk=CHUNK,
+                   mode=DETECTION_MODE, max_segment_ms=None):
+    """
+    segments int16 samples in one pass, the offline counterpart of
+    VadFilter.voice_segment_collector. Returns the list of segments as
+    memoryviews into samples, no audio is copied.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.int16)
+    mask = speech_mask(samples, vad, rate, chunk, mode)
+
+    max_segment_frames = None
+    if max_segment_ms:
+        max_segment_frames = vad_buffer_frames(max_segment_ms, rate, chunk)
+    bounds = find_segments(mask, vad_buffer_frames(vad_buffer_ms, rate, chunk),
+                           VAD_BUFFER_RATIO, max_segment_frames)
+
+    data = memoryview(samples).cast('B')
+    frame_bytes = chunk * SAMPLE_WIDTH
+    return [data[start * frame_bytes:end * frame_bytes] for start, end in bounds]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Bounded trace of the VAD decisions that led to every segment cut.
+
+    A VadTrace is handed to a VadSegmenter (or switched on at runtime with
+    VadFilter.set_trace). It keeps the decisions of the current segment as
+    runs of equal decisions and the records of the last finished segments,
+    both in fixed size deques, so tracing a long stream uses bounded memory.
+    Without a trace the segmenter does a single None check per frame.
+"""
+import collections
+import json
+import logging
+
+# most recent runs of equal vad decisions kept for the current segment
+TRACE_MAX_RUNS = 256
+
+# most recent finished segment records kept
+TRACE_MAX_SEGMENTS = 1000
+
+
+class VadTrace(object):
+    """
+    Run length encoded vad decisions per segment.
+    The segmenter calls record() for every frame, mark_onset() when speech
+    starts and cut() when the segment ends. cut() turns the frames seen since
+    the previous cut into a record:
+        start_frame   - index of the first frame of the record
+        onset_frame   - index of the frame that triggered the speech onset
+        end_frame     - index of the frame after the cut
+        reason        - 'offset', 'full' or 'flush'
+        runs          - [is_speech, num_frames] pairs, oldest first
+        dropped_frames- frames of the oldest runs that did not fit max_runs
+    Frame indexes count all frames passed to record().
+    """
+    def __init__(self, max_runs=TRACE_MAX_RUNS, max_segments=TRACE_MAX_SEGMENTS, frame_ms=None):
+        self.frame_ms = frame_ms
+        self.segments = collections.deque(maxlen=max_segments)
+        self._runs = collections.deque(maxlen=max_runs)
+        self._last = None
+        self._count = 0
+        self._num_frames = 0
+        self._start_frame = 0
+        self._onset_frame = None
+        self._dropped_frames = 0
+
+    def _close_run(self):
+        if self._count:
+            if len(self._runs) == self._runs.maxlen:
+                self._dropped_frames += self._runs[0][1]
+            self._runs.append([self._last, self._count])
+
+    def record(self, is_speech):
+        is_speech = 1 if is_speech else 0
+        if is_speech == self._last:
+            self._count += 1
+        else:
+            self._close_run()
+            self._last = is_speech
+            self._count = 1
+        self._num_frames += 1
+
+    def mark_onset(self):
+        self._onset_frame = self._num_frames - 1
+
+    def cut(self, reason):
+        """
+        finishes the record of the current segment and returns it.
+        """
+        self._close_run()
+        record = {'start_frame': self._start_frame,
+                  'onset_frame': self._onset_frame,
+                  'end_frame': self._num_frames,
+                  'reason': reason,
+                  'runs': list(self._runs),
+                  'dropped_frames': self._dropped_frames}
+        if self.frame_ms is not None:
+            record['frame_ms'] = self.frame_ms
+        self.segments.append(record)
+        # formatting the runs costs a join per cut, skip it unless DEBUG is on
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("vad trace {} at frame {}: {}".format(reason, self._num_frames,
+                                                                run_string(record['runs'])))
+
+        self._runs.clear()
+        self._last = None
+        self._count = 0
+        self._start_frame = self._num_frames
+        self._onset_frame = None
+        self._dropped_frames = 0
+        return record
+
+    def dump(self, stream):
+        """
+        writes the finished segment records to stream, one JSON line each.
+        """
+        for record in self.segments:
+            stream.write(json.dumps(record) + '\n')
+
+
+def run_string(runs):
+    """
+    compact text of runs, e.g. '0x12 1x40 0x9'.
+    """
+    return ' '.join('{}x{}'.format(is_speech, count) for is_speech, count in runs)
+
+
+def expand_runs(runs):
+    """
+    the frame decisions of runs as a '0'/'1' string, the old DEBUG pattern.
+    """
+    return ''.join(str(is_speech) * count for is_speech, count in runs)